@@ -7,36 +7,91 @@ Font2LEDツールで生成したJSONファイルをBlenderにインポートす
 2. Blenderのスクリプトエディタでこのファイルを開く
 3. json_pathを適切に設定
 4. スクリプトを実行
+
+このファイルと同じフォルダに grid_calibration.py がある場合は、ドローンの配置を実際の座標から推定する
+（回転・間隔の異なるグリッドにも対応）。ない場合はこのファイルだけで動作し、
+従来どおり座標の最小値と間隔からグリッドを求める（軸に沿った等間隔のグリッドのみ）。
+
+色と強度は全フレーム分をNumPyでまとめてから、ドローンごとにFカーブへ一括で書き込む
+（値が変わるフレームだけ定数補間のキーフレームを作成し、frame_set は使わない）。
 """
 
 import bpy
 import json
 import os
+import sys
 from pathlib import Path
 
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+try:
+    from grid_calibration import calibrate_grid, describe
+except ImportError:
+    calibrate_grid = describe = None
+
+# キーフレームの補間 'CONSTANT'（foreach_set で使う列挙値）
+CONSTANT_INTERPOLATION = 0
+
 class LEDAnimationImporter:
     """Font2LED JSONをBlenderにインポート"""
     
-    def __init__(self, drones_collection_name: str = "Drones"):
+    def __init__(self, drones_collection_name: str = "Drones", cols: int = None, rows: int = None):
         self.drones_collection = bpy.data.collections.get(drones_collection_name)
         self.drone_grid = {}
         self.grid_params = None
+        self.calibration = None
+        self.cols = cols
+        self.rows = rows
         
         if self.drones_collection:
             self._analyze_grid()
         else:
             print(f"Warning: Collection '{drones_collection_name}' not found")
     
+    def _drones(self) -> list:
+        """コレクション内のドローン（drone_index 順）"""
+        return [obj for obj in self.drones_collection.objects 
+                if obj.type == 'MESH' and 'Drone' in obj.name]
+    
     def _analyze_grid(self):
         """ドローングリッドの配置を解析"""
-        drones = [obj for obj in self.drones_collection.objects 
-                  if obj.type == 'MESH' and 'Drone' in obj.name]
+        drones = self._drones()
         
         if not drones:
             print("No drones found in collection")
             return
         
-        # 座標の範囲を取得
+        if calibrate_grid is None:
+            self._analyze_grid_by_spacing(drones)
+            return
+        
+        # 全ドローンの座標からグリッドの変換とドローン → (列, 行) をまとめて推定（行0が上）
+        positions = [tuple(obj.location) for obj in drones]
+        self.calibration = calibrate_grid(positions, self.cols, self.rows)
+        transform = self.calibration.transform
+        x_spacing, z_spacing = transform.spacing
+        
+        self.grid_params = {
+            'x_spacing': x_spacing,
+            'z_spacing': z_spacing,
+            'cols': transform.cols,
+            'rows': transform.rows,
+            'transform': transform.to_dict(),
+            'residual': self.calibration.residual
+        }
+        
+        # グリッドマッピングを構築（グリッドから外れたドローンは除く）
+        for drone, cell in zip(drones, self.calibration.cells.tolist()):
+            if cell >= 0:
+                self.drone_grid[(cell % transform.cols, cell // transform.cols)] = drone
+        
+        print(f"Grid analysis complete:")
+        print(f"  {describe(self.calibration)}")
+        print(f"  Mapped drones: {len(self.drone_grid)}")
+    
+    def _analyze_grid_by_spacing(self, drones: list):
+        """grid_calibration.py がない場合の解析（座標の範囲と先頭2つの座標の間隔から推定）"""
         x_coords = [obj.location.x for obj in drones]
         z_coords = [obj.location.z for obj in drones]
         
@@ -49,6 +104,7 @@ class LEDAnimationImporter:
         
         x_spacing = x_unique[1] - x_unique[0] if len(x_unique) > 1 else 1.471
         z_spacing = z_unique[1] - z_unique[0] if len(z_unique) > 1 else 1.5
+        rows = self.rows or len(z_unique)
         
         self.grid_params = {
             'x_min': x_min,
@@ -57,21 +113,28 @@ class LEDAnimationImporter:
             'z_max': z_max,
             'x_spacing': x_spacing,
             'z_spacing': z_spacing,
-            'cols': len(x_unique),
-            'rows': len(z_unique)
+            'cols': self.cols or len(x_unique),
+            'rows': rows
         }
         
-        # グリッドマッピングを構築
+        # グリッドマッピングを構築（JSONと同じく行0が上になるようにYを反転）
         for drone in drones:
             grid_x = round((drone.location.x - x_min) / x_spacing)
             grid_y = round((drone.location.z - z_min) / z_spacing)
-            self.drone_grid[(grid_x, grid_y)] = drone
+            self.drone_grid[(grid_x, rows - 1 - grid_y)] = drone
         
-        print(f"Grid analysis complete:")
+        print(f"Grid analysis complete (grid_calibration.py not found, spacing-based):")
         print(f"  Size: {self.grid_params['cols']}x{self.grid_params['rows']}")
         print(f"  Spacing: {x_spacing:.3f} x {z_spacing:.3f}")
         print(f"  Mapped drones: {len(self.drone_grid)}")
     
+    def save_drone_positions(self, path: str):
+        """ドローンの位置を drone_index 順にJSONで保存（Font2LED GUIの「ドローン配置読込」用）"""
+        drones = self._drones()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"positions": [list(obj.location) for obj in drones]}, f)
+        print(f"Saved {len(drones)} drone positions: {path}")
+    
     def import_animation(self, json_path: str):
         """JSONファイルからアニメーションをインポート"""
         if not os.path.exists(json_path):
@@ -90,9 +153,8 @@ class LEDAnimationImporter:
         print(f"  Frames: {len(frames)}")
         print(f"  Font: {metadata.get('font')}")
         
-        # 各フレームを処理
-        for frame_data in frames:
-            self._apply_frame(frame_data)
+        # 全フレーム・全ドローンの色と強度の変化をまとめてキーフレームに書き込む
+        self._apply_frames(frames)
         
         # タイムラインマーカーを作成
         self._create_markers(frames)
@@ -100,67 +162,129 @@ class LEDAnimationImporter:
         print("Import completed!")
         return True
     
-    def _apply_frame(self, frame_data: dict):
-        """単一フレームのデータを適用"""
-        frame_num = frame_data['frame']
-        text = frame_data.get('text', '')
-        pixels = frame_data.get('pixels', [])
+    def _build_timeline(self, frames: list):
+        """全フレームのドローンの色と強度を配列にまとめる
         
-        # フレームを設定
-        bpy.context.scene.frame_set(frame_num)
+        Returns:
+            (フレーム番号 (K,), 色 (K, D, 4), 強度 (K, D))。D は drone_grid のドローン数、
+            点灯しないドローンは黒・強度0。同じフレーム番号が複数ある場合は後のフレームを使う。
+        """
+        slots = {cell: slot for slot, cell in enumerate(self.drone_grid)}
+        frame_numbers = sorted({int(frame_data['frame']) for frame_data in frames})
+        frame_slots = {frame_num: k for k, frame_num in enumerate(frame_numbers)}
         
-        # まず全ドローンを消灯
-        self._clear_all_drones(frame_num)
+        colors = np.zeros((len(frame_numbers), len(slots), 4), dtype=np.float32)
+        colors[..., 3] = 1.0
+        strengths = np.zeros((len(frame_numbers), len(slots)), dtype=np.float32)
         
-        # ピクセルデータを適用
-        applied = 0
-        for pixel in pixels:
-            x, y = pixel['x'], pixel['y']
+        for frame_data in frames:
+            k = frame_slots[int(frame_data['frame'])]
+            pixels = frame_data.get('pixels', [])
+            colors[k, :, :3] = 0.0
+            strengths[k] = 0.0
             
-            # Y座標を反転（JSONは上が0、Blenderは下が0）
-            grid_y = 9 - y  # 10行のグリッドなので9から引く
+            # drone_grid はJSONと同じく行0が上（同じセルのピクセルは後のものを使う）
+            hits = [(slots[(pixel['x'], pixel['y'])], pixel) for pixel in pixels
+                    if (pixel['x'], pixel['y']) in slots]
+            if hits:
+                index = np.array([slot for slot, _ in hits], dtype=np.int64)
+                colors[k, index, :3] = [(pixel['r'], pixel['g'], pixel['b']) for _, pixel in hits]
+                # 実機制限で強度は1.0まで
+                strengths[k, index] = [min(pixel.get('intensity', 1.0), 1.0) for _, pixel in hits]
             
-            if (x, grid_y) in self.drone_grid:
-                drone = self.drone_grid[(x, grid_y)]
-                color = (pixel['r'], pixel['g'], pixel['b'])
-                intensity = pixel.get('intensity', 1.0)
-                
-                self._set_drone_emission(drone, color, intensity, frame_num)
-                applied += 1
-        
-        print(f"Frame {frame_num}: '{text}' - {applied}/{len(pixels)} pixels applied")
-    
-    def _clear_all_drones(self, frame: int):
-        """全ドローンを消灯状態に"""
-        for drone in self.drone_grid.values():
-            self._set_drone_emission(drone, (0, 0, 0), 0, frame)
-    
-    def _set_drone_emission(self, drone, color: tuple, intensity: float, frame: int):
-        """ドローンのEmission設定とキーフレーム"""
-        if not drone.data or not drone.data.materials:
+            print(f"Frame {frame_data['frame']}: '{frame_data.get('text', '')}' - "
+                  f"{len(hits)}/{len(pixels)} pixels applied")
+        
+        return np.array(frame_numbers, dtype=np.float32), colors, strengths
+    
+    def _apply_frames(self, frames: list):
+        """全フレームのデータを各ドローンのEmissionのFカーブに一括で書き込む（frame_set は使わない）"""
+        if not frames or not self.drone_grid:
             return
         
+        frame_numbers, colors, strengths = self._build_timeline(frames)
+        keyed_materials = set()
+        shared_materials = set()
+        keyframes = 0
+        for slot, drone in enumerate(self.drone_grid.values()):
+            emission_node = self._emission_node(drone)
+            if emission_node is None:
+                continue
+            
+            # マテリアルを共有するドローンは最初のドローンの色だけを書き込む
+            # （ノードツリーの名前はどのマテリアルでも "Shader Nodetree" のため、マテリアル自体で判定）
+            mat = drone.data.materials[0]
+            if mat.as_pointer() in keyed_materials:
+                shared_materials.add(mat.name)
+                continue
+            keyed_materials.add(mat.as_pointer())
+            
+            tree = emission_node.id_data
+            if tree.animation_data is None:
+                tree.animation_data_create()
+            if tree.animation_data.action is None:
+                tree.animation_data.action = bpy.data.actions.new(f"{mat.name}_LED")
+            action = tree.animation_data.action
+            
+            # Color (r, g, b, a) と Strength の各チャンネル
+            color_path = emission_node.inputs[0].path_from_id("default_value")
+            strength_path = emission_node.inputs[1].path_from_id("default_value")
+            for index in range(4):
+                keyframes += self._write_fcurve(action, color_path, index, frame_numbers, colors[:, slot, index])
+            keyframes += self._write_fcurve(action, strength_path, 0, frame_numbers, strengths[:, slot])
+        
+        if shared_materials:
+            print(f"Warning: materials shared by several drones: {', '.join(sorted(shared_materials))}")
+        print(f"Keyframes written: {keyframes} ({len(frame_numbers)} frames x {len(self.drone_grid)} drones)")
+    
+    @staticmethod
+    def _write_fcurve(action, data_path: str, index: int, frame_numbers, values) -> int:
+        """値が変わるフレームだけ定数補間のキーフレームとして書き込み、書き込んだ数を返す
+        
+        インポートするフレーム範囲の既存のキーフレームは置き換え、範囲外のキーフレームは残す。
+        """
+        changed = np.ones(len(values), dtype=bool)
+        changed[1:] = values[1:] != values[:-1]
+        new_co = np.stack((frame_numbers[changed], values[changed]), axis=1)
+        
+        fcurve = action.fcurves.find(data_path, index=index)
+        if fcurve is None:
+            fcurve = action.fcurves.new(data_path, index=index)
+        
+        # 範囲外の既存キーフレームを保持して作り直す
+        points = fcurve.keyframe_points
+        old_co = np.zeros(len(points) * 2, dtype=np.float32)
+        old_interpolation = np.zeros(len(points), dtype=np.int32)
+        points.foreach_get("co", old_co)
+        points.foreach_get("interpolation", old_interpolation)
+        old_co = old_co.reshape(-1, 2)
+        outside = (old_co[:, 0] < frame_numbers[0]) | (old_co[:, 0] > frame_numbers[-1])
+        
+        co = np.concatenate((old_co[outside], new_co))
+        interpolation = np.concatenate((old_interpolation[outside],
+                                        np.full(len(new_co), CONSTANT_INTERPOLATION, dtype=np.int32)))
+        order = np.argsort(co[:, 0], kind="stable")
+        
+        points.clear()
+        points.add(len(co))
+        points.foreach_set("co", co[order].ravel())
+        points.foreach_set("interpolation", interpolation[order])
+        fcurve.update()
+        return len(new_co)
+    
+    def _emission_node(self, drone):
+        """ドローンのマテリアルのEmissionノード（無ければNone）"""
+        if not drone.data or not drone.data.materials:
+            return None
+        
         mat = drone.data.materials[0]
         if not mat or not mat.use_nodes:
-            return
+            return None
         
-        # Emissionノードを探す
-        emission_node = None
         for node in mat.node_tree.nodes:
             if node.type == 'EMISSION':
-                emission_node = node
-                break
-        
-        if not emission_node:
-            return
-        
-        # 値を設定
-        emission_node.inputs[0].default_value = (*color, 1.0)
-        emission_node.inputs[1].default_value = min(intensity, 1.0)  # 実機制限
-        
-        # キーフレームを挿入
-        emission_node.inputs[0].keyframe_insert(data_path="default_value", frame=frame)
-        emission_node.inputs[1].keyframe_insert(data_path="default_value", frame=frame)
+                return node
+        return None
     
     def _create_markers(self, frames: list):
         """タイムラインマーカーを作成"""
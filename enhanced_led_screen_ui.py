@@ -301,8 +301,10 @@ class EnhancedLEDScreenSettings:
             if hasattr(self.app, 'custom_drone_spacing_var'):
                 self.app.custom_drone_spacing_var.set(spacing)
             
-            # プレビュー更新
-            if hasattr(self.app, 'update_preview'):
+            # プレビュー更新（連続した適用はアイドル時の1回の再描画にまとめる）
+            if hasattr(self.app, 'request_preview_refresh'):
+                self.app.request_preview_refresh()
+            elif hasattr(self.app, 'update_preview'):
                 self.app.update_preview()
         
         print(f"設定適用完了: {rows}×{cols}, 間隔{spacing}m")
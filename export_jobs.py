@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+エクスポートジョブ
+エクスポート処理をワーカースレッドで実行し、進捗をキュー経由でTkのメインスレッドに伝える。
+メインスレッドは root.after でキューをポーリングするため、大きなエクスポート中もGUIが固まらない。
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Optional, Sequence
+
+
+class ExportCancelled(Exception):
+    """エクスポートがキャンセルされた"""
+
+
+class ExportJob:
+    """ワーカースレッドで実行する1件のエクスポート
+
+    task(*args, job) を実行する。task は job.report() で進捗を報告し、
+    キャンセルされていれば report() / check_cancelled() が ExportCancelled を送出する。
+    """
+
+    def __init__(self, name: str, task: Callable, args: Sequence = ()):
+        self.name = name
+        self.task = task
+        self.args = tuple(args)
+        self.messages: "queue.Queue" = queue.Queue()
+        self._cancel_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=f"export-{self.name}", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            result = self.task(*self.args, self)
+        except ExportCancelled:
+            self.messages.put(("cancelled", None))
+        except Exception as e:
+            self.messages.put(("error", e))
+        else:
+            self.messages.put(("done", result))
+
+    def report(self, done: int, total: int, message: str = ""):
+        """進捗を報告（ワーカースレッドから呼ぶ）"""
+        self.check_cancelled()
+        self.messages.put(("progress", (done, total, message)))
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise ExportCancelled(self.name)
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+
+class ExportJobRunner:
+    """エクスポートジョブを1件ずつ実行し、結果をメインスレッドのコールバックに渡す
+
+    コールバックはすべて root.after から呼ばれるため、Tkウィジェットを直接操作してよい。
+    """
+
+    def __init__(self, root, poll_ms: int = 50):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.job: Optional[ExportJob] = None
+        self._callbacks = {}
+        self._poll_id = None
+
+    @property
+    def busy(self) -> bool:
+        return self.job is not None
+
+    def submit(self, name: str, task: Callable, args: Sequence = (),
+               on_done: Optional[Callable[[Any], None]] = None,
+               on_progress: Optional[Callable[[int, int, str], None]] = None,
+               on_error: Optional[Callable[[Exception], None]] = None,
+               on_cancelled: Optional[Callable[[], None]] = None) -> bool:
+        """ジョブを開始（実行中のジョブがある場合は開始せずFalse）"""
+        if self.busy:
+            return False
+        self.job = ExportJob(name, task, args)
+        self._callbacks = {"done": on_done, "progress": on_progress,
+                           "error": on_error, "cancelled": on_cancelled}
+        self.job.start()
+        self._poll_id = self.root.after(self.poll_ms, self._poll)
+        return True
+
+    def cancel(self):
+        """実行中のジョブにキャンセルを要求（結果は on_cancelled で通知）"""
+        if self.job is not None:
+            self.job.cancel()
+
+    def _poll(self):
+        """キューに溜まった進捗・結果を処理"""
+        self._poll_id = None
+        job = self.job
+        if job is None:
+            return
+        while True:
+            try:
+                kind, payload = job.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                callback = self._callbacks.get("progress")
+                if callback is not None:
+                    callback(*payload)
+                continue
+
+            # 完了・エラー・キャンセルでジョブ終了
+            self.job = None
+            callback = self._callbacks.get(kind)
+            self._callbacks = {}
+            if callback is not None:
+                if kind == "cancelled":
+                    callback()
+                else:
+                    callback(payload)
+            elif kind == "error":
+                print(f"エクスポートエラー ({job.name}): {payload}")
+            return
+        self._poll_id = self.root.after(self.poll_ms, self._poll)
@@ -12,14 +12,23 @@ from typing import List, Dict, Tuple, Optional
 import os
 import sys
 from datetime import datetime
+from glyph_raster import rasterize_char, font_identity, GlyphCache, shared_glyph_cache
+from glyph_atlas import load_atlas
+from led_layout import layout_text, LayoutCache, shared_layout_cache
+from led_frame import LEDFrame
+from led_raster import shared_raster_renderer
 
 class Font2LED:
     """JF-Dot-k12x10フォントをLEDマトリックスに変換"""
     
-    def __init__(self, font_path: str = None):
+    def __init__(self, font_path: str = None, glyph_cache: Optional[GlyphCache] = None,
+                 use_atlas: bool = True, layout_cache: Optional[LayoutCache] = None):
         """
         Args:
             font_path: フォントファイルのパス（Noneの場合はデフォルトパスを使用）
+            glyph_cache: グリフキャッシュ（Noneの場合はGUIと共有のキャッシュを使用）
+            layout_cache: レイアウトキャッシュ（Noneの場合はGUIと共有のキャッシュを使用）
+            use_atlas: グリフアトラスを使用するか（未生成・フォント変更時は自動生成）
         """
         if font_path is None:
             # デフォルトのフォントパスを試す
@@ -43,74 +52,40 @@ class Font2LED:
         self.font_path = font_path
         self.face = freetype.Face(font_path)
         # JF-Dot-k12x10は12x10ピクセル
-        self.face.set_pixel_sizes(12, 10)
-        self.char_cache = {}
+        self.pixel_size = (12, 10)
+        self.face.set_pixel_sizes(*self.pixel_size)
+        self.font_id = font_identity(font_path)
+        self.glyph_cache = glyph_cache if glyph_cache is not None else shared_glyph_cache
+        self.layout_cache = layout_cache if layout_cache is not None else shared_layout_cache
+        # アトラスに収録された文字はFreeTypeを使わずに取得
+        self.glyph_atlas = load_atlas(font_path, self.face.face_index, self.pixel_size, 10, 12) if use_atlas else None
         
         print(f"Loaded font: {os.path.basename(font_path)}")
     
-    def get_char_bitmap(self, char: str) -> np.ndarray:
-        """文字のビットマップを取得"""
-        if char in self.char_cache:
-            return self.char_cache[char]
+    def get_char_glyph(self, char: str) -> Tuple[np.ndarray, int]:
+        """文字のビットマップと空白列を除いた文字幅を取得"""
+        key = GlyphCache.make_key(self.font_id, self.face.face_index, self.pixel_size, 10, 12, char)
+        cached = self.glyph_cache.get_glyph(key)
+        if cached is not None:
+            return cached
+        
+        glyph = self.glyph_atlas.get_glyph(char) if self.glyph_atlas is not None else None
+        if glyph is not None:
+            return self.glyph_cache.put_glyph(key, *glyph)
         
         try:
-            # 文字をロード（モノクロモード）
-            self.face.load_char(char, freetype.FT_LOAD_RENDER | freetype.FT_LOAD_MONOCHROME)
-            bitmap = self.face.glyph.bitmap
-            
-            if bitmap.width > 0 and bitmap.rows > 0:
-                # モノクロビットマップを2D配列に変換
-                data = []
-                for y in range(bitmap.rows):
-                    row = []
-                    for x in range(bitmap.width):
-                        # ビット位置を計算
-                        byte_index = y * bitmap.pitch + x // 8
-                        bit_index = 7 - (x % 8)
-                        
-                        if byte_index < len(bitmap.buffer):
-                            pixel = (bitmap.buffer[byte_index] >> bit_index) & 1
-                            row.append(pixel)
-                        else:
-                            row.append(0)
-                    data.append(row)
-                
-                result = np.array(data, dtype=np.uint8)
-                
-                # 10x12の固定サイズに正規化
-                normalized = np.zeros((10, 12), dtype=np.uint8)
-                h, w = result.shape
-                # 下揃えで配置（高さが異なる場合も対応）
-                if w <= 12:
-                    if h < 10:
-                        # 高さが10未満の場合は下揃え
-                        normalized[10-h:10, :w] = result
-                    elif h == 10:
-                        # 高さがちょうど10の場合
-                        normalized[:, :w] = result
-                    else:
-                        # 高さが10を超える場合は下から10行を取る
-                        normalized[:, :w] = result[h-10:h, :w]
-                else:
-                    # 幅が12を超える場合はクロップ
-                    if h < 10:
-                        normalized[10-h:10, :12] = result[:, :12]
-                    elif h == 10:
-                        normalized[:, :12] = result[:, :12]
-                    else:
-                        normalized[:, :12] = result[h-10:h, :12]
-                
-                result = normalized
-            else:
-                # 空白文字の場合
-                result = np.zeros((10, 12), dtype=np.uint8)
+            # 文字をロードして10x12の固定サイズに正規化（下揃え）
+            result = rasterize_char(self.face, char, 10, 12)
             
         except Exception as e:
             print(f"Warning: Failed to load character '{char}': {e}")
             result = np.zeros((10, 12), dtype=np.uint8)
         
-        self.char_cache[char] = result
-        return result
+        return self.glyph_cache.put_glyph(key, result)
+    
+    def get_char_bitmap(self, char: str) -> np.ndarray:
+        """文字のビットマップを取得"""
+        return self.get_char_glyph(char)[0]
     
     def text_to_led_matrix(self, text: str, spacing: int = 1) -> Dict:
         """
@@ -120,60 +95,16 @@ class Font2LED:
             {
                 "width": 実際の幅,
                 "height": 10,
-                "pixels": [(x, y), ...] # 点灯するピクセルの座標リスト
+                "pixels": (N, 2) int16配列 [x, y] # 点灯するピクセルの座標
                 "matrix": numpy array
             }
         """
-        if not text:
-            return {"width": 0, "height": 10, "pixels": [], "matrix": np.zeros((10, 0))}
-        
-        # 各文字のビットマップを取得
-        bitmaps = []
-        total_width = 0
-        
-        for i, char in enumerate(text):
-            bitmap = self.get_char_bitmap(char)
-            # 実際の文字幅を計算（空白列を除く）
-            char_width = 0
-            for x in range(bitmap.shape[1]):
-                if np.any(bitmap[:, x] > 0):
-                    char_width = x + 1
-            
-            if char_width > 0:
-                bitmaps.append(bitmap[:, :char_width])
-                total_width += char_width
-            else:
-                # スペースの場合は固定幅
-                bitmaps.append(np.zeros((10, 4), dtype=np.uint8))
-                total_width += 4
-            
-            if i < len(text) - 1:
-                total_width += spacing
-        
-        # 全体のマトリックスを作成
-        matrix = np.zeros((10, total_width), dtype=np.uint8)
-        x_offset = 0
-        
-        for i, bitmap in enumerate(bitmaps):
-            h, w = bitmap.shape
-            matrix[:h, x_offset:x_offset+w] = bitmap
-            x_offset += w
-            if i < len(bitmaps) - 1:
-                x_offset += spacing
-        
-        # 点灯ピクセルの座標を抽出
-        pixels = []
-        for y in range(10):
-            for x in range(total_width):
-                if matrix[y, x] > 0:
-                    pixels.append((x, y))
-        
-        return {
-            "width": total_width,
-            "height": 10,
-            "pixels": pixels,
-            "matrix": matrix
-        }
+        return layout_text(text, self.get_char_glyph, 10, spacing)
+    
+    def text_to_frame(self, text: str, spacing: int = 1) -> LEDFrame:
+        """テキストを配列ベースのLEDフレームに変換（同じ条件のレイアウトはキャッシュを共有）"""
+        key = LayoutCache.make_key(text, self.font_id, self.face.face_index, self.pixel_size, 10, 12, spacing)
+        return self.layout_cache.get_or_layout(key, lambda: self.text_to_led_matrix(text, spacing))
     
     def create_led_animation_json(self, 
                                  texts: List[str], 
@@ -198,7 +129,7 @@ class Font2LED:
         frames = []
         
         for i, (text, color) in enumerate(zip(texts, colors)):
-            led_data = self.text_to_led_matrix(text)
+            led_data = self.text_to_frame(text)
             
             # フレームデータを構築
             frame = {
@@ -213,18 +144,19 @@ class Font2LED:
             else:
                 x_offset = 0
             
-            for x, y in led_data["pixels"]:
-                # グリッド範囲内のピクセルのみ追加
-                led_x = x + x_offset
-                if 0 <= led_x < 65 and 0 <= y < 10:
-                    frame["pixels"].append({
-                        "x": led_x,
-                        "y": y,
-                        "r": color[0],
-                        "g": color[1],
-                        "b": color[2],
-                        "intensity": 1.0
-                    })
+            # グリッド範囲内のピクセルのみ追加
+            led_xs = led_data["pixels"][:, 0].astype(np.int64) + x_offset
+            led_ys = led_data["pixels"][:, 1].astype(np.int64)
+            inside = (led_xs >= 0) & (led_xs < 65) & (led_ys >= 0) & (led_ys < 10)
+            for led_x, y in zip(led_xs[inside].tolist(), led_ys[inside].tolist()):
+                frame["pixels"].append({
+                    "x": led_x,
+                    "y": y,
+                    "r": color[0],
+                    "g": color[1],
+                    "b": color[2],
+                    "intensity": 1.0
+                })
             
             frames.append(frame)
         
@@ -247,38 +179,17 @@ class Font2LED:
                     color: Tuple[int, int, int] = (255, 255, 255),
                     show_grid: bool = True) -> Image.Image:
         """テキストのプレビュー画像を生成"""
-        led_data = self.text_to_led_matrix(text)
+        led_data = self.text_to_frame(text)
         
         # 画像サイズ（65x10のLEDグリッド）
         img_width = 65 * scale
         img_height = 10 * scale
         
-        # 黒背景の画像を作成
-        image = Image.new('RGB', (img_width, img_height), 'black')
-        draw = ImageDraw.Draw(image)
-        
-        # グリッド線を描画
-        if show_grid:
-            grid_color = (40, 40, 40)
-            for x in range(0, img_width + 1, scale):
-                draw.line([(x, 0), (x, img_height)], fill=grid_color)
-            for y in range(0, img_height + 1, scale):
-                draw.line([(0, y), (img_width, y)], fill=grid_color)
-        
-        # テキストをセンタリング
+        # テキストをセンタリングし、GUIプレビューと同じラスター描画で作成
         x_offset = (65 - led_data["width"]) // 2
-        
-        # LEDピクセルを描画
-        for x, y in led_data["pixels"]:
-            led_x = x + x_offset
-            if 0 <= led_x < 65:
-                x1 = led_x * scale + 2
-                y1 = y * scale + 2
-                x2 = x1 + scale - 4
-                y2 = y1 + scale - 4
-                
-                # 円形のLED
-                draw.ellipse([x1, y1, x2, y2], fill=color)
+        rgb = tuple(c / 255.0 for c in color)
+        image = Image.fromarray(shared_raster_renderer.render_frame(
+            led_data, 10, 65, scale, rgb, x_offset, 0, show_grid=show_grid))
         
         # 情報テキストを追加
         info_y = img_height + 5
@@ -297,27 +208,28 @@ class Font2LED:
                          colors: List[Tuple[int, int, int]] = None,
                          output_path: str = "preview_grid.png",
                          scale: int = 10):
-        """複数のテキストをグリッド形式でプレビュー"""
+        """複数のテキストをグリッド形式でプレビュー
+        
+        各テキストのプレビューを1枚ずつ描画してシートに貼り付けるため、
+        テキスト数が多くても保持するのはシートと描画中の1枚だけ。
+        """
         if colors is None:
             colors = [(255, 255, 255)] * len(texts)
         
-        # 各テキストのプレビューを生成
-        previews = []
-        for text, color in zip(texts, colors):
-            preview = self.preview_text(text, scale=scale, color=color, show_grid=True)
-            previews.append(preview)
-        
-        if not previews:
+        count = min(len(texts), len(colors))
+        if count == 0:
             return
         
-        # グリッドレイアウトで結合
-        preview_height = previews[0].height
-        total_height = preview_height * len(previews)
-        
-        grid_image = Image.new('RGB', (previews[0].width, total_height), 'black')
+        # プレビューの大きさは preview_text と同じ（65x10のLEDグリッド + 情報欄）
+        preview_width = 65 * scale
+        preview_height = 10 * scale + 30
+        grid_image = Image.new('RGB', (preview_width, preview_height * count), 'black')
         
-        for i, preview in enumerate(previews):
-            grid_image.paste(preview, (0, i * preview_height))
+        # グリッドレイアウトで結合（描画したタイルから順に貼り付け）
+        for i, (text, color) in enumerate(zip(texts, colors)):
+            tile = self.preview_text(text, scale=scale, color=color, show_grid=True)
+            grid_image.paste(tile, (0, i * preview_height))
+            tile.close()
         
         grid_image.save(output_path)
         print(f"Saved preview grid: {output_path}")
@@ -7,15 +7,27 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, colorchooser
 import freetype
 import numpy as np
-from PIL import Image, ImageDraw, ImageTk
-import json
+from PIL import ImageTk
 import os
 import sys
 import shutil
 import tempfile
-from datetime import datetime
-from typing import List, Dict, Tuple
+import threading
+from typing import List, Dict, Tuple, Optional
 from pixelmap_parser import PixelMapParser
+from glyph_raster import rasterize_char, font_identity, GlyphCache, shared_glyph_cache
+from glyph_atlas import load_atlas
+from led_layout import layout_text, LayoutCache, IncrementalLayout, shared_layout_cache
+from led_frame import LEDFrame
+from led_canvas import LEDCanvasView, PixelHitIndex, color_keys
+from led_raster import LEDRasterView
+from led_animation import (AnimationFrames, PlaybackClock, ANIMATION_FPS, build_animation_frames,
+                           scrolled_frame)
+from led_export import (ExportFrame, ExportSnapshot, FRAME_INTERVAL, SCROLL_FILE_NAMES, final_pixel_positions,
+                        snapshot_frame, write_animation_expression, write_custom_expression, write_json,
+                        write_preview_images, write_timed_expression)
+from export_jobs import ExportJobRunner
+from grid_calibration import calibrate_grid, describe, load_positions, plane_coordinates
 
 class Font2LEDApp:
     def __init__(self, root):
@@ -79,6 +91,18 @@ class Font2LEDApp:
         self.current_font = "Consolas (推奨★)"
         self.font_path = self.font_configs[self.current_font]["path"]
         self.face = None
+        self.font_id = None  # グリフキャッシュ用のフォント識別子
+        self.pixel_size = self.font_configs[self.current_font]["size"]
+        self.glyph_cache = shared_glyph_cache  # Font2LEDと共有のLRUグリフキャッシュ
+        self.glyph_atlas = None  # メモリマップしたグリフアトラス
+        self.layout_cache = shared_layout_cache  # 同じテキストのレイアウト結果を共有
+        self.incremental_layout = None  # 入力中のテキストの差分レイアウト
+        self.live_preview_job = None  # ライブプレビューの遅延実行ID
+        self.live_preview_delay_ms = 150  # キー入力が止まってからプレビューするまでの待ち時間
+        self.raster_threshold_leds = 4000  # 自動選択でラスター描画に切り替えるLED数
+        self.animation_cache = None  # 事前計算したアニメーションフレーム
+        self.animation_cache_pending = None  # バックグラウンド計算中の (元データ, 条件)
+        self.animation_cache_sync_limit = 2_000_000  # これ以下のフレーム数×LED数は即座に計算
         self.current_led_data = None
         self.preview_scale = 10
         self.frames = []
@@ -89,8 +113,10 @@ class Font2LEDApp:
         # アニメーション状態変数
         self.animation_running = False
         self.animation_paused = False
-        self.animation_start_time = 0
-        self.animation_pause_time = 0
+        self.playback_clock = PlaybackClock(ANIMATION_FPS)  # 単調増加タイマーによる再生クロック
+        self.export_runner = ExportJobRunner(root)  # エクスポートをワーカースレッドで実行
+        self.drone_positions = None  # 読み込んだドローンの位置 (N, 3)（drone_index 順）
+        self.grid_calibration = None  # ドローンの位置から推定したグリッドの変換
         
         # LEDスクリーンサイズの設定
         self.screen_configs = {
@@ -118,8 +144,9 @@ class Font2LEDApp:
         self.y_offset_adjustment = 0  # 上下方向の位置調整値
         self.x_offset_adjustment = 0  # 左右方向の位置調整値
         
-        # ボタン操作のロック機構（同時押し防止）
-        self.button_operation_lock = False
+        # プレビュー再描画の要求（連続したボタン操作はアイドル時の1回の再描画にまとめる）
+        self.preview_dirty = False
+        self.preview_refresh_job = None
         
         # アプリケーション終了時のクリーンアップ
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -140,6 +167,11 @@ class Font2LEDApp:
         text_entry = ttk.Entry(left_frame, textvariable=self.text_var, width=30, font=("Arial", 12))
         text_entry.grid(row=0, column=1, padx=5, pady=2)
         
+        # 入力に合わせてプレビューを更新（キー入力が落ち着いてから差分レイアウト）
+        self.live_preview_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(left_frame, text="ライブ", variable=self.live_preview_var).grid(row=0, column=2, sticky=tk.W)
+        self.text_var.trace_add('write', self.on_text_changed)
+        
         # 色選択
         ttk.Label(left_frame, text="色:").grid(row=1, column=0, sticky=tk.W)
         self.color_frame = tk.Frame(left_frame, width=30, height=20, bg="#FF0000")
@@ -204,6 +236,10 @@ class Font2LEDApp:
         self.stop_button = ttk.Button(preview_control_frame, text="⏹", command=self.stop_animation, width=3, state='disabled')
         self.stop_button.pack(side=tk.LEFT, padx=2)
         
+        # 再生中の実測FPS・描画時間をステータスバーに表示
+        self.show_fps_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(preview_control_frame, text="FPS表示", variable=self.show_fps_var).pack(side=tk.LEFT, padx=5)
+        
         # 進行度スライダー
         progress_frame = ttk.Frame(anim_frame)
         progress_frame.grid(row=4, column=0, columnspan=3, pady=5, sticky=(tk.W, tk.E))
@@ -399,12 +435,17 @@ class Font2LEDApp:
         
         # グリッド配置
         self.canvas.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.canvas_view = LEDCanvasView(self.canvas)  # LEDアイテムを保持して差分更新
+        self.raster_view = LEDRasterView(self.canvas)  # 大規模スクリーン向けの画像描画
+        self.led_view = self.canvas_view
         h_scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
         v_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
         
         # スクロールバーの設定
-        h_scrollbar.config(command=self.canvas.xview)
-        v_scrollbar.config(command=self.canvas.yview)
+        h_scrollbar.config(command=self.on_canvas_xview)
+        v_scrollbar.config(command=self.on_canvas_yview)
+        # ウィンドウサイズの変更で新しく見えたLEDを描画
+        self.canvas.bind("<Configure>", self.refresh_viewport)
         
         # フレームのグリッド設定
         canvas_frame.grid_rowconfigure(0, weight=1)
@@ -445,6 +486,14 @@ class Font2LEDApp:
         ttk.Label(scale_frame, text="%").pack(side=tk.LEFT)
         ttk.Button(scale_frame, text="適用", command=self.apply_zoom_percent).pack(side=tk.LEFT, padx=5)
         
+        # 描画方式（自動: LED数がしきい値を超えたらラスター描画）
+        ttk.Label(scale_frame, text="描画:").pack(side=tk.LEFT, padx=(10, 0))
+        self.preview_backend_var = tk.StringVar(value="自動")
+        backend_combo = ttk.Combobox(scale_frame, textvariable=self.preview_backend_var,
+                                     values=["自動", "キャンバス", "ラスター"], state="readonly", width=8)
+        backend_combo.pack(side=tk.LEFT, padx=2)
+        backend_combo.bind("<<ComboboxSelected>>", lambda e: self.update_canvas_size())
+        
         # 下部パネル（エクスポート）
         bottom_frame = ttk.LabelFrame(main_frame, text="エクスポート", padding="10")
         bottom_frame.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=10)
@@ -456,8 +505,22 @@ class Font2LEDApp:
         ttk.Button(button_frame, text="JSONエクスポート", command=self.export_json).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Skybrushスクリプトエクスポート", command=self.export_skybrush_script).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Custom Expressionエクスポート", command=self.export_custom_expression).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="タイムドエクスポート", command=self.export_timed_expression).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="アニメーションエクスポート", command=self.export_animation).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="画像プレビュー保存", command=self.save_preview_images).pack(side=tk.LEFT, padx=5)
+        # 実際のドローン配置（位置のJSON/CSV）から位置 → グリッドの変換を推定してエクスポートに使う
+        ttk.Button(button_frame, text="ドローン配置読込", command=self.load_drone_positions).pack(side=tk.LEFT, padx=5)
+        # 長いショー向け：スクリプトのデータを zlib 圧縮 + base64 で埋め込む
+        self.compress_export_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(button_frame, text="圧縮", variable=self.compress_export_var).pack(side=tk.LEFT, padx=5)
+        
+        # エクスポートの進捗とキャンセル
+        self.export_cancel_button = ttk.Button(button_frame, text="キャンセル", command=self.cancel_export,
+                                               state=tk.DISABLED)
+        self.export_cancel_button.pack(side=tk.RIGHT, padx=5)
+        self.export_progress_var = tk.DoubleVar(value=0)
+        ttk.Progressbar(button_frame, variable=self.export_progress_var, maximum=100,
+                        length=150).pack(side=tk.RIGHT, padx=5)
         
         # ステータスバー
         self.status_var = tk.StringVar(value="準備完了")
@@ -474,6 +537,8 @@ class Font2LEDApp:
         self.dragging_pixel = None  # ドラッグ中のピクセル情報
         self.drag_start_pos = None  # ドラッグ開始位置
         self.manual_pixel_positions = {}  # 手動で移動したピクセルの位置
+        self.pixel_hit_index = None  # 表示中のピクセルの空間インデックス（セル → ピクセル番号）
+        self.pixel_hit_offset = (0, 0)  # 表示座標と元のピクセル座標の差
         
         # マウスイベントのバインド
         self.canvas.bind("<Button-1>", self.on_canvas_click)
@@ -514,9 +579,16 @@ class Font2LEDApp:
             else:
                 self.font_path = original_path
             
+            # 切り替え前のフォントのレイアウト結果を破棄
+            if self.font_id is not None:
+                self.layout_cache.invalidate(self.font_id)
+            
             # freetypeでフォントロード
             self.face = freetype.Face(self.font_path)
-            self.face.set_pixel_sizes(font_config["size"][0], font_config["size"][1])
+            self.pixel_size = tuple(font_config["size"])
+            self.face.set_pixel_sizes(*self.pixel_size)
+            self.font_id = font_identity(self.font_path)
+            self.load_glyph_atlas()
             self.status_var.set(f"フォント読み込み完了: {self.current_font}")
             
         except Exception as e:
@@ -524,6 +596,13 @@ class Font2LEDApp:
             messagebox.showerror("エラー", error_msg)
             print(f"Font loading error: {e}")  # デバッグ用
             
+    def load_glyph_atlas(self):
+        """現在のフォント・サイズに対応するグリフアトラスを開く（無ければ生成）"""
+        font_height = self.font_height_var.get() if hasattr(self, 'font_height_var') else 10
+        font_width = self.font_width_var.get() if hasattr(self, 'font_width_var') else 12
+        self.glyph_atlas = load_atlas(self.font_path, self.face.face_index, self.pixel_size,
+                                      font_height, font_width)
+            
     def on_font_change(self, event=None):
         """フォント選択変更時の処理"""
         self.current_font = self.font_var.get()
@@ -550,127 +629,83 @@ class Font2LEDApp:
             hex_color = color[1]
             self.color_frame.config(bg=hex_color)
             
-    def get_char_bitmap(self, char: str) -> np.ndarray:
-        """文字のビットマップを取得"""
+    def get_char_glyph(self, char: str) -> Tuple[np.ndarray, int]:
+        """文字のビットマップと空白列を除いた文字幅を取得"""
+        # カスタマイズ可能なフォントサイズに正規化（下揃え）
+        font_height = self.font_height_var.get() if hasattr(self, 'font_height_var') else 10
+        font_width = self.font_width_var.get() if hasattr(self, 'font_width_var') else 12
+        
         try:
-            # 文字をロード（モノクロモード）
-            self.face.load_char(char, freetype.FT_LOAD_RENDER | freetype.FT_LOAD_MONOCHROME)
-            bitmap = self.face.glyph.bitmap
-            
-            if bitmap.width > 0 and bitmap.rows > 0:
-                # モノクロビットマップを2D配列に変換
-                data = []
-                for y in range(bitmap.rows):
-                    row = []
-                    for x in range(bitmap.width):
-                        # ビット位置を計算
-                        byte_index = y * bitmap.pitch + x // 8
-                        bit_index = 7 - (x % 8)
-                        
-                        if byte_index < len(bitmap.buffer):
-                            pixel = (bitmap.buffer[byte_index] >> bit_index) & 1
-                            row.append(pixel)
-                        else:
-                            row.append(0)
-                    data.append(row)
-                
-                result = np.array(data, dtype=np.uint8)
-                
-                # カスタマイズ可能なフォントサイズに正規化
-                font_height = self.font_height_var.get() if hasattr(self, 'font_height_var') else 10
-                font_width = self.font_width_var.get() if hasattr(self, 'font_width_var') else 12
-                
-                normalized = np.zeros((font_height, font_width), dtype=np.uint8)
-                h, w = result.shape
-                # 下揃えで配置（高さが異なる場合も対応）
-                if w <= font_width:
-                    if h < font_height:
-                        # 高さが指定未満の場合は下揃え
-                        normalized[font_height-h:font_height, :w] = result
-                    elif h == font_height:
-                        # 高さがちょうど指定の場合
-                        normalized[:, :w] = result
-                    else:
-                        # 高さが指定を超える場合は下から指定行を取る
-                        normalized[:, :w] = result[h-font_height:h, :w]
-                else:
-                    # 幅が指定を超える場合はクロップ
-                    if h < font_height:
-                        normalized[font_height-h:font_height, :font_width] = result[:, :font_width]
-                    elif h == font_height:
-                        normalized[:, :font_width] = result[:, :font_width]
-                    else:
-                        normalized[:, :font_width] = result[h-font_height:h, :font_width]
-                
-                return normalized
-            else:
-                # 空白文字の場合
-                font_height = self.font_height_var.get() if hasattr(self, 'font_height_var') else 10
-                font_width = self.font_width_var.get() if hasattr(self, 'font_width_var') else 12
-                return np.zeros((font_height, font_width), dtype=np.uint8)
+            key = GlyphCache.make_key(self.font_id, self.face.face_index, self.pixel_size,
+                                      font_height, font_width, char)
+            cached = self.glyph_cache.get_glyph(key)
+            if cached is not None:
+                return cached
+            
+            # アトラスに収録されていればFreeTypeを使わない
+            if self.glyph_atlas is not None and self.glyph_atlas.matches(font_height, font_width):
+                glyph = self.glyph_atlas.get_glyph(char)
+                if glyph is not None:
+                    return self.glyph_cache.put_glyph(key, *glyph)
+            return self.glyph_cache.put_glyph(key, rasterize_char(self.face, char, font_height, font_width))
                 
         except Exception as e:
             print(f"Warning: Failed to load character '{char}': {e}")
-            return np.zeros((10, 12), dtype=np.uint8)
+            return np.zeros((font_height, font_width), dtype=np.uint8), 0
+    
+    def get_char_bitmap(self, char: str) -> np.ndarray:
+        """文字のビットマップを取得"""
+        return self.get_char_glyph(char)[0]
             
     def text_to_led_matrix(self, text: str, spacing: int = 1) -> Dict:
         """テキストをLEDマトリックスデータに変換"""
         font_height = self.font_height_var.get() if hasattr(self, 'font_height_var') else 10
+        return layout_text(text, self.get_char_glyph, font_height, spacing)
+    
+    def text_to_frame(self, text: str, spacing: int = 1) -> LEDFrame:
+        """テキストをLEDフレームに変換（同じ条件のレイアウトはキャッシュを共有）"""
+        font_height = self.font_height_var.get() if hasattr(self, 'font_height_var') else 10
         font_width = self.font_width_var.get() if hasattr(self, 'font_width_var') else 12
+        key = LayoutCache.make_key(text, self.font_id, self.face.face_index, self.pixel_size,
+                                   font_height, font_width, spacing)
+        return self.layout_cache.get_or_layout(key, lambda: self.text_to_led_matrix(text, spacing))
+        
+    def on_text_changed(self, *args):
+        """テキスト変更時にライブプレビューを遅延実行（連続入力はまとめる）"""
+        self.cancel_live_preview()
+        if self.live_preview_var.get():
+            self.live_preview_job = self.root.after(self.live_preview_delay_ms, self.live_preview)
+    
+    def cancel_live_preview(self):
+        """予約中のライブプレビューを取り消す"""
+        if self.live_preview_job is not None:
+            self.root.after_cancel(self.live_preview_job)
+            self.live_preview_job = None
+    
+    def live_preview(self):
+        """入力中のテキストを差分レイアウトしてプレビュー"""
+        self.live_preview_job = None
+        text = self.text_var.get()
+        if self.face is None or not text:
+            return
         
-        if not text:
-            return {"width": 0, "height": font_height, "pixels": [], "matrix": np.zeros((font_height, 0))}
-        
-        # 各文字のビットマップを取得
-        bitmaps = []
-        total_width = 0
-        
-        for i, char in enumerate(text):
-            bitmap = self.get_char_bitmap(char)
-            # 実際の文字幅を計算（空白列を除く）
-            char_width = 0
-            for x in range(bitmap.shape[1]):
-                if np.any(bitmap[:, x] > 0):
-                    char_width = x + 1
-            
-            if char_width > 0:
-                bitmaps.append(bitmap[:, :char_width])
-                total_width += char_width
-            else:
-                # スペースの場合は固定幅
-                bitmaps.append(np.zeros((font_height, 4), dtype=np.uint8))
-                total_width += 4
-            
-            if i < len(text) - 1:
-                total_width += spacing
-        
-        # 全体のマトリックスを作成
-        matrix = np.zeros((font_height, total_width), dtype=np.uint8)
-        x_offset = 0
-        
-        for i, bitmap in enumerate(bitmaps):
-            h, w = bitmap.shape
-            matrix[:h, x_offset:x_offset+w] = bitmap
-            x_offset += w
-            if i < len(bitmaps) - 1:
-                x_offset += spacing
-        
-        # 点灯ピクセルの座標を抽出
-        pixels = []
-        for y in range(font_height):
-            for x in range(total_width):
-                if matrix[y, x] > 0:
-                    pixels.append((x, y))
-        
-        return {
-            "width": total_width,
-            "height": font_height,
-            "pixels": pixels,
-            "matrix": matrix
-        }
+        font_height = self.font_height_var.get()
+        font_width = self.font_width_var.get()
+        if self.incremental_layout is None or self.incremental_layout.height != font_height:
+            self.incremental_layout = IncrementalLayout(self.get_char_glyph, font_height)
+        context = (self.font_id, self.face.face_index, self.pixel_size, font_height, font_width)
+        
+        # テキストが変わったので手動で移動したピクセル位置をクリア
+        self.manual_pixel_positions.clear()
         
+        self.current_led_data = self.incremental_layout.update(text, context)
+        self.update_preview_canvas(self.current_led_data)
+        self.status_var.set(f"ライブプレビュー: {self.current_led_data.width}×{self.current_led_data.height}ピクセル"
+                            f" (再利用 {self.incremental_layout.reused_chars}/{len(text)}文字)")
+    
     def generate_preview(self):
         """プレビュー生成"""
+        self.cancel_live_preview()
         text = self.text_var.get()
         if not text:
             messagebox.showwarning("警告", "テキストを入力してください")
@@ -679,15 +714,16 @@ class Font2LEDApp:
         # 手動で移動したピクセル位置をクリア
         self.manual_pixel_positions.clear()
             
-        self.current_led_data = self.text_to_led_matrix(text)
+        self.current_led_data = self.text_to_frame(text)
         self.update_preview_canvas(self.current_led_data)
-        self.status_var.set(f"プレビュー生成完了: {self.current_led_data['width']}×{self.current_led_data['height']}ピクセル")
+        cache_stats = self.glyph_cache.stats()
+        self.status_var.set(f"プレビュー生成完了: {self.current_led_data['width']}×{self.current_led_data['height']}ピクセル"
+                            f" (グリフキャッシュ: ヒット{cache_stats['hits']} / ミス{cache_stats['misses']})")
         
                 
     def update_canvas_size(self):
         """キャンバスサイズを更新"""
-        if self.current_led_data:
-            self.update_preview_canvas(self.current_led_data)
+        self.request_preview_refresh()
         
     def fit_to_window(self):
         """ウィンドウサイズに合わせて全体表示"""
@@ -715,22 +751,60 @@ class Font2LEDApp:
         self.zoom_scale = min(scale_x, scale_y, 1.0)  # 最大でも100%
         
         # プレビューを更新
-        if self.current_led_data:
-            self.update_preview_canvas(self.current_led_data)
+        self.apply_preview_zoom()
         
     def reset_zoom(self):
         """ズームを100%にリセット"""
         self.zoom_scale = 1.0
         self.zoom_percent_var.set(100)
-        if self.current_led_data:
-            self.update_preview_canvas(self.current_led_data)
+        self.apply_preview_zoom()
         
     def apply_zoom_percent(self):
         """入力されたパーセンテージでズームを適用"""
         percent = self.zoom_percent_var.get()
         self.zoom_scale = percent / 100.0
-        if self.current_led_data:
+        self.apply_preview_zoom()
+    
+    def apply_preview_zoom(self):
+        """ズーム倍率を反映（グリッドが同じならLEDを作り直さずに拡大縮小）"""
+        if not self.current_led_data:
+            return
+        rows = self.custom_rows_var.get()
+        cols = self.custom_cols_var.get()
+        geometry = self.led_view.geometry
+        if geometry is None or geometry[:2] != (rows, cols) or self.select_led_view(rows, cols) is not self.led_view:
             self.update_preview_canvas(self.current_led_data)
+            return
+        
+        spacing = int(30 * self.zoom_scale)
+        self.canvas.config(scrollregion=(0, 0, cols * spacing, rows * spacing))
+        self.led_view.ensure_grid(rows, cols, spacing, self.preview_viewport())
+    
+    def preview_viewport(self):
+        """キャンバスの表示範囲（キャンバス座標の (x0, y0, x1, y1)）"""
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        if width <= 1 or height <= 1:
+            # ウィンドウがまだ描画されていない場合は設定サイズを使う
+            width = int(self.canvas.cget("width"))
+            height = int(self.canvas.cget("height"))
+        x0 = self.canvas.canvasx(0)
+        y0 = self.canvas.canvasy(0)
+        return (x0, y0, x0 + width, y0 + height)
+    
+    def refresh_viewport(self, event=None):
+        """表示範囲の変更（スクロール・リサイズ）を反映"""
+        self.led_view.set_viewport(*self.preview_viewport())
+    
+    def on_canvas_xview(self, *args):
+        """横スクロールバーの操作"""
+        self.canvas.xview(*args)
+        self.refresh_viewport()
+    
+    def on_canvas_yview(self, *args):
+        """縦スクロールバーの操作"""
+        self.canvas.yview(*args)
+        self.refresh_viewport()
         
     def update_screen_size(self):
         """スクリーンサイズの変更を反映"""
@@ -751,7 +825,7 @@ class Font2LEDApp:
             return
             
         # フレームデータを作成
-        led_data = self.text_to_led_matrix(text)
+        led_data = self.text_to_frame(text)
         frame_data = {
             "text": text,
             "color": self.current_color,
@@ -797,60 +871,11 @@ class Font2LEDApp:
         
         if not filename:
             return
-            
-        # エクスポート用データを構築
-        config = self.screen_configs[self.screen_size_var.get()]
-        export_data = {
-            "metadata": {
-                "grid_width": config["cols"],
-                "grid_height": config["rows"],
-                "frame_count": len(self.frames),
-                "font": "JF-Dot-k12x10",
-                "created": datetime.now().isoformat()
-            },
-            "frames": []
-        }
         
-        for i, frame in enumerate(self.frames):
-            frame_data = {
-                "frame": i * 20,  # 20フレーム間隔
-                "text": frame["text"],
-                "pixels": []
-            }
-            
-            led_data = frame["led_data"]
-            
-            # 手動移動を考慮した最終位置を取得
-            final_pixels = self.get_final_pixel_positions(led_data)
-            
-            for pixel in final_pixels:
-                pixel_data = {
-                    "x": pixel[0],
-                    "y": pixel[1],
-                    "r": frame["color"][0],
-                    "g": frame["color"][1],
-                    "b": frame["color"][2]
-                }
-                
-                # カラーマップがある場合は色を上書き
-                if led_data.get('color_map') and len(pixel) > 2:
-                    color_id = str(pixel[2])
-                    if color_id in led_data['color_map']:
-                        color_rgb = led_data['color_map'][color_id]
-                        if isinstance(color_rgb, (list, tuple)) and len(color_rgb) >= 3:
-                            pixel_data["r"] = color_rgb[0]
-                            pixel_data["g"] = color_rgb[1]
-                            pixel_data["b"] = color_rgb[2]
-                
-                frame_data["pixels"].append(pixel_data)
-                    
-            export_data["frames"].append(frame_data)
+        def done(path):
+            self.status_var.set(f"JSONエクスポート完了: {path}")
         
-        # JSON保存
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(export_data, f, ensure_ascii=False, indent=2)
-            
-        self.status_var.set(f"JSONエクスポート完了: {filename}")
+        self.start_export("JSONエクスポート", write_json, (filename, self.export_snapshot()), done)
         
     def export_skybrush_script(self):
         """Skybrush Formation用のBlenderスクリプトをエクスポート
@@ -1078,16 +1103,33 @@ for area in bpy.context.screen.areas:
             self.update_preview_if_exists()
     
     def update_preview_if_exists(self):
-        """現在のLEDデータが存在する場合、プレビューを更新"""
-        if hasattr(self, 'current_led_data') and self.current_led_data:
+        """現在のLEDデータが存在する場合、プレビューの再描画を要求"""
+        self.request_preview_refresh()
+    
+    def request_preview_refresh(self):
+        """プレビューを再描画が必要な状態にし、次のアイドル時に1回だけ再描画する"""
+        self.preview_dirty = True
+        if self.preview_refresh_job is None:
+            self.preview_refresh_job = self.root.after_idle(self.flush_preview_refresh)
+    
+    def flush_preview_refresh(self):
+        """要求されていた再描画を実行"""
+        self.preview_refresh_job = None
+        if not self.preview_dirty:
+            return
+        self.preview_dirty = False
+        if self.current_led_data:
             self.update_preview_canvas(self.current_led_data)
     
+    def cancel_preview_refresh(self):
+        """予約済みの再描画を取り消す"""
+        if self.preview_refresh_job is not None:
+            self.root.after_cancel(self.preview_refresh_job)
+            self.preview_refresh_job = None
+        self.preview_dirty = False
+    
     def add_col_left(self):
         """左に1列追加 - 左側に空白列を追加（テキストを右にシフト）"""
-        if hasattr(self, 'button_operation_lock') and self.button_operation_lock:
-            print("左に1列追加: 操作ロック中、無視")
-            return
-        
         current = self.custom_cols_var.get()
         
         # 中央配置の変化を計算
@@ -1110,10 +1152,6 @@ for area in bpy.context.screen.areas:
     
     def add_col_right(self):
         """右に1列追加 - 右側に空白列を追加（テキスト位置は維持）"""
-        if hasattr(self, 'button_operation_lock') and self.button_operation_lock:
-            print("右に1列追加: 操作ロック中、無視")
-            return
-        
         current = self.custom_cols_var.get()
         
         # 中央配置の変化を計算
@@ -1204,7 +1242,10 @@ for area in bpy.context.screen.areas:
         """フォントサイズを更新"""
         # フォントを再読み込み
         if self.face:
-            self.face.set_pixel_sizes(self.font_width_var.get(), self.font_height_var.get())
+            self.pixel_size = (self.font_width_var.get(), self.font_height_var.get())
+            self.face.set_pixel_sizes(*self.pixel_size)
+            self.load_glyph_atlas()
+            self.layout_cache.invalidate(self.font_id)
             self.status_var.set(f"フォントサイズ更新: {self.font_width_var.get()}×{self.font_height_var.get()}")
             
             # プレビューを更新
@@ -1223,52 +1264,11 @@ for area in bpy.context.screen.areas:
         )
         if not folder:
             return
-            
-        for i, frame in enumerate(self.frames):
-            # 画像生成（選択されたスクリーンサイズ準拠）
-            config = self.screen_configs[self.screen_size_var.get()]
-            scale = 20
-            img_width = config["cols"] * scale
-            img_height = config["rows"] * scale
-            
-            image = Image.new('RGB', (img_width, img_height), 'black')
-            draw = ImageDraw.Draw(image)
-            
-            # グリッド線
-            for x in range(0, img_width + 1, scale):
-                draw.line([(x, 0), (x, img_height)], fill=(40, 40, 40))
-            for y in range(0, img_height + 1, scale):
-                draw.line([(0, y), (img_width, y)], fill=(40, 40, 40))
-            
-            # LEDピクセル（選択されたグリッド）
-            led_data = frame["led_data"]
-            x_offset = (config["cols"] - led_data["width"]) // 2 + self.x_offset_adjustment  # 水平方向のセンタリング + x_offset調整
-            # 行数が足りない場合は下が切れるように、上から配置 + y_offset調整を適用
-            y_offset = 0 + self.y_offset_adjustment
-            
-            color_rgb = tuple(int(c * 255) for c in frame["color"])
-            
-            for x, y in led_data["pixels"]:
-                led_x = x + x_offset
-                led_y = y + y_offset
-                if 0 <= led_x < config["cols"] and 0 <= led_y < config["rows"]:
-                    x1 = led_x * scale + 2
-                    y1 = led_y * scale + 2
-                    x2 = x1 + scale - 4
-                    y2 = y1 + scale - 4
-                    draw.ellipse([x1, y1, x2, y2], fill=color_rgb)
-            
-            # テキスト情報
-            info_image = Image.new('RGB', (img_width, img_height + 30), 'black')
-            info_image.paste(image, (0, 0))
-            info_draw = ImageDraw.Draw(info_image)
-            info_draw.text((10, img_height + 5), f"Text: {frame['text']}", fill=(200, 200, 200))
-            
-            # 保存
-            filename = os.path.join(folder, f"frame_{i+1:02d}_{frame['text']}.png")
-            info_image.save(filename)
-            
-        self.status_var.set(f"画像保存完了: {folder}")
+        
+        def done(count):
+            self.status_var.set(f"画像保存完了: {folder}")
+        
+        self.start_export("画像プレビュー保存", write_preview_images, (folder, self.export_snapshot()), done)
         
     def export_custom_expression(self):
         """Skybrush Custom Expression用スクリプトをエクスポート"""
@@ -1289,129 +1289,12 @@ for area in bpy.context.screen.areas:
         
         if not filename:
             return
-            
-        # 現在の設定を取得（カスタム設定に対応）
-        if self.screen_size_var.get() == "custom":
-            rows = self.custom_rows_var.get()
-            cols = self.custom_cols_var.get()
-        else:
-            config = self.screen_configs[self.screen_size_var.get()]
-            rows = config["rows"]
-            cols = config["cols"]
-            
-        # ピクセルデータを収集（中央配置を適用）
-        pixels_data = []
-        for frame in self.frames:
-            led_data = frame["led_data"]
-            x_offset = (cols - led_data["width"]) // 2 + self.x_offset_adjustment  # 水平方向のセンタリング + x_offset調整
-            # 行数が足りない場合は下が切れるように、上から配置 + y_offset調整を適用
-            y_offset = 0 + self.y_offset_adjustment
-            
-            for x, y in led_data["pixels"]:
-                adjusted_x = x + x_offset
-                adjusted_y = y + y_offset
-                if 0 <= adjusted_x < cols and 0 <= adjusted_y < rows:
-                    pixels_data.append((adjusted_x, adjusted_y))
-        
-        # 重複を除去してソート
-        unique_pixels = sorted(list(set(pixels_data)))
-        
-        # Pythonタプル形式の文字列を作成
-        pixels_str = "{\n"
-        for i, (x, y) in enumerate(unique_pixels):
-            if i > 0 and i % 8 == 0:  # 8個ごとに改行
-                pixels_str += ",\n"
-            elif i > 0:
-                pixels_str += ", "
-            pixels_str += f"({x},{y})"
-        pixels_str += "\n}"
-        
-        # Custom Expression テンプレート（正しいSkybrush関数形式）
-        custom_expression_template = '''# Skybrush Custom Expression Function
-# Generated by Font2LED Tool - {timestamp}
-# Text: {text_content}
-
-# グリッドサイズ設定
-GRID_WIDTH = {grid_cols}
-GRID_HEIGHT = {grid_rows}
-
-# 座標範囲（ドローン配置設定に基づく動的計算）
-# グリッド: {grid_cols}列×{grid_rows}行、間隔: {drone_spacing}m
-DRONE_SPACING = {drone_spacing}  # ドローン間隔(m)
-X_MIN = -(GRID_WIDTH - 1) * DRONE_SPACING / 2
-X_MAX = (GRID_WIDTH - 1) * DRONE_SPACING / 2
-Z_MIN = -(GRID_HEIGHT - 1) * DRONE_SPACING / 2
-Z_MAX = (GRID_HEIGHT - 1) * DRONE_SPACING / 2
-
-# ピクセルデータ（Grid座標）
-PIXELS = {pixels_data}
-
-def {function_name}(frame, time_fraction, drone_index, formation_index, position, drone_count):
-    """
-    Skybrush Custom Expression関数
-    
-    Args:
-        frame: フレーム番号
-        time_fraction: 時間進行度（0.0-1.0）
-        drone_index: ドローンインデックス
-        formation_index: フォーメーションインデックス
-        position: ドローンの3D座標 (x, y, z)
-        drone_count: ドローン総数
-    
-    Returns:
-        float: Color Ramp用のインデックス値（0.0-1.0）
-    """
-    
-    # ドローンの現在位置を取得
-    x_pos = position[0]  # X座標
-    z_pos = position[2]  # Z座標（高さ）
-    
-    # 座標をグリッドインデックスに変換
-    if X_MAX > X_MIN and Z_MAX > Z_MIN:
-        # X軸: グリッド列 (0-{grid_cols_minus_1})
-        grid_x = int(round((x_pos - X_MIN) / (X_MAX - X_MIN) * (GRID_WIDTH - 1)))
-        
-        # Z軸: グリッド行 (0-{grid_rows_minus_1})、上下反転
-        grid_z = int(round((z_pos - Z_MIN) / (Z_MAX - Z_MIN) * (GRID_HEIGHT - 1)))
-        grid_z = {grid_rows_minus_1} - grid_z  # 上下反転
-        
-        # 範囲チェック
-        if 0 <= grid_x < GRID_WIDTH and 0 <= grid_z < GRID_HEIGHT:
-            # ピクセルデータをチェック
-            if (grid_x, grid_z) in PIXELS:
-                return 1.0  # 文字部分（Color Rampで色に変換）
-        
-        return 0.0  # 背景（黒）
-    else:
-        return 0.0  # エラー時（黒）'''
         
-        # スクリプト生成のための設定
         config = self.screen_configs[self.screen_size_var.get()]
-        text_content = " + ".join([frame["text"] for frame in self.frames])
-        
-        # 関数名を生成（テキストから安全な関数名を作成）
-        safe_text = text_content.replace(" ", "_").replace("+", "_").replace("　", "_")
-        safe_text = "".join(c for c in safe_text if c.isalnum() or c == "_")
-        function_name = f"{safe_text}_display" if safe_text else "text_display"
-        
-        script_content = custom_expression_template.format(
-            timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            text_content=text_content,
-            function_name=function_name,
-            pixels_data=pixels_str,
-            grid_cols=config["cols"],
-            grid_rows=config["rows"],
-            grid_cols_minus_1=config["cols"] - 1,
-            grid_rows_minus_1=config["rows"] - 1,
-            drone_spacing=config["drone_spacing_m"]
-        )
         
-        try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(script_content)
-                
+        def done(path):
             self.status_var.set(f"Custom Expression エクスポート完了: {os.path.basename(filename)}")
-            
+
             # 使用方法を表示
             usage_msg = f"""Custom Expressionエクスポート完了！
 
@@ -1431,9 +1314,36 @@ def {function_name}(frame, time_fraction, drone_index, formation_index, position
 Font2LED Toolの設定とBlenderの実際のドローン配置が一致している必要があります。"""
             
             messagebox.showinfo("エクスポート完了", usage_msg)
-            
-        except Exception as e:
-            messagebox.showerror("エラー", f"ファイル保存エラー: {e}")
+        
+        self.start_export("Custom Expressionエクスポート", write_custom_expression,
+                          (filename, self.export_snapshot()), done)
+
+    def export_timed_expression(self):
+        """全フレームを表示区間付きで1つの Custom Expression にエクスポート"""
+        if not self.frames:
+            messagebox.showwarning("警告", "エクスポートするフレームがありません")
+            return
+        
+        filename = filedialog.asksaveasfilename(
+            initialfile=f"timed_expression_{self.frames[0]['text']}",
+            defaultextension=".py",
+            filetypes=[("Python files", "*.py"), ("All files", "*.*")]
+        )
+        
+        if not filename:
+            return
+        
+        total_frames = len(self.frames) * FRAME_INTERVAL
+        
+        def done(path):
+            self.status_var.set(f"タイムド Custom Expression エクスポート完了: {os.path.basename(path)}")
+            messagebox.showinfo("エクスポート完了",
+                                f"{len(self.frames)}フレームを{FRAME_INTERVAL}フレームずつ表示する"
+                                f" Custom Expression をエクスポートしました。\n"
+                                f"Light EffectのFrame範囲を 開始フレーム + {total_frames} に設定してください。")
+        
+        self.start_export("タイムドエクスポート", write_timed_expression,
+                          (filename, self.export_snapshot()), done)
 
     def update_duration_label(self, *args):
         """フレーム数から秒数を計算して表示"""
@@ -1462,6 +1372,7 @@ Font2LED Toolの設定とBlenderの実際のドローン配置が一致してい
         self.animation_running = True
         self.animation_paused = False
         self.animation_current_frame = 0  # フレームベースで管理
+        self.playback_clock.start(0)  # 経過時間から表示フレームを決める
         self.play_button.config(state='disabled')
         self.pause_button.config(state='normal')
         self.stop_button.config(state='normal')
@@ -1473,16 +1384,14 @@ Font2LED Toolの設定とBlenderの実際のドローン配置が一致してい
         """アニメーション一時停止"""
         if self.animation_running and not self.animation_paused:
             self.animation_paused = True
-            import time
-            self.animation_pause_time = time.time() * 1000
+            self.playback_clock.pause()
+            self.cancel_animation_timer()
             self.play_button.config(state='normal', text="▶")
             self.pause_button.config(state='disabled')
             self.status_var.set("アニメーション一時停止")
         elif self.animation_paused:
-            # 再開
-            import time
-            pause_duration = time.time() * 1000 - self.animation_pause_time
-            self.animation_start_time += pause_duration
+            # 再開（停止していた時間は経過時間に含めない）
+            self.playback_clock.resume()
             self.animation_paused = False
             self.play_button.config(state='disabled')
             self.pause_button.config(state='normal')
@@ -1493,6 +1402,7 @@ Font2LED Toolの設定とBlenderの実際のドローン配置が一致してい
         """アニメーション停止"""
         self.animation_running = False
         self.animation_paused = False
+        self.cancel_animation_timer()
         self.animation_progress.set(0.0)
         self.play_button.config(state='normal', text="▶")
         self.pause_button.config(state='disabled')
@@ -1506,31 +1416,53 @@ Font2LED Toolの設定とBlenderの実際のドローン配置が一致してい
         self.progress_label.config(text=f"0 / {total_frames} frames")
         self.status_var.set("アニメーション停止")
     
+    def cancel_animation_timer(self):
+        """予約中の次フレーム描画を取り消す"""
+        if self.animation_timer is not None:
+            self.root.after_cancel(self.animation_timer)
+            self.animation_timer = None
+    
     def animate_frame(self):
-        """アニメーションフレームの更新"""
+        """アニメーションフレームの更新（経過時間に合わせ、遅れたフレームはスキップ）"""
+        self.animation_timer = None
         if not self.animation_running or self.animation_paused:
             return
         
         total_frames = self.animation_frames.get()
+        clock = self.playback_clock
         
+        # 経過時間から表示すべきフレームを決める
+        self.animation_current_frame = clock.current_frame()
         if self.animation_current_frame >= total_frames:
             # アニメーション完了
+            stats = clock.stats()
             self.stop_animation()
+            if self.show_fps_var.get():
+                self.status_var.set(f"アニメーション完了: 平均{stats['fps']:.1f}fps "
+                                    f"(スキップ {stats['dropped']}フレーム)")
             return
         
-        # 進行度計算（0.0-1.0）
-        time_fraction = self.animation_current_frame / float(total_frames)
-        self.animation_progress.set(time_fraction)
-        self.progress_label.config(text=f"{self.animation_current_frame} / {total_frames} frames")
-        
-        # アニメーションフレームをプレビューに反映
-        self.update_preview_canvas(self.current_led_data, time_fraction)
-        
-        # 次のフレームに進む
-        self.animation_current_frame += 1
+        if self.animation_current_frame != clock.last_frame:
+            render_start = clock.clock()
+            
+            # 進行度計算（0.0-1.0）
+            time_fraction = self.animation_current_frame / float(total_frames)
+            self.animation_progress.set(time_fraction)
+            self.progress_label.config(text=f"{self.animation_current_frame} / {total_frames} frames")
+            
+            # アニメーションフレームをプレビューに反映
+            self.update_preview_canvas(self.current_led_data, time_fraction)
+            clock.record(self.animation_current_frame, clock.clock() - render_start)
+            
+            if self.show_fps_var.get():
+                stats = clock.stats()
+                self.status_var.set(f"再生中: {stats['fps']:.1f}fps / {clock.fps:.0f}fps, "
+                                    f"描画 平均{stats['render_ms_avg']:.1f}ms 最大{stats['render_ms_max']:.1f}ms, "
+                                    f"スキップ {stats['dropped']}フレーム")
         
-        # 次のフレームをスケジュール（24fps）
-        self.root.after(42, self.animate_frame)  # 1000ms / 24fps = 41.67ms ≈ 42ms
+        # 次のフレームの表示時刻に合わせてスケジュール（24fps）
+        self.animation_timer = self.root.after(clock.delay_until(self.animation_current_frame + 1),
+                                               self.animate_frame)
     
     def on_progress_change(self, event=None):
         """進行度スライダーの変更"""
@@ -1544,6 +1476,13 @@ Font2LED Toolの設定とBlenderの実際のドローン配置が一致してい
             self.progress_label.config(text=f"{current_frame} / {total_frames} frames")
             self.update_preview_canvas(self.current_led_data, time_fraction)
     
+    def select_led_view(self, rows: int, cols: int):
+        """描画方式の設定とLED数からプレビューのバックエンドを選択"""
+        backend = self.preview_backend_var.get()
+        if backend == "ラスター" or (backend == "自動" and rows * cols > self.raster_threshold_leds):
+            return self.raster_view
+        return self.canvas_view
+    
     def update_preview_canvas(self, led_data, time_fraction=0.0):
         """プレビューキャンバスを更新（アニメーション対応）"""
         # 実際のカスタム設定値を使用
@@ -1562,151 +1501,137 @@ Font2LED Toolの設定とBlenderの実際のドローン配置が一致してい
         # キャンバスのスクロール領域を設定
         self.canvas.config(scrollregion=(0, 0, canvas_width, canvas_height))
         
-        # キャンバスをクリア
-        self.canvas.delete("all")
+        # LEDアイテムはジオメトリが変わった時だけ作り直す
+        view = self.select_led_view(config["rows"], config["cols"])
+        if view is not self.led_view:
+            self.led_view.invalidate()
+            self.led_view = view
+        self.led_view.ensure_grid(config["rows"], config["cols"], spacing, self.preview_viewport())
+        
+        frame = LEDFrame.from_led_data(led_data)
+        animating = self.animation_enabled.get() and time_fraction > 0
+        
+        # 事前計算したフレームがあれば配列を参照するだけで描画（手動移動が無い場合）
+        if animating and not self.manual_pixel_positions:
+            animation = self.get_animation_frames(led_data)
+            if animation is not None:
+                index = animation.index_for(time_fraction)
+                if frame.color_index is None:
+                    lit_y, lit_x = np.nonzero(animation.mask(index))
+                    keys = np.full(lit_x.size, color_keys([self.current_color])[0], dtype=np.int64)
+                else:
+                    visible = animation.frame(index)
+                    lit_x, lit_y = visible.pixels[:, 0], visible.pixels[:, 1]
+                    keys = color_keys(visible.pixel_rgb(self.current_color))
+                self.led_view.render(lit_x, lit_y, keys)
+                self.pixel_hit_index = None  # クリック時に作成
+                return
         
+        hit_index = self.build_pixel_hit_index(led_data, time_fraction)
         
-        # すべてのLED位置を描画（消灯状態）
-        led_size = max(4, int(spacing // 4))
-        for row in range(config["rows"]):
-            for col in range(config["cols"]):
-                center_x = col * spacing + spacing // 2
-                center_y = row * spacing + spacing // 2
-                
-                # LED球体（消灯時は暗いグレー）
-                x1 = center_x - led_size // 2
-                y1 = center_y - led_size // 2
-                x2 = center_x + led_size // 2
-                y2 = center_y + led_size // 2
-                
-                self.canvas.create_oval(x1, y1, x2, y2, fill="#202020", outline="#404040", width=1)
+        # ドラッグ中のピクセルはハイライト表示
+        highlight = None
+        if self.dragging_pixel and 0 <= self.dragging_pixel['index'] < len(hit_index.xs):
+            highlight = hit_index.position(self.dragging_pixel['index'])
+        
+        self.led_view.render(hit_index.xs, hit_index.ys, hit_index.keys, highlight)
+    
+    def build_pixel_hit_index(self, led_data, time_fraction=0.0) -> PixelHitIndex:
+        """表示するピクセル座標・色を計算し、クリック判定用の空間インデックスを作成"""
+        rows = self.custom_rows_var.get()
+        cols = self.custom_cols_var.get()
         
         # LEDドット描画（アニメーション適用）
         if self.animation_enabled.get() and time_fraction > 0:
-            animated_pixels = self.calculate_animated_pixels(led_data, time_fraction)
+            # スクロール中はエクスポートと同じスクリーン座標で表示
+            placed = self.animated_frame(led_data, time_fraction)
+            self.pixel_hit_offset = (0, 0)
         else:
-            animated_pixels = led_data["pixels"]
+            # 中央配置のオフセット計算 + x_offset/y_offset調整を適用
+            x_offset = (cols - led_data["width"]) // 2 + self.x_offset_adjustment
+            # 行数が足りない場合は下が切れるように、上から配置 + y_offset調整を適用
+            y_offset = 0 + self.y_offset_adjustment
+            placed = LEDFrame.from_led_data(led_data).offset(x_offset, y_offset)
+            self.pixel_hit_offset = (x_offset, y_offset)
         
-        # 中央配置のオフセット計算 + x_offset/y_offset調整を適用
-        x_offset = (config["cols"] - led_data["width"]) // 2 + self.x_offset_adjustment
-        # 行数が足りない場合は下が切れるように、上から配置 + y_offset調整を適用
-        y_offset = 0 + self.y_offset_adjustment
+        led_x = placed.pixels[:, 0].astype(np.int64)
+        led_y = placed.pixels[:, 1].astype(np.int64)
         
-        # カラーマップの取得
-        color_map = led_data.get('color_map', {})
+        # 手動で移動したピクセルの位置を確認
+        for i, (manual_x, manual_y) in self.manual_pixel_positions.items():
+            if 0 <= i < len(led_x):
+                led_x[i] = manual_x
+                led_y[i] = manual_y
         
-        # ピクセルごとに描画
-        for i, pixel_data in enumerate(animated_pixels):
-            # 座標を取得
-            if isinstance(pixel_data, (list, tuple)):
-                x, y = pixel_data[0], pixel_data[1]
-            else:
-                continue
-            
-            # 手動で移動したピクセルの位置を確認
-            if i in self.manual_pixel_positions:
-                led_x, led_y = self.manual_pixel_positions[i]
-            else:
-                led_x = x + x_offset
-                led_y = y + y_offset
-            
-            if 0 <= led_x < config["cols"] and 0 <= led_y < config["rows"]:
-                center_x = led_x * spacing + spacing // 2
-                
-                # 色を決定
-                if color_map and i < len(led_data['pixels']) and len(led_data['pixels'][i]) > 2:
-                    # カラーマップから色を取得
-                    color_id = str(led_data['pixels'][i][2])
-                    if color_id in color_map:
-                        color_rgb = color_map[color_id]
-                        if isinstance(color_rgb, (list, tuple)) and len(color_rgb) >= 3:
-                            color = (color_rgb[0], color_rgb[1], color_rgb[2])
-                        else:
-                            color = self.current_color
-                    else:
-                        color = self.current_color
-                else:
-                    # デフォルトカラー
-                    color = self.current_color
-                
-                # RGB(0.0-1.0)から16進数カラーコードに変換
-                hex_color = f"#{int(color[0]*255):02x}{int(color[1]*255):02x}{int(color[2]*255):02x}"
-                
-                # 明るい色（エミッション効果）
-                bright_hex = f"#{min(255, int(color[0]*255*1.3)):02x}{min(255, int(color[1]*255*1.3)):02x}{min(255, int(color[2]*255*1.3)):02x}"
-                center_y = led_y * spacing + spacing // 2
-                
-                # LED球体（点灯時）
-                x1 = center_x - led_size // 2
-                y1 = center_y - led_size // 2
-                x2 = center_x + led_size // 2
-                y2 = center_y + led_size // 2
-                
-                # グロー効果（外側の輪）
-                glow_size = led_size + 4
-                gx1 = center_x - glow_size // 2
-                gy1 = center_y - glow_size // 2
-                gx2 = center_x + glow_size // 2
-                gy2 = center_y + glow_size // 2
-                
-                # ドラッグ中のピクセルはハイライト表示
-                if self.dragging_pixel and self.dragging_pixel['index'] == i:
-                    self.canvas.create_oval(gx1-2, gy1-2, gx2+2, gy2+2, fill="", outline="yellow", width=3)
-                    self.canvas.create_oval(gx1, gy1, gx2, gy2, fill="", outline=hex_color, width=2)
-                else:
-                    self.canvas.create_oval(gx1, gy1, gx2, gy2, fill="", outline=hex_color, width=2)
-                self.canvas.create_oval(x1, y1, x2, y2, fill=bright_hex, outline=hex_color, width=2)
+        # 色を決定（カラーマップに無い色はデフォルトカラー）
+        keys = color_keys(placed.pixel_rgb(self.current_color))
+        
+        self.pixel_hit_index = PixelHitIndex(rows, cols, led_x, led_y, keys)
+        return self.pixel_hit_index
+    
+    def animated_frame(self, led_data, time_fraction) -> LEDFrame:
+        """アニメーション適用後のフレーム（スクリーン内の部分のビュー、エクスポートと同じオフセット）"""
+        config = self.screen_configs[self.screen_size_var.get()]
+        return scrolled_frame(LEDFrame.from_led_data(led_data), self.animation_direction.get(),
+                              time_fraction, config["cols"], config["rows"])
     
     def calculate_animated_pixels(self, led_data, time_fraction):
         """アニメーション適用後のピクセル座標を計算"""
-        direction = self.animation_direction.get()
-        original_pixels = led_data["pixels"]
-        config = self.screen_configs[self.screen_size_var.get()]
-        
-        animated_pixels = []
+        return self.animated_frame(led_data, time_fraction).pixels.tolist()
+    
+    def animation_cache_key(self, led_data) -> Tuple:
+        """アニメーションフレームキャッシュの条件（変わったら作り直す）"""
+        screen = self.screen_configs[self.screen_size_var.get()]
+        rows = self.custom_rows_var.get()
+        cols = self.custom_cols_var.get()
+        return (self.animation_direction.get(), self.animation_frames.get(),
+                screen["cols"], screen["rows"], cols, rows,
+                (cols - led_data["width"]) // 2 + self.x_offset_adjustment,
+                self.y_offset_adjustment)
+    
+    def get_animation_frames(self, led_data) -> Optional[AnimationFrames]:
+        """事前計算したアニメーションフレームを取得
         
-        if direction == "右→左":
-            # 右から左へのスクロール
-            scroll_distance = config["cols"] + led_data["width"] + 10  # 余裕を持たせる
-            # time_fraction = 0: 右端外側、time_fraction = 1: 左端外側
-            offset_x = int(scroll_distance * (1 - time_fraction)) - led_data["width"] - 5
-            
-            for x, y in original_pixels:
-                new_x = x + offset_x
-                if -20 <= new_x < config["cols"] + 20:  # 広い範囲で表示
-                    animated_pixels.append((new_x, y))
-                    
-        elif direction == "左→右":
-            # 左から右へのスクロール
-            scroll_distance = config["cols"] + led_data["width"] + 10
-            # time_fraction = 0: 左端外側、time_fraction = 1: 右端外側
-            offset_x = int(scroll_distance * time_fraction) - led_data["width"] - 5
-            
-            for x, y in original_pixels:
-                new_x = x + offset_x
-                if -20 <= new_x < config["cols"] + 20:
-                    animated_pixels.append((new_x, y))
-                    
-        elif direction == "上→下":
-            # 上から下へのスクロール
-            scroll_distance = config["rows"] + led_data["height"] + 5
-            offset_y = int(scroll_distance * time_fraction) - led_data["height"] - 3
-            
-            for x, y in original_pixels:
-                new_y = y + offset_y
-                if -10 <= new_y < config["rows"] + 10:
-                    animated_pixels.append((x, new_y))
-                    
-        elif direction == "下→上":
-            # 下から上へのスクロール
-            scroll_distance = config["rows"] + led_data["height"] + 5
-            offset_y = int(scroll_distance * (1 - time_fraction)) - led_data["height"] - 3
-            
-            for x, y in original_pixels:
-                new_y = y + offset_y
-                if -10 <= new_y < config["rows"] + 10:
-                    animated_pixels.append((x, new_y))
-        return animated_pixels
+        条件が変わっていれば作り直す。大きなアニメーションはバックグラウンドで計算し、
+        完成するまではNoneを返す（呼び出し側は逐次計算で描画する）。
+        """
+        key = self.animation_cache_key(led_data)
+        cache = self.animation_cache
+        if cache is not None and cache.matches(led_data, key):
+            return cache
+        
+        pending = self.animation_cache_pending
+        if pending is not None and pending[0] is led_data and pending[1] == key:
+            return None  # 計算中
+        
+        direction, frame_count, screen_cols, screen_rows, cols, rows, x_offset, y_offset = key
+        frame = LEDFrame.from_led_data(led_data)
+        
+        def build():
+            return build_animation_frames(frame, key, direction, frame_count, screen_cols, screen_rows,
+                                          cols, rows, x_offset, y_offset)
+        
+        if frame_count * rows * cols <= self.animation_cache_sync_limit:
+            self.animation_cache = build()
+            self.animation_cache.source = led_data
+            return self.animation_cache
+        
+        self.animation_cache_pending = (led_data, key)
+        
+        def worker():
+            try:
+                frames = build()
+                frames.source = led_data
+                # 計算中に条件が変わっていなければ採用
+                if self.animation_cache_pending == (led_data, key):
+                    self.animation_cache = frames
+            finally:
+                # 失敗した場合（メモリ不足など）も計算中の印を外し、次の呼び出しで計算し直せるようにする
+                if self.animation_cache_pending == (led_data, key):
+                    self.animation_cache_pending = None
+        
+        threading.Thread(target=worker, daemon=True).start()
+        return None
     
     def export_animation(self):
         """アニメーション付きCustom Expressionをエクスポート"""
@@ -1720,9 +1645,7 @@ Font2LED Toolの設定とBlenderの実際のドローン配置が一致してい
         
         # ファイル名の生成
         text = self.text_var.get() or "animation"
-        direction_map = {"右→左": "scroll_right_to_left", "左→右": "scroll_left_to_right", 
-                        "上→下": "scroll_top_to_bottom", "下→上": "scroll_bottom_to_top"}
-        direction_name = direction_map.get(self.animation_direction.get(), "scroll")
+        direction_name = SCROLL_FILE_NAMES.get(self.animation_direction.get(), "scroll")
         default_filename = f"animated_{text}_{direction_name}"
         
         filename = filedialog.asksaveasfilename(
@@ -1734,138 +1657,120 @@ Font2LED Toolの設定とBlenderの実際のドローン配置が一致してい
         if not filename:
             return
         
-        # アニメーション用テンプレートを生成
+        def done(path):
+            self.status_var.set(f"アニメーションエクスポート完了: {os.path.basename(path)}")
+            messagebox.showinfo("エクスポート完了", 
+                              f"アニメーション付きCustom Expressionをエクスポートしました:\\n{path}")
+        
+        self.start_export("アニメーションエクスポート", write_animation_expression,
+                          (filename, self.export_snapshot()), done)
+    
+    # === ドローン配置のキャリブレーション ===
+    
+    def load_drone_positions(self):
+        """ドローンの位置ファイルを読み込み、現在のスクリーン設定のグリッドとしてキャリブレーション"""
+        filename = filedialog.askopenfilename(
+            filetypes=[("Drone positions", "*.json *.csv"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        try:
+            self.drone_positions = load_positions(filename)
+        except (OSError, ValueError, TypeError) as e:
+            messagebox.showerror("エラー", f"ドローン配置の読み込みに失敗しました:\n{str(e)}")
+            return
+        # 前のファイルのキャリブレーション結果は使わない
+        self.grid_calibration = None
+        
+        calibration = self.calibrate_drone_grid()
+        if calibration is None:
+            self.status_var.set("ドローン配置: 位置がありません")
+            return
+        self.status_var.set(f"ドローン配置: {describe(calibration)}")
+        mapped = int((calibration.cells >= 0).sum())
+        if mapped < len(calibration.cells):
+            messagebox.showwarning("警告", f"グリッドに対応しないドローンがあります "
+                                           f"({len(calibration.cells) - mapped}機)\n{describe(calibration)}")
+    
+    def calibrate_drone_grid(self):
+        """読み込んだドローンの位置を選択中のスクリーン設定 (列数 × 行数) でキャリブレーション（結果は保持）"""
+        if self.drone_positions is None or not len(self.drone_positions):
+            return None
         config = self.screen_configs[self.screen_size_var.get()]
-        direction = self.animation_direction.get()
-        total_frames = self.animation_frames.get()
-        duration_seconds = total_frames / 24.0  # 24fps
-        
-        # ピクセルデータをタプル形式に変換
-        pixels_str = "{\n"
-        for i, (x, y) in enumerate(self.current_led_data["pixels"]):
-            if i > 0 and i % 8 == 0:
-                pixels_str += "\n"
-            pixels_str += f"({x},{y}), "
-        pixels_str = pixels_str.rstrip(", ") + "\n}"
-        
-        script_content = f'''# Skybrush Custom Expression Function - アニメーション版
-# Generated by Font2LED Tool - Animation Export
-# Text: {self.text_var.get()} ({direction}、{total_frames}フレーム = {duration_seconds:.1f}秒 @ 24fps)
-#
-# 【重要】Blenderでの設定方法:
-# 1. Light Effectsパネルで新しいエフェクトを追加
-# 2. Type: COLOR_RAMP, Output: FUNCTION (Script)
-# 3. Frame範囲を設定:
-#    - 開始フレーム: 任意（例: 1）
-#    - 終了フレーム: 開始フレーム + {total_frames}
-#    - 例: Frame 1-{total_frames + 1} で{total_frames}フレームのアニメーション
-# 4. このスクリプトをFunction欄に貼り付け
-
-# グリッドサイズ設定
-GRID_WIDTH = {config["cols"]}
-GRID_HEIGHT = {config["rows"]}
-
-# 座標範囲（ドローン配置設定に基づく動的計算）
-# グリッド: {config["cols"]}列×{config["rows"]}行、間隔: {config["drone_spacing_m"]}m
-DRONE_SPACING = {config["drone_spacing_m"]}  # ドローン間隔(m)
-X_MIN = -(GRID_WIDTH - 1) * DRONE_SPACING / 2
-X_MAX = (GRID_WIDTH - 1) * DRONE_SPACING / 2
-Z_MIN = -(GRID_HEIGHT - 1) * DRONE_SPACING / 2
-Z_MAX = (GRID_HEIGHT - 1) * DRONE_SPACING / 2
-
-# アニメーション設定
-ANIMATION_FRAMES = {total_frames}  # 総フレーム数
-ANIMATION_DURATION = {duration_seconds:.1f}  # 秒数（{total_frames}フレーム ÷ 24fps）
-ANIMATION_DIRECTION = "{direction}"
-
-# ピクセルデータ（Grid座標）- Font2LED Tool出力
-PIXELS = {pixels_str}
-
-def animated_{text.replace(' ', '_')}_{direction_name}(frame, time_fraction, drone_index, formation_index, position, drone_count):
-    """
-    {direction}アニメーション - "{self.text_var.get()}"
+        transform = self.grid_calibration.transform if self.grid_calibration else None
+        if transform is None or (transform.cols, transform.rows) != (config["cols"], config["rows"]):
+            self.grid_calibration = calibrate_grid(self.drone_positions, config["cols"], config["rows"])
+        return self.grid_calibration
     
-    Args:
-        frame: フレーム番号
-        time_fraction: 時間進行度（0.0-1.0）
-                      ※Skybrushが自動計算: (現在frame - 開始frame) / (終了frame - 開始frame)
-        drone_index: ドローンインデックス
-        formation_index: フォーメーションインデックス
-        position: ドローンの3D座標 (x, y, z)
-        drone_count: ドローン総数
+    # === バックグラウンドエクスポート ===
     
-    Returns:
-        float: Color Ramp用のインデックス値（0.0-1.0）
-    """
+    def export_snapshot(self) -> ExportSnapshot:
+        """現在のフレーム・設定の読み取り専用スナップショット（ワーカースレッドに渡す）"""
+        config = self.screen_configs[self.screen_size_var.get()]
+        frames = tuple(ExportFrame(frame["text"], tuple(frame["color"]), snapshot_frame(frame["led_data"]))
+                       for frame in self.frames)
+        calibration = self.calibrate_drone_grid()
+        return ExportSnapshot(
+            frames=frames,
+            grid_rows=config["rows"],
+            grid_cols=config["cols"],
+            drone_spacing_m=config["drone_spacing_m"],
+            preview_rows=self.custom_rows_var.get(),
+            preview_cols=self.custom_cols_var.get(),
+            x_offset_adjustment=self.x_offset_adjustment,
+            y_offset_adjustment=self.y_offset_adjustment,
+            manual_positions=tuple((i, x, y) for i, (x, y) in self.manual_pixel_positions.items()),
+            animation_text=self.text_var.get(),
+            animation_direction=self.animation_direction.get(),
+            animation_frames=self.animation_frames.get(),
+            animation_source=snapshot_frame(self.current_led_data) if self.current_led_data else None,
+            compress_payload=self.compress_export_var.get(),
+            grid_transform=calibration.transform if calibration else None,
+            drone_cells=self.drone_cell_table(calibration),
+        )
     
-    # ドローンの現在位置を取得
-    x_pos = position[0]  # X座標
-    z_pos = position[2]  # Z座標（高さ）
+    def drone_cell_table(self, calibration):
+        """キャリブレーション結果の drone_index 順の (セル番号, x, z)（スクリプトの DRONE_CELLS の初期値）"""
+        if calibration is None:
+            return ()
+        xz = plane_coordinates(self.drone_positions)
+        return tuple(zip(calibration.cells.tolist(), xz[:, 0].tolist(), xz[:, 1].tolist()))
     
-    # 座標をグリッドインデックスに変換
-    if X_MAX > X_MIN and Z_MAX > Z_MIN:
-        # X軸: グリッド列 (0-{config["cols"]-1})
-        grid_x = int(round((x_pos - X_MIN) / (X_MAX - X_MIN) * (GRID_WIDTH - 1)))
-        
-        # Z軸: グリッド行 (0-{config["rows"]-1})、上下反転
-        grid_z = int(round((z_pos - Z_MIN) / (Z_MAX - Z_MIN) * (GRID_HEIGHT - 1)))
-        grid_z = {config["rows"]-1} - grid_z  # 上下反転
-        
-        # アニメーション計算: {direction}
-        {self._generate_animation_logic(direction, config)}
-        
-        # 範囲チェック
-        if 0 <= grid_x < GRID_WIDTH and 0 <= grid_z < GRID_HEIGHT:
-            # アニメーション適用：元のピクセル座標をオフセット分調整
-            for pixel_x, pixel_z in PIXELS:
-                # ピクセルのアニメーション後の座標
-                animated_pixel_x = pixel_x + animated_x_offset
-                animated_pixel_z = pixel_z + animated_z_offset
-                
-                # 現在のドローン位置と一致するかチェック
-                if (abs(animated_pixel_x - grid_x) < 0.5 and 
-                    abs(animated_pixel_z - grid_z) < 0.5):
-                    return 1.0  # 文字部分（Color Rampで色に変換）
-        
-        return 0.0  # 背景（黒）
-    else:
-        return 0.0  # エラー時（黒）
-'''
-        
-        try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(script_content)
-            
-            self.status_var.set(f"アニメーションエクスポート完了: {os.path.basename(filename)}")
-            messagebox.showinfo("エクスポート完了", 
-                              f"アニメーション付きCustom Expressionをエクスポートしました:\\n{filename}")
-            
-        except Exception as e:
-            messagebox.showerror("エラー", f"ファイル保存エラー: {e}")
+    def start_export(self, name, task, args, on_done):
+        """エクスポートをワーカースレッドで開始（進捗はステータスバーに表示）"""
+        def failed(error):
+            self.finish_export()
+            self.status_var.set(f"{name}失敗: {error}")
+            messagebox.showerror("エラー", f"ファイル保存エラー: {error}")
+        
+        def cancelled():
+            self.finish_export()
+            self.status_var.set(f"{name}をキャンセルしました")
+        
+        def completed(result):
+            self.finish_export()
+            on_done(result)
+        
+        def progress(done, total, message):
+            self.export_progress_var.set(done / total * 100 if total else 0)
+            self.status_var.set(f"{name}中... {done}/{total} {message}")
+        
+        if not self.export_runner.submit(name, task, args, completed, progress, failed, cancelled):
+            messagebox.showwarning("警告", "別のエクスポートを実行中です")
+            return
+        self.export_progress_var.set(0)
+        self.export_cancel_button.config(state=tk.NORMAL)
+        self.status_var.set(f"{name}中...")
+    
+    def cancel_export(self):
+        """実行中のエクスポートをキャンセル"""
+        self.export_runner.cancel()
+    
+    def finish_export(self):
+        """エクスポート終了時に進捗表示を戻す"""
+        self.export_progress_var.set(0)
+        self.export_cancel_button.config(state=tk.DISABLED)
     
-    def _generate_animation_logic(self, direction, config):
-        """アニメーションロジックのコード生成"""
-        if direction == "右→左":
-            return f'''        # 右から左へのスクロール
-        scroll_distance = GRID_WIDTH + {self.current_led_data["width"]}
-        animated_x_offset = int(scroll_distance * (1 - time_fraction)) - {self.current_led_data["width"]}
-        animated_z_offset = 0'''
-        elif direction == "左→右":
-            return f'''        # 左から右へのスクロール
-        scroll_distance = GRID_WIDTH + {self.current_led_data["width"]}
-        animated_x_offset = int(scroll_distance * time_fraction) - {self.current_led_data["width"]}
-        animated_z_offset = 0'''
-        elif direction == "上→下":
-            return f'''        # 上から下へのスクロール
-        scroll_distance = GRID_HEIGHT + {self.current_led_data["height"]}
-        animated_z_offset = int(scroll_distance * time_fraction) - {self.current_led_data["height"]}
-        animated_x_offset = 0'''
-        elif direction == "下→上":
-            return f'''        # 下から上へのスクロール
-        scroll_distance = GRID_HEIGHT + {self.current_led_data["height"]}
-        animated_z_offset = int(scroll_distance * (1 - time_fraction)) - {self.current_led_data["height"]}
-        animated_x_offset = 0'''
-
     def import_pixelmap(self):
         """ピクセルマップファイルをインポート"""
         filename = filedialog.askopenfilename(
@@ -1894,8 +1799,9 @@ def animated_{text.replace(' ', '_')}_{direction_name}(frame, time_fraction, dro
             # 現在のLEDデータとして設定
             self.current_led_data = led_data
             
-            # テキスト入力欄を更新
+            # テキスト入力欄を更新（インポート結果をライブプレビューで上書きしない）
             self.text_var.set(f"Import: {os.path.basename(filename)}")
+            self.cancel_live_preview()
             
             # 色が1つだけの場合は現在の色として設定
             if len(pixelmap_data.get('colors', {})) == 1:
@@ -1922,13 +1828,9 @@ def animated_{text.replace(' ', '_')}_{direction_name}(frame, time_fraction, dro
     
     def _pixelmap_to_led_data(self, pixelmap_data):
         """ピクセルマップデータをLED形式に変換"""
-        width = pixelmap_data['width']
-        height = pixelmap_data['height']
-        
-        # Font2LED形式のLEDデータを作成
         led_data = {
-            'width': width,
-            'height': height,
+            'width': pixelmap_data['width'],
+            'height': pixelmap_data['height'],
             'pixels': []
         }
         
@@ -1937,21 +1839,22 @@ def animated_{text.replace(' ', '_')}_{direction_name}(frame, time_fraction, dro
             if isinstance(pixelmap_data['pixels'][0], dict):
                 # 辞書形式の場合（カラー情報付き）
                 led_data['color_map'] = pixelmap_data.get('colors', {})
-                for pixel in pixelmap_data['pixels']:
-                    led_data['pixels'].append((pixel['x'], pixel['y'], pixel.get('color_id', 1)))
+                led_data['pixels'] = pixelmap_data['pixels']
             else:
                 # タプル形式の場合（座標のみ）
-                for pixel in pixelmap_data['pixels']:
-                    if isinstance(pixel, (list, tuple)) and len(pixel) >= 2:
-                        led_data['pixels'].append((pixel[0], pixel[1]))
+                led_data['pixels'] = [pixel[:2] for pixel in pixelmap_data['pixels']
+                                      if isinstance(pixel, (list, tuple)) and len(pixel) >= 2]
         
-        return led_data
+        # 配列ベースのLEDフレームに変換（色IDはパレットインデックスに置き換わる）
+        return LEDFrame.from_led_data(led_data)
     
     
     def on_closing(self):
         """アプリケーション終了時のクリーンアップ"""
         # アニメーション停止
         self.stop_animation()
+        self.cancel_preview_refresh()
+        self.export_runner.cancel()
         
         try:
             # 一時フォントディレクトリのクリーンアップ
@@ -1985,40 +1888,24 @@ def animated_{text.replace(' ', '_')}_{direction_name}(frame, time_fraction, dro
         grid_x = int(canvas_x // spacing)
         grid_y = int(canvas_y // spacing)
         
-        # 点灯しているピクセルか確認
-        x_offset = (config["cols"] - self.current_led_data["width"]) // 2 + self.x_offset_adjustment
-        y_offset = 0 + self.y_offset_adjustment
-        
-        # アニメーション中の位置も考慮
+        # 表示中のピクセルの空間インデックスでクリック位置のピクセルを引く
         time_fraction = self.animation_progress.get() if self.animation_enabled.get() else 0.0
-        if self.animation_enabled.get() and time_fraction > 0:
-            animated_pixels = self.calculate_animated_pixels(self.current_led_data, time_fraction)
-        else:
-            animated_pixels = self.current_led_data["pixels"]
-        
-        # クリック位置に点灯ピクセルがあるか確認
-        for i, pixel_data in enumerate(animated_pixels):
-            if isinstance(pixel_data, (list, tuple)):
-                x, y = pixel_data[0], pixel_data[1]
-                
-                # 手動で移動したピクセルの位置を確認
-                if i in self.manual_pixel_positions:
-                    led_x, led_y = self.manual_pixel_positions[i]
-                else:
-                    led_x = x + x_offset
-                    led_y = y + y_offset
-                
-                if led_x == grid_x and led_y == grid_y:
-                    # このピクセルをドラッグ開始
-                    self.dragging_pixel = {
-                        'index': i,
-                        'original_x': x,
-                        'original_y': y,
-                        'current_grid_x': led_x,
-                        'current_grid_y': led_y
-                    }
-                    self.drag_start_pos = (canvas_x, canvas_y)
-                    break
+        if self.pixel_hit_index is None:
+            self.build_pixel_hit_index(self.current_led_data, time_fraction)
+        
+        i = self.pixel_hit_index.pixel_at(grid_x, grid_y)
+        if i >= 0:
+            # このピクセルをドラッグ開始
+            led_x, led_y = self.pixel_hit_index.position(i)
+            self.dragging_pixel = {
+                'index': i,
+                'original_x': led_x - self.pixel_hit_offset[0],
+                'original_y': led_y - self.pixel_hit_offset[1],
+                'current_grid_x': led_x,
+                'current_grid_y': led_y
+            }
+            self.drag_start_pos = (canvas_x, canvas_y)
+            self.led_view.set_highlight((led_x, led_y))
     
     def on_canvas_drag(self, event):
         """キャンバスドラッグイベント"""
@@ -2055,49 +1942,29 @@ def animated_{text.replace(' ', '_')}_{direction_name}(frame, time_fraction, dro
             # 手動位置を記録
             self.manual_pixel_positions[self.dragging_pixel['index']] = (new_grid_x, new_grid_y)
             
-            # キャンバスを再描画
-            time_fraction = self.animation_progress.get() if self.animation_enabled.get() else 0.0
-            self.update_preview_canvas(self.current_led_data, time_fraction)
+            # 移動元・移動先のLEDだけ再描画
+            if self.pixel_hit_index is not None:
+                changed = self.pixel_hit_index.move(self.dragging_pixel['index'], new_grid_x, new_grid_y)
+                self.led_view.update_cells([c[0] for c in changed], [c[1] for c in changed],
+                                           [c[2] for c in changed])
+                self.led_view.set_highlight((new_grid_x, new_grid_y))
+            else:
+                time_fraction = self.animation_progress.get() if self.animation_enabled.get() else 0.0
+                self.update_preview_canvas(self.current_led_data, time_fraction)
     
     def on_canvas_release(self, event):
         """キャンバスマウスリリースイベント"""
         if self.dragging_pixel:
             self.status_var.set(f"ピクセルを移動しました: ({self.dragging_pixel['current_grid_x']}, {self.dragging_pixel['current_grid_y']})")
+            self.led_view.set_highlight(None)
         self.dragging_pixel = None
         self.drag_start_pos = None
     
     def get_final_pixel_positions(self, led_data):
         """手動移動を考慮した最終的なピクセル位置を取得"""
-        config = {
-            "cols": self.custom_cols_var.get(),
-            "rows": self.custom_rows_var.get()
-        }
-        
-        # オフセット計算
-        x_offset = (config["cols"] - led_data["width"]) // 2 + self.x_offset_adjustment
-        y_offset = 0 + self.y_offset_adjustment
-        
-        final_pixels = []
-        for i, pixel_data in enumerate(led_data["pixels"]):
-            if isinstance(pixel_data, (list, tuple)):
-                x, y = pixel_data[0], pixel_data[1]
-                
-                # 手動で移動した位置があればそれを使用
-                if i in self.manual_pixel_positions:
-                    led_x, led_y = self.manual_pixel_positions[i]
-                else:
-                    led_x = x + x_offset
-                    led_y = y + y_offset
-                
-                # グリッド範囲内のピクセルのみ追加
-                if 0 <= led_x < config["cols"] and 0 <= led_y < config["rows"]:
-                    # カラー情報も含める
-                    if len(pixel_data) > 2:
-                        final_pixels.append((led_x, led_y, pixel_data[2]))
-                    else:
-                        final_pixels.append((led_x, led_y))
-        
-        return final_pixels
+        return final_pixel_positions(LEDFrame.from_led_data(led_data), self.custom_cols_var.get(),
+                                     self.custom_rows_var.get(), self.x_offset_adjustment,
+                                     self.y_offset_adjustment, self.manual_pixel_positions)
     
     def reset_manual_positions(self):
         """手動編集位置をリセット"""
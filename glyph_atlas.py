@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+グリフアトラス
+文字セット全体を事前にラスタライズし、ビットパックしたアトラスファイルとして保存する。
+実行時は np.memmap で開くため起動直後からFreeTypeを使わずに描画でき、
+複数プロセスで同じページを共有できる。
+
+ファイル構成（リトルエンディアン）:
+    ヘッダ (64バイト) : マジック, バージョン, グリフ数, 高さ, 幅, 1行のバイト数, フォントハッシュ
+    codepoints        : uint32[count]  昇順のコードポイント
+    widths            : uint8[count]   空白列を除いた実際の文字幅（空白文字は0）
+    bitmaps           : uint8[count, height, row_bytes]  行ごとにMSB先頭でビットパック
+
+アトラスはフォントファイルのハッシュで名前付けされるため、フォントを編集すると自動的に再生成される。
+
+使い方:
+    python glyph_atlas.py                       # 同梱フォント (k8x12, マルミーニャ) のアトラスを生成
+    python glyph_atlas.py FONT_PATH [W H]       # 指定フォントのアトラスを生成
+"""
+
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import freetype
+import numpy as np
+
+from glyph_raster import rasterize_char
+
+ATLAS_MAGIC = b"F2LATLS1"
+ATLAS_VERSION = 1
+ATLAS_EXT = ".f2latlas"
+# magic(8s) version(I) count(I) height(H) width(H) row_bytes(H) reserved(H) font_hash(32s) padding(8x)
+HEADER_FORMAT = "<8sIIHHHH32s8x"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+DEFAULT_ATLAS_DIR = Path(__file__).parent / "glyph_atlas"
+DEFAULT_CHARSETS = ("ascii", "kana", "jis1", "jis2")
+
+
+def _jis_rows(first_row: int, last_row: int) -> List[str]:
+    """JIS X 0208 の区範囲（1始まり）の文字をEUC-JP経由で列挙"""
+    chars = []
+    for row in range(first_row, last_row + 1):
+        for cell in range(1, 95):
+            try:
+                chars.append(bytes([0xA0 + row, 0xA0 + cell]).decode("euc_jp"))
+            except UnicodeDecodeError:
+                continue
+    return chars
+
+
+def build_charset(names: Iterable[str] = DEFAULT_CHARSETS) -> List[str]:
+    """文字セット名から文字リストを作成
+
+    ascii: 印字可能ASCII / kana: JIS第1〜8区（記号・英数・かな・ギリシャ・キリル・罫線）
+    jis1: JIS第1水準漢字 / jis2: JIS第2水準漢字
+    """
+    chars = []
+    for name in names:
+        if name == "ascii":
+            chars.extend(chr(c) for c in range(0x20, 0x7F))
+        elif name == "kana":
+            chars.extend(_jis_rows(1, 8))
+        elif name == "jis1":
+            chars.extend(_jis_rows(16, 47))
+        elif name == "jis2":
+            chars.extend(_jis_rows(48, 84))
+        else:
+            raise ValueError(f"Unknown charset: {name}")
+    # 重複を除去してコードポイント順に並べる
+    return sorted(set(chars), key=ord)
+
+
+def font_file_hash(font_path: str) -> str:
+    """フォントファイル内容のSHA-256（先頭32桁）"""
+    digest = hashlib.sha256()
+    with open(font_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+def atlas_path_for(font_path: str, face_index: int, pixel_size: Tuple[int, int],
+                   height: int, width: int, font_hash: str,
+                   atlas_dir: Path = DEFAULT_ATLAS_DIR) -> Path:
+    """アトラスファイルのパスを作成
+
+    ファイル名の先頭は ASCII に縮めたフォント名と、フォントの絶対パスのハッシュ（8桁）。
+    日本語名など ASCII にならないフォント名でもフォントごとに別の名前になる。
+    """
+    stem = Path(font_path).stem.encode("ascii", "ignore").decode("ascii") or "font"
+    path_id = hashlib.sha256(str(Path(font_path).resolve()).encode("utf-8")).hexdigest()[:8]
+    name = f"{stem}-{path_id}_{face_index}_{pixel_size[0]}x{pixel_size[1]}_{height}x{width}_{font_hash[:16]}{ATLAS_EXT}"
+    return Path(atlas_dir) / name
+
+
+def build_atlas(font_path: str, output_path: Path, face_index: int = 0,
+                pixel_size: Tuple[int, int] = (12, 10), height: int = 10, width: int = 12,
+                charsets: Iterable[str] = DEFAULT_CHARSETS,
+                font_hash: Optional[str] = None) -> Path:
+    """文字セットをラスタライズしてアトラスファイルを書き出す"""
+    if font_hash is None:
+        font_hash = font_file_hash(font_path)
+
+    face = freetype.Face(font_path, face_index)
+    face.set_pixel_sizes(*pixel_size)
+
+    codepoints = []
+    glyphs = []
+    for char in build_charset(charsets):
+        # フォントに含まれない文字は収録しない（FreeType側のフォールバックに任せる）
+        if char != " " and face.get_char_index(char) == 0:
+            continue
+        try:
+            glyphs.append(rasterize_char(face, char, height, width))
+        except Exception as e:
+            print(f"Warning: Failed to rasterize '{char}': {e}")
+            continue
+        codepoints.append(ord(char))
+
+    count = len(codepoints)
+    row_bytes = (width + 7) // 8
+    if count:
+        stack = np.stack(glyphs)
+        columns = stack.any(axis=1)  # (count, width)
+        widths = np.where(columns.any(axis=1),
+                          width - np.argmax(columns[:, ::-1], axis=1), 0).astype(np.uint8)
+        packed = np.packbits(stack, axis=2)
+    else:
+        widths = np.zeros(0, dtype=np.uint8)
+        packed = np.zeros((0, height, row_bytes), dtype=np.uint8)
+
+    header = struct.pack(HEADER_FORMAT, ATLAS_MAGIC, ATLAS_VERSION, count,
+                         height, width, row_bytes, 0, font_hash.encode("ascii"))
+
+    # 他プロセスが読み込み中でも壊れないよう、一時ファイルに書いてから置き換える
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=output_path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(np.asarray(codepoints, dtype="<u4").tobytes())
+            f.write(widths.tobytes())
+            f.write(packed.tobytes())
+        # 他のユーザー・プロセスからも読めるようにする（mkstempは0600で作成する）
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, output_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    print(f"Built glyph atlas: {output_path.name} ({count} glyphs)")
+    return output_path
+
+
+class GlyphAtlas:
+    """メモリマップしたグリフアトラス"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise ValueError(f"Invalid atlas file: {self.path}")
+
+        magic, version, count, height, width, row_bytes, _, font_hash = struct.unpack(HEADER_FORMAT, header)
+        if magic != ATLAS_MAGIC or version != ATLAS_VERSION:
+            raise ValueError(f"Unsupported atlas file: {self.path}")
+
+        self.count = count
+        self.height = height
+        self.width = width
+        self.row_bytes = row_bytes
+        self.font_hash = font_hash.decode("ascii")
+
+        offset = HEADER_SIZE
+        if count:
+            self.codepoints = np.memmap(self.path, dtype="<u4", mode="r", offset=offset, shape=(count,))
+            offset += 4 * count
+            self.widths = np.memmap(self.path, dtype=np.uint8, mode="r", offset=offset, shape=(count,))
+            offset += count
+            self.bitmaps = np.memmap(self.path, dtype=np.uint8, mode="r", offset=offset,
+                                     shape=(count, height, row_bytes))
+        else:
+            self.codepoints = np.zeros(0, dtype="<u4")
+            self.widths = np.zeros(0, dtype=np.uint8)
+            self.bitmaps = np.zeros((0, height, row_bytes), dtype=np.uint8)
+
+    def index_of(self, char: str) -> int:
+        """文字のインデックスを返す（収録されていない場合は-1）"""
+        if len(char) != 1 or not self.count:
+            return -1
+        codepoint = ord(char)
+        i = int(np.searchsorted(self.codepoints, codepoint))
+        if i < self.count and self.codepoints[i] == codepoint:
+            return i
+        return -1
+
+    def __contains__(self, char: str) -> bool:
+        return self.index_of(char) >= 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def get(self, char: str) -> Optional[np.ndarray]:
+        """(height, width) のビットマップを返す（収録されていない場合はNone）"""
+        i = self.index_of(char)
+        if i < 0:
+            return None
+        return np.unpackbits(self.bitmaps[i], axis=1, count=self.width)
+
+    def get_glyph(self, char: str) -> Optional[Tuple[np.ndarray, int]]:
+        """(ビットマップ, 文字幅) を返す（収録されていない場合はNone）"""
+        i = self.index_of(char)
+        if i < 0:
+            return None
+        return np.unpackbits(self.bitmaps[i], axis=1, count=self.width), int(self.widths[i])
+
+    def trimmed_width(self, char: str) -> Optional[int]:
+        """空白列を除いた文字幅を返す（収録されていない場合はNone）"""
+        i = self.index_of(char)
+        if i < 0:
+            return None
+        return int(self.widths[i])
+
+    def matches(self, height: int, width: int) -> bool:
+        """正規化サイズが一致するか"""
+        return self.height == height and self.width == width
+
+
+def _remove_stale_atlases(current: Path):
+    """同じフォント（パス）・サイズでハッシュが異なる古いアトラスを削除
+
+    ファイル名がフォント内容のハッシュ（末尾16桁）以外すべて一致するものだけを対象にする。
+    """
+    prefix = current.name[:-(len(ATLAS_EXT) + 16)]
+    for path in current.parent.glob(f"*{ATLAS_EXT}"):
+        old_hash = path.name[len(prefix):-len(ATLAS_EXT)]
+        if (path != current and path.name.startswith(prefix) and len(old_hash) == 16
+                and all(c in "0123456789abcdef" for c in old_hash)):
+            try:
+                path.unlink()
+                print(f"Removed stale glyph atlas: {path.name}")
+            except OSError:
+                pass
+
+
+def load_atlas(font_path: str, face_index: int = 0, pixel_size: Tuple[int, int] = (12, 10),
+               height: int = 10, width: int = 12, atlas_dir: Path = DEFAULT_ATLAS_DIR,
+               build: bool = True, charsets: Iterable[str] = DEFAULT_CHARSETS) -> Optional[GlyphAtlas]:
+    """フォントに対応するアトラスを開く
+
+    フォントファイルのハッシュが変わっていれば（または未生成なら）build=True の場合に再生成する。
+    アトラスが利用できない場合はNoneを返す。
+    """
+    try:
+        font_hash = font_file_hash(font_path)
+        path = atlas_path_for(font_path, face_index, pixel_size, height, width, font_hash, atlas_dir)
+        if not path.exists():
+            if not build:
+                return None
+            build_atlas(font_path, path, face_index, pixel_size, height, width, charsets, font_hash)
+            _remove_stale_atlases(path)
+        atlas = GlyphAtlas(path)
+        if atlas.font_hash != font_hash:
+            return None
+        return atlas
+    except Exception as e:
+        print(f"Warning: Glyph atlas unavailable for {os.path.basename(font_path)}: {e}")
+        return None
+
+
+def main():
+    """アトラスの一括生成"""
+    font2led_dir = Path(__file__).parent
+    if len(sys.argv) > 1:
+        pixel_size = (int(sys.argv[2]), int(sys.argv[3])) if len(sys.argv) > 3 else (12, 10)
+        targets = [(sys.argv[1], pixel_size)]
+    else:
+        targets = [
+            (str(font2led_dir / "k8x12_ttf_2021-05-05" / "k8x12.ttf"), (12, 12)),
+            (str(font2led_dir / "k8x12_ttf_2021-05-05" / "k8x12L.ttf"), (12, 12)),
+            (str(font2led_dir / "k8x12_ttf_2021-05-05" / "k8x12S.ttf"), (12, 12)),
+            (str(font2led_dir / "x12y12pxMaruMinya_2023-07-14" / "x12y12pxMaruMinya.ttf"), (12, 12)),
+        ]
+
+    for font_path, pixel_size in targets:
+        if not os.path.exists(font_path):
+            print(f"SKIP Font not found: {font_path}")
+            continue
+        atlas = load_atlas(font_path, pixel_size=pixel_size)
+        if atlas is not None:
+            print(f"{os.path.basename(font_path)}: {len(atlas)} glyphs -> {atlas.path}")
+
+
+if __name__ == "__main__":
+    main()
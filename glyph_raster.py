@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+グリフラスタライズ共通処理
+FreeTypeのモノクロビットマップをNumPy配列に変換する（Font2LED / GUI 共通）
+"""
+
+import os
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+import freetype
+import numpy as np
+
+
+def unpack_mono_bitmap(bitmap) -> np.ndarray:
+    """FreeTypeのモノクロビットマップを (rows, width) のuint8配列に展開
+
+    bitmap.buffer はPythonリストを毎回生成するため使わず、
+    FT_Bitmapのバッファをpitch付きでゼロコピー参照してから一括でunpackbitsする。
+    戻り値はFreeTypeのバッファとは独立した配列。
+    """
+    rows, width, pitch = bitmap.rows, bitmap.width, abs(bitmap.pitch)
+    if rows <= 0 or width <= 0 or pitch <= 0:
+        return np.zeros((0, 0), dtype=np.uint8)
+
+    # (rows, pitch) バイト列としてゼロコピーで参照
+    packed = np.ctypeslib.as_array(bitmap._FT_Bitmap.buffer, shape=(rows, pitch))
+    # 1行ずつMSB先頭でビット展開し、パディング分を幅で切り落とす
+    return np.unpackbits(packed, axis=1, count=width)
+
+
+def normalize_glyph(glyph: np.ndarray, height: int, width: int) -> np.ndarray:
+    """グリフを (height, width) の固定サイズに正規化
+
+    下揃えで配置し、高さが超える場合は下から height 行、幅が超える場合は左から width 列を取る。
+    """
+    normalized = np.zeros((height, width), dtype=np.uint8)
+    h, w = glyph.shape
+    if h == 0 or w == 0:
+        return normalized
+
+    src = glyph[max(0, h - height):, :min(w, width)]
+    normalized[height - src.shape[0]:, :src.shape[1]] = src
+    return normalized
+
+
+def rasterize_char(face: freetype.Face, char: str, height: int, width: int) -> np.ndarray:
+    """文字をモノクロでレンダリングし、(height, width) に正規化したビットマップを返す"""
+    face.load_char(char, freetype.FT_LOAD_RENDER | freetype.FT_LOAD_MONOCHROME)
+    return normalize_glyph(unpack_mono_bitmap(face.glyph.bitmap), height, width)
+
+
+def trimmed_width(bitmap: np.ndarray) -> int:
+    """空白列を除いた実際の文字幅（点灯列が無ければ0）"""
+    columns = np.flatnonzero(bitmap.any(axis=0))
+    return int(columns[-1]) + 1 if columns.size else 0
+
+
+def font_identity(font_path: str) -> Tuple[str, int, int]:
+    """キャッシュキー用のフォントファイル識別子（絶対パス・サイズ・更新時刻）"""
+    stat = os.stat(font_path)
+    return (os.path.abspath(font_path), stat.st_size, stat.st_mtime_ns)
+
+
+class GlyphCache:
+    """LRU方式のグリフビットマップキャッシュ
+
+    キーは (フォント識別子, フェイス番号, ピクセルサイズ, 正規化高さ, 正規化幅, 文字)。
+    ビットマップと一緒に空白列を除いた文字幅も保持し、レイアウト時の再計算を省く。
+    格納したビットマップの合計バイト数が max_bytes を超えると古いものから破棄する。
+    格納したビットマップは読み取り専用になるので、呼び出し側で書き換えないこと。
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[np.ndarray, int]]" = OrderedDict()
+
+    @staticmethod
+    def make_key(font_id: Hashable, face_index: int, pixel_size: Tuple[int, int],
+                 height: int, width: int, char: str) -> Tuple:
+        """キャッシュキーを作成"""
+        return (font_id, face_index, tuple(pixel_size), height, width, char)
+
+    def get_glyph(self, key: Hashable) -> Optional[Tuple[np.ndarray, int]]:
+        """キャッシュから (ビットマップ, 文字幅) を取得（無ければNone）"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """キャッシュからビットマップを取得（無ければNone）"""
+        entry = self.get_glyph(key)
+        return entry[0] if entry is not None else None
+
+    def put_glyph(self, key: Hashable, bitmap: np.ndarray,
+                  width: Optional[int] = None) -> Tuple[np.ndarray, int]:
+        """ビットマップと文字幅を格納し、上限を超えた分を古い順に破棄"""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.current_bytes -= old[0].nbytes
+
+        if width is None:
+            width = trimmed_width(bitmap)
+        bitmap.flags.writeable = False
+        entry = (bitmap, int(width))
+        self._entries[key] = entry
+        self.current_bytes += bitmap.nbytes
+
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted.nbytes
+        return entry
+
+    def put(self, key: Hashable, bitmap: np.ndarray) -> np.ndarray:
+        """ビットマップを格納し、上限を超えた分を古い順に破棄"""
+        return self.put_glyph(key, bitmap)[0]
+
+    def set_max_bytes(self, max_bytes: int):
+        """メモリ上限を変更（超過分は即座に破棄）"""
+        self.max_bytes = max_bytes
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted.nbytes
+
+    def clear(self):
+        """キャッシュを空にする（統計値もリセット）"""
+        self._entries.clear()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict:
+        """ヒット数・ミス数・使用量を返す"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Font2LED / GUI で共有するデフォルトのグリフキャッシュ
+shared_glyph_cache = GlyphCache()
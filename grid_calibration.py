@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+グリッドキャリブレーション
+実際のドローン（またはLEDエンプティ）の配置から、位置 → グリッド (列, 行) の変換を推定する。
+
+全ドローンの座標 (x, z) から最近傍の向きでグリッドの回転を、座標のまとまりで仮の列・行番号を求め、
+原点・列方向・行方向を一度の最小二乗法で当てはめる。計算は全ドローン分をまとめて行う O(N)。
+推定した変換 GridTransform と drone_index → セル番号の表を、エクスポート・Blender用スクリプトで共通に使う。
+"""
+
+import csv
+import json
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# 座標の差がこの割合（全体の幅に対する）以下のドローンは同じ列・行とみなす
+SAME_LINE_RATIO = 1e-3
+# 最近傍ドローンとの距離に対してこの割合を超える座標の隙間を列（行）の間とみなす
+LINE_GAP_RATIO = 0.5
+# 向きの推定で最近傍を探すドローン数の上限
+NEIGHBOR_SAMPLES = 512
+
+
+class GridTransform(NamedTuple):
+    """位置 (x, z) ↔ グリッド (列, 行) のアフィン変換（行0が上、列0が左）
+
+    origin_x / origin_z : セル (0, 0) の位置
+    col_dx / col_dz     : 列が1増えたときの位置の移動量
+    row_dx / row_dz     : 行が1増えたときの位置の移動量
+    """
+    origin_x: float
+    origin_z: float
+    col_dx: float
+    col_dz: float
+    row_dx: float
+    row_dz: float
+    cols: int
+    rows: int
+
+    @classmethod
+    def regular(cls, cols: int, rows: int, spacing: float) -> "GridTransform":
+        """原点を中心とする間隔 spacing の軸平行なグリッド（エクスポートの既定の配置）"""
+        return cls(-(cols - 1) * spacing / 2, (rows - 1) * spacing / 2,
+                   spacing, 0.0, 0.0, -spacing, cols, rows)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "GridTransform":
+        return cls(*(float(data[name]) for name in cls._fields[:6]), int(data["cols"]), int(data["rows"]))
+
+    def to_dict(self) -> Dict:
+        return self._asdict()
+
+    def inverse(self) -> Tuple[float, float, float, float]:
+        """(col_from_x, col_from_z, row_from_x, row_from_z)。変換が縮退している場合はすべて0"""
+        det = self.col_dx * self.row_dz - self.row_dx * self.col_dz
+        if abs(det) < 1e-12:
+            return 0.0, 0.0, 0.0, 0.0
+        return self.row_dz / det, -self.row_dx / det, -self.col_dz / det, self.col_dx / det
+
+    @property
+    def spacing(self) -> Tuple[float, float]:
+        """列方向・行方向の間隔"""
+        return float(np.hypot(self.col_dx, self.col_dz)), float(np.hypot(self.row_dx, self.row_dz))
+
+    @property
+    def angle_deg(self) -> float:
+        """列方向のx軸からの回転角（度）"""
+        return float(np.degrees(np.arctan2(self.col_dz, self.col_dx)))
+
+    def rows_from_bottom(self) -> "GridTransform":
+        """行0を下にした変換（行番号を下から数えるスクリプト用）"""
+        return self._replace(origin_x=self.origin_x + (self.rows - 1) * self.row_dx,
+                             origin_z=self.origin_z + (self.rows - 1) * self.row_dz,
+                             row_dx=-self.row_dx, row_dz=-self.row_dz)
+
+    def fractional_grid(self, positions) -> np.ndarray:
+        """位置の配列 (N, 2|3) → 小数のグリッド座標 (N, 2) [列, 行]"""
+        xz = plane_coordinates(positions)
+        col_x, col_z, row_x, row_z = self.inverse()
+        dx = xz[:, 0] - self.origin_x
+        dz = xz[:, 1] - self.origin_z
+        return np.stack((dx * col_x + dz * col_z, dx * row_x + dz * row_z), axis=1)
+
+    def grid_position(self, position) -> Tuple[int, int]:
+        """1つの位置 (x, y, z) → 最も近いグリッド (列, 行)（範囲外もそのまま返す）"""
+        col_x, col_z, row_x, row_z = self.inverse()
+        dx = position[0] - self.origin_x
+        dz = position[2] - self.origin_z
+        return int(round(dx * col_x + dz * col_z)), int(round(dx * row_x + dz * row_z))
+
+
+class GridCalibration(NamedTuple):
+    """キャリブレーション結果
+
+    cells    : (N,) int32。drone_index → セル番号 (行 * cols + 列)、グリッドから外れたドローンは -1
+    residual : 当てはめ後の位置の二乗平均誤差
+    """
+    transform: GridTransform
+    cells: np.ndarray
+    residual: float
+
+    def to_dict(self) -> Dict:
+        return {"transform": self.transform.to_dict(), "cells": self.cells.tolist(),
+                "residual": self.residual}
+
+
+def plane_coordinates(positions) -> np.ndarray:
+    """位置の配列 (N, 3) の (x, z)、または (N, 2) をそのまま float64 で返す"""
+    array = np.asarray(positions, dtype=np.float64)
+    array = array.reshape(-1, array.shape[-1]) if array.size else np.zeros((0, 3))
+    return array[:, [0, 2]] if array.shape[1] >= 3 else array[:, :2]
+
+
+def _grid_orientation(xz: np.ndarray) -> Tuple[float, float]:
+    """最近傍ドローンへの向きから (グリッドの回転角（ラジアン、-45°〜45°）, 最近傍との距離の中央値) を推定
+
+    向きを4倍した角度の平均を取るため、列方向・行方向のどちらの近傍でも同じ角度になる。
+    全ドローンとの距離は最大 NEIGHBOR_SAMPLES 機分だけ計算する。
+    """
+    sample = xz[np.linspace(0, len(xz) - 1, min(len(xz), NEIGHBOR_SAMPLES)).astype(np.int64)]
+    offsets = xz[None, :, :] - sample[:, None, :]
+    distances = np.hypot(offsets[..., 0], offsets[..., 1])
+    distances[distances <= 1e-9] = np.inf  # 自分自身と同じ位置のドローン
+    nearest = np.argmin(distances, axis=1)
+    valid = np.isfinite(distances[np.arange(len(sample)), nearest])
+    if not valid.any():
+        return 0.0, 0.0
+    vectors = offsets[np.arange(len(sample)), nearest][valid]
+    quad = 4 * np.arctan2(vectors[:, 1], vectors[:, 0])
+    angle = float(np.arctan2(np.sin(quad).sum(), np.cos(quad).sum()) / 4)
+    return angle, float(np.median(np.hypot(vectors[:, 0], vectors[:, 1])))
+
+
+def _line_indices(values: np.ndarray, min_gap: float) -> Tuple[np.ndarray, float]:
+    """1方向の座標を列（行）にまとめ、(各ドローンの仮の番号 (N,) int64, 間隔) を返す
+
+    min_gap を超える隙間で区切り、まとまりごとの平均座標の差の中央値を間隔とする
+    （抜けた列があっても番号は飛ばして付ける）。
+    """
+    order = np.argsort(values)
+    ordered = values[order]
+    gaps = np.diff(ordered)
+    if gaps.size == 0 or gaps.max() <= min_gap:
+        return np.zeros(len(values), dtype=np.int64), 0.0
+    breaks = np.flatnonzero(gaps > min_gap) + 1
+    starts = np.concatenate(([0], breaks))
+    centers = np.add.reduceat(ordered, starts) / np.diff(np.append(starts, len(ordered)))
+    spacing = float(np.median(np.diff(centers)))
+    line_numbers = np.rint((centers - centers[0]) / spacing).astype(np.int64)
+    indices = np.empty(len(values), dtype=np.int64)
+    indices[order] = np.repeat(line_numbers, np.diff(np.append(starts, len(ordered))))
+    return indices, spacing
+
+
+def _densest_window(indices: np.ndarray, count: Optional[int]) -> np.ndarray:
+    """番号の範囲が count を超える場合、ドローンが最も多い連続 count 本が 0 から始まるようにずらす"""
+    indices = indices - indices.min()
+    if not count or indices.max() < count:
+        return indices
+    totals = np.concatenate(([0], np.cumsum(np.bincount(indices))))
+    start = int(np.argmax(totals[count:] - totals[:-count]))
+    return indices - start
+
+
+def _fit(xz: np.ndarray, grid: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """xz ≈ [1, 列, 行] @ params を最小二乗で解き、(params (3, 2), 残差 (N, 2)) を返す"""
+    design = np.column_stack((np.ones(len(xz)), grid.astype(np.float64)))
+    params = np.linalg.lstsq(design, xz, rcond=None)[0]
+    return params, xz - design @ params
+
+
+def calibrate_grid(positions, cols: Optional[int] = None, rows: Optional[int] = None,
+                   tolerance: float = 0.25) -> GridCalibration:
+    """ドローンの位置の配列 (drone_index 順) からグリッドの変換とセル番号の表を推定
+
+    Args:
+        positions: (N, 3) の (x, y, z)、または (N, 2) の (x, z)
+        cols / rows: グリッドの列数・行数（分かっている場合。範囲外のドローンの判定に使う）
+        tolerance: 最も近いグリッド点からこの値（間隔に対する割合）以上離れたドローンはグリッド外 (-1)
+
+    列は x 軸に近い方の向き（x が増える向き）、行は上から下の向きに数える。
+    """
+    xz = plane_coordinates(positions)
+    if len(xz) == 0:
+        return GridCalibration(GridTransform.regular(cols or 0, rows or 0, 0.0),
+                               np.zeros(0, dtype=np.int32), 0.0)
+
+    # 向き：最近傍の向きから求めた角度で、x 軸に近い方を列方向（x が増える向き）にする
+    angle, neighbor_distance = _grid_orientation(xz)
+    col_dir = np.array([np.cos(angle), np.sin(angle)])
+    row_dir = np.array([col_dir[1], -col_dir[0]])  # 列方向を時計回りに90度（上 → 下）
+
+    # 列方向・行方向の座標をそれぞれ列・行にまとめて仮の番号を付ける
+    u = xz @ col_dir
+    v = xz @ row_dir
+    min_gap = max(neighbor_distance * LINE_GAP_RATIO, max(float(np.ptp(u)), float(np.ptp(v))) * SAME_LINE_RATIO)
+    col_index, col_spacing = _line_indices(u, min_gap)
+    row_index, row_spacing = _line_indices(v, min_gap)
+    col_spacing = col_spacing or row_spacing or 1.0
+    row_spacing = row_spacing or col_spacing
+    grid = np.stack((_densest_window(col_index, cols), _densest_window(row_index, rows)), axis=1)
+
+    # 原点・列方向・行方向をグリッド内のドローンで最小二乗で当てはめ
+    # （列・行が1本だけの方向は仮の向きと間隔を使う）
+    inside = ((grid[:, 0] < (cols or grid[:, 0].max() + 1)) & (grid[:, 0] >= 0) &
+              (grid[:, 1] < (rows or grid[:, 1].max() + 1)) & (grid[:, 1] >= 0))
+    params, _ = _fit(xz[inside], grid[inside])
+    if np.ptp(grid[inside, 0]) == 0:
+        params[1] = col_dir * col_spacing
+    if np.ptp(grid[inside, 1]) == 0:
+        params[2] = row_dir * row_spacing
+    transform = GridTransform(*params.ravel().tolist(),
+                              int(cols or grid[:, 0].max() + 1), int(rows or grid[:, 1].max() + 1))
+
+    # 当てはめた変換で番号を付け直し、グリッド点から離れたドローンと範囲外を除く
+    fractional = transform.fractional_grid(xz)
+    nearest = np.rint(fractional).astype(np.int64)
+    error = np.abs(fractional - nearest).max(axis=1)
+    on_grid = ((error <= tolerance) &
+               (nearest[:, 0] >= 0) & (nearest[:, 0] < transform.cols) &
+               (nearest[:, 1] >= 0) & (nearest[:, 1] < transform.rows))
+    cells = np.where(on_grid, nearest[:, 1] * transform.cols + nearest[:, 0], -1).astype(np.int32)
+
+    fitted = (transform.origin_x + nearest[:, 0] * transform.col_dx + nearest[:, 1] * transform.row_dx,
+              transform.origin_z + nearest[:, 0] * transform.col_dz + nearest[:, 1] * transform.row_dz)
+    deviation = xz - np.stack(fitted, axis=1)
+    residual = float(np.sqrt((deviation[on_grid] ** 2).sum(axis=1).mean())) if on_grid.any() else 0.0
+    return GridCalibration(transform, cells, residual)
+
+
+def load_positions(path: str) -> np.ndarray:
+    """ドローンの位置ファイル（drone_index 順）を (N, 3) 配列として読み込む
+
+    JSON: [[x, y, z], ...] または {"positions": [[x, y, z], ...]}
+    CSV : 1行に x, y, z（数値でない見出し行は読み飛ばす）
+    """
+    if path.lower().endswith(".json"):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get("positions", [])
+        return np.asarray(data, dtype=np.float64).reshape(-1, 3)
+
+    rows = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for record in csv.reader(f):
+            try:
+                rows.append([float(value) for value in record[:3]])
+            except ValueError:
+                continue
+    return np.asarray(rows, dtype=np.float64).reshape(-1, 3)
+
+
+def describe(calibration: GridCalibration) -> str:
+    """キャリブレーション結果の1行の説明"""
+    transform = calibration.transform
+    col_spacing, row_spacing = transform.spacing
+    mapped = int((calibration.cells >= 0).sum())
+    return (f"{transform.cols}列×{transform.rows}行、間隔 {col_spacing:.3f} × {row_spacing:.3f}、"
+            f"回転 {transform.angle_deg:.2f}°、対応 {mapped}/{len(calibration.cells)}機、"
+            f"誤差 {calibration.residual:.4f}")
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+LEDアニメーション
+スクロールアニメーションのオフセット計算と、プレビュー再生用の事前計算フレームキャッシュ。
+"""
+
+import time
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from led_frame import LEDFrame
+
+# スクロール方向 → (スクロール軸, 逆向きか)。x軸は列、y軸は行（エクスポートではz）
+SCROLL_AXES = {
+    "右→左": ("x", True),
+    "左→右": ("x", False),
+    "上→下": ("y", False),
+    "下→上": ("y", True),
+}
+# エクスポート（Skybrush）と同じフレームレート
+ANIMATION_FPS = 24.0
+
+
+def scroll_offsets(direction: str, time_fractions, screen_cols: int, screen_rows: int,
+                   width: int, height: int) -> np.ndarray:
+    """進行度の配列に対するスクロールオフセット (F, 2) int64 [dx, dy]
+
+    time_fraction = 0 で画面外の開始位置、1 で反対側の画面外。
+    プレビューと各エクスポートで共通の計算式（アニメーションのエクスポートはフレームごとの表として出力）。
+    """
+    fractions = np.atleast_1d(np.asarray(time_fractions, dtype=np.float64))
+    offsets = np.zeros((fractions.size, 2), dtype=np.int64)
+    axis = SCROLL_AXES.get(direction)
+    if axis is None:
+        return offsets
+
+    name, reverse = axis
+    if name == "x":
+        column, distance, size = 0, screen_cols + width, width
+    else:
+        column, distance, size = 1, screen_rows + height, height
+    progress = 1 - fractions if reverse else fractions
+    offsets[:, column] = np.trunc(distance * progress).astype(np.int64) - size
+    return offsets
+
+
+def scroll_offset(direction: str, time_fraction: float, screen_cols: int, screen_rows: int,
+                  width: int, height: int) -> Tuple[int, int]:
+    """1フレーム分のスクロールオフセット (dx, dy)"""
+    dx, dy = scroll_offsets(direction, time_fraction, screen_cols, screen_rows, width, height)[0].tolist()
+    return dx, dy
+
+
+def scrolled_frame(source: LEDFrame, direction: str, time_fraction: float,
+                   screen_cols: int, screen_rows: int) -> LEDFrame:
+    """スクロール後にスクリーン (screen_cols × screen_rows) に入る部分のビュー（配列はコピーしない）"""
+    dx, dy = scroll_offset(direction, time_fraction, screen_cols, screen_rows, source.width, source.height)
+    return source.offset(dx, dy).clip_to_grid(screen_cols, screen_rows)
+
+
+class AnimationFrames:
+    """事前計算したアニメーションフレーム
+
+    packed  : (frames, rows, ceil(cols / 8)) uint8。各フレームの点灯状態を行ごとにビットパック
+    offsets : (frames, 2) int64。元フレームからスクリーン座標への移動量 (dx, dy)
+    フレーム0はアニメーション前の静止位置。
+    """
+
+    def __init__(self, source: LEDFrame, key: Hashable, packed: np.ndarray, offsets: np.ndarray,
+                 rows: int, cols: int, windows: np.ndarray):
+        self.source = source
+        self.key = key
+        self.packed = packed
+        self.offsets = offsets
+        self.rows = rows
+        self.cols = cols
+        self.windows = windows
+
+    @property
+    def frame_count(self) -> int:
+        return self.packed.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.packed.nbytes + self.offsets.nbytes + self.windows.nbytes
+
+    def matches(self, source, key: Hashable) -> bool:
+        """同じ元フレーム・条件で作成したキャッシュか"""
+        return self.source is source and self.key == key
+
+    def index_for(self, time_fraction: float) -> int:
+        """進行度 (0.0-1.0) に対応するフレーム番号"""
+        # f / frames で指定された進行度が丸め誤差で前のフレームにならないよう僅かに足す
+        return min(max(int(time_fraction * self.frame_count + 1e-9), 0), self.frame_count - 1)
+
+    def mask(self, index: int) -> np.ndarray:
+        """(rows, cols) bool の点灯状態"""
+        return np.unpackbits(self.packed[index], axis=1, count=self.cols).astype(bool)
+
+    def is_lit(self, index: int, x: int, y: int) -> bool:
+        """スクリーン座標 (x, y) のLEDが点灯しているか"""
+        if not (0 <= x < self.cols and 0 <= y < self.rows):
+            return False
+        return bool(self.packed[index, y, x >> 3] & (0x80 >> (x & 7)))
+
+    def frame(self, index: int) -> LEDFrame:
+        """スクリーン座標に配置したフレームのビュー（色情報付き）"""
+        x0, y0, x1, y1 = self.windows[index].tolist()
+        dx, dy = self.offsets[index].tolist()
+        return self.source.crop(x0, y0, x1, y1).offset(dx, dy).clip_to_grid(self.cols, self.rows)
+
+
+def build_animation_frames(source: LEDFrame, key: Hashable, direction: str, frame_count: int,
+                           screen_cols: int, screen_rows: int, grid_cols: int, grid_rows: int,
+                           x_offset: int = 0, y_offset: int = 0) -> AnimationFrames:
+    """全フレームの点灯状態を事前計算
+
+    screen_cols / screen_rows はスクロール距離の基準となるスクリーンサイズ（エクスポートと同じ）、
+    grid_cols / grid_rows は描画先グリッドのサイズ。
+    フレーム0はアニメーション前の静止位置で、x_offset / y_offset に配置する。
+    """
+    frame_count = max(int(frame_count), 1)
+    offsets = scroll_offsets(direction, np.arange(frame_count) / float(frame_count),
+                             screen_cols, screen_rows, source.width, source.height)
+    offsets[0] = (x_offset, y_offset)
+
+    # windows は元フレーム座標での表示範囲（スクロール中はスクリーン内のみ）
+    unbounded = 1 << 30
+    windows = np.empty((frame_count, 4), dtype=np.int64)
+    windows[:, 0] = -offsets[:, 0]
+    windows[:, 1] = -offsets[:, 1]
+    windows[:, 2] = screen_cols - offsets[:, 0]
+    windows[:, 3] = screen_rows - offsets[:, 1]
+    windows[0] = (-unbounded, -unbounded, unbounded, unbounded)
+
+    # 全フレームの座標を一括で計算して点灯状態を書き込む
+    pixels = source.pixels.astype(np.int32)
+    xs = pixels[None, :, 0] + offsets[:, 0, None].astype(np.int32)  # (F, N)
+    ys = pixels[None, :, 1] + offsets[:, 1, None].astype(np.int32)
+    inside = ((pixels[None, :, 0] >= windows[:, 0, None]) & (pixels[None, :, 0] < windows[:, 2, None]) &
+              (pixels[None, :, 1] >= windows[:, 1, None]) & (pixels[None, :, 1] < windows[:, 3, None]) &
+              (xs >= 0) & (xs < grid_cols) & (ys >= 0) & (ys < grid_rows))
+    masks = np.zeros((frame_count, grid_rows, grid_cols), dtype=bool)
+    frame_index, pixel_index = np.nonzero(inside)
+    masks[frame_index, ys[frame_index, pixel_index], xs[frame_index, pixel_index]] = True
+
+    return AnimationFrames(source, key, np.packbits(masks, axis=2), offsets,
+                           grid_rows, grid_cols, windows)
+
+
+class PlaybackClock:
+    """単調増加タイマーによるアニメーション再生クロック
+
+    経過時間から表示すべきフレームを求めるため、描画が遅れてもアニメーション全体の長さは変わらない。
+    遅れた分のフレームはスキップし、実際の描画FPS・描画時間を集計する。
+    """
+
+    def __init__(self, fps: float = ANIMATION_FPS, clock: Callable[[], float] = time.perf_counter):
+        self.fps = fps
+        self.clock = clock
+        self.start_time = 0.0
+        self.paused_at: Optional[float] = None
+        self.last_frame = -1
+        self.reset_stats()
+
+    def reset_stats(self):
+        """統計値をリセット"""
+        self.rendered_frames = 0
+        self.dropped_frames = 0
+        self.render_time_total = 0.0
+        self.render_time_max = 0.0
+        self.stats_start = self.clock()
+
+    def start(self, start_frame: int = 0):
+        """start_frame から再生を開始"""
+        self.start_time = self.clock() - start_frame / self.fps
+        self.paused_at = None
+        self.last_frame = start_frame - 1
+        self.reset_stats()
+
+    def pause(self):
+        """一時停止（経過時間を止める）"""
+        if self.paused_at is None:
+            self.paused_at = self.clock()
+
+    def resume(self):
+        """一時停止を解除（停止していた時間だけ開始時刻をずらす）"""
+        if self.paused_at is not None:
+            self.start_time += self.clock() - self.paused_at
+            self.paused_at = None
+
+    @property
+    def paused(self) -> bool:
+        return self.paused_at is not None
+
+    def elapsed(self) -> float:
+        """再生開始からの経過秒数（一時停止中は停止時点）"""
+        now = self.paused_at if self.paused_at is not None else self.clock()
+        return now - self.start_time
+
+    def current_frame(self) -> int:
+        """経過時間に対応するフレーム番号"""
+        return int(self.elapsed() * self.fps)
+
+    def delay_until(self, frame: int) -> int:
+        """frame の表示時刻までの待ち時間（ミリ秒、最小1）"""
+        remaining = (self.start_time + frame / self.fps) - self.clock()
+        return max(1, int(remaining * 1000 + 0.5))
+
+    def record(self, frame: int, render_seconds: float):
+        """描画したフレームと描画時間を記録（飛ばしたフレーム数も集計）"""
+        if self.last_frame >= 0 and frame > self.last_frame + 1:
+            self.dropped_frames += frame - self.last_frame - 1
+        self.last_frame = frame
+        self.rendered_frames += 1
+        self.render_time_total += render_seconds
+        self.render_time_max = max(self.render_time_max, render_seconds)
+
+    def stats(self) -> Dict:
+        """実測FPS・平均/最大描画時間（ミリ秒）・スキップしたフレーム数"""
+        wall = self.clock() - self.stats_start
+        rendered = self.rendered_frames
+        return {
+            "fps": rendered / wall if wall > 0 else 0.0,
+            "render_ms_avg": self.render_time_total / rendered * 1000 if rendered else 0.0,
+            "render_ms_max": self.render_time_max * 1000,
+            "rendered": rendered,
+            "dropped": self.dropped_frames,
+        }
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+LEDキャンバス描画
+LEDスクリーンのキャンバスアイテムをジオメトリごとに一度だけ作成して保持し、
+更新時は点灯状態・色が変わったLEDだけを itemconfig で書き換える（リテインドモード）。
+アイテムは表示範囲に入ったセルだけ作成し、ズームはアイテムの拡大縮小で行う。
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 消灯LEDの色
+OFF_FILL = "#202020"
+OFF_OUTLINE = "#404040"
+# 点灯状態キーの「消灯」
+LED_OFF = -1
+
+
+def color_keys(rgb: np.ndarray) -> np.ndarray:
+    """RGB(0.0-1.0) の (N, 3) 配列を点灯状態キー (N,) int64 に変換
+
+    下位24ビットが輪郭色、上位24ビットがエミッション効果の明るい色。
+    """
+    rgb = np.asarray(rgb, dtype=np.float64).reshape(-1, 3)
+    base = (rgb * 255).astype(np.int64)
+    bright = np.minimum(255, (rgb * 255 * 1.3).astype(np.int64))
+    base_key = (base[:, 0] << 16) | (base[:, 1] << 8) | base[:, 2]
+    bright_key = (bright[:, 0] << 16) | (bright[:, 1] << 8) | bright[:, 2]
+    return base_key | (bright_key << 24)
+
+
+def led_state(rows: int, cols: int, xs: np.ndarray, ys: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """点灯LEDのグリッド座標とキーから (rows, cols) の点灯状態行列を作成
+
+    グリッド外の座標は無視し、同じセルに複数ある場合は後のものを優先する。
+    """
+    xs = np.asarray(xs, dtype=np.int64)
+    ys = np.asarray(ys, dtype=np.int64)
+    keys = np.asarray(keys, dtype=np.int64)
+    inside = (xs >= 0) & (xs < cols) & (ys >= 0) & (ys < rows)
+
+    state = np.full((rows, cols), LED_OFF, dtype=np.int64)
+    state[ys[inside], xs[inside]] = keys[inside]
+    return state
+
+
+def hex_color(value: int) -> str:
+    """キーの下位24ビットを #rrggbb に変換"""
+    return f"#{value & 0xFFFFFF:06x}"
+
+
+def visible_cells(viewport: Optional[Tuple[float, float, float, float]], spacing: float,
+                  rows: int, cols: int, margin: int = 1) -> Tuple[int, int, int, int]:
+    """キャンバス座標の表示範囲 (x0, y0, x1, y1) に入るセル範囲 (row0, row1, col0, col1)
+
+    viewport が None の場合はグリッド全体。margin セル分だけ広げる。
+    """
+    if viewport is None or spacing <= 0:
+        return 0, rows, 0, cols
+    x0, y0, x1, y1 = viewport
+    col0 = min(max(int(x0 // spacing) - margin, 0), cols)
+    row0 = min(max(int(y0 // spacing) - margin, 0), rows)
+    col1 = min(max(int(x1 // spacing) + 1 + margin, col0), cols)
+    row1 = min(max(int(y1 // spacing) + 1 + margin, row0), rows)
+    return row0, row1, col0, col1
+
+
+class LEDCanvasView:
+    """LEDグリッドのキャンバスアイテムを保持して差分更新するビュー
+
+    各セルに 背景（消灯LED）・グロー・点灯LED の3アイテムを持ち、
+    点灯・消灯は state の切り替え、色の変化は fill / outline の変更で表す。
+    アイテムは表示範囲 (viewport) に入ったセルだけ作成し、ズームは canvas.scale で行う。
+    """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.geometry: Optional[Tuple[int, int, int]] = None
+        self.build_spacing = 0  # アイテムを作成した時のセル間隔（以後は scale_factor 倍で表示）
+        self.viewport: Optional[Tuple[float, float, float, float]] = None
+        self.glow_items = np.zeros((0, 0), dtype=np.int64)
+        self.led_items = np.zeros((0, 0), dtype=np.int64)
+        self.materialized = np.zeros((0, 0), dtype=bool)
+        self.state = np.zeros((0, 0), dtype=np.int64)
+        self.highlight_item = None
+        self.highlight_cell: Optional[Tuple[int, int]] = None
+        self.updated_items = 0  # 直前の render で書き換えたLED数
+
+    @property
+    def rows(self) -> int:
+        return self.state.shape[0]
+
+    @property
+    def cols(self) -> int:
+        return self.state.shape[1]
+
+    @property
+    def scale_factor(self) -> float:
+        """作成時のセル間隔に対する現在の表示倍率"""
+        return self.geometry[2] / self.build_spacing if self.build_spacing else 1.0
+
+    def cell_bounds(self, row: int, col: int, size: int) -> Tuple[int, int, int, int]:
+        """作成時のセル間隔でセル中心に置いた直径 size の円の外接矩形"""
+        spacing = self.build_spacing
+        center_x = col * spacing + spacing // 2
+        center_y = row * spacing + spacing // 2
+        return (center_x - size // 2, center_y - size // 2,
+                center_x + size // 2, center_y + size // 2)
+
+    def ensure_grid(self, rows: int, cols: int, spacing: int,
+                    viewport: Optional[Tuple[float, float, float, float]] = None) -> bool:
+        """ジオメトリが変わった場合だけアイテムを作り直す（作り直した場合True）
+
+        行数・列数が同じでセル間隔だけ変わった場合（ズーム）は canvas.scale で拡大縮小する。
+        viewport は変更後のセル間隔でのキャンバス座標の表示範囲。
+        """
+        if viewport is not None:
+            self.viewport = viewport
+        if self.geometry == (rows, cols, spacing):
+            return False
+        if self.geometry is not None and self.geometry[:2] == (rows, cols) and spacing > 0:
+            factor = spacing / self.geometry[2]
+            self.canvas.scale("all", 0, 0, factor, factor)
+            self.geometry = (rows, cols, spacing)
+            self.materialize_visible()
+            return False
+
+        self.canvas.delete("all")
+        self.geometry = (rows, cols, spacing)
+        self.build_spacing = spacing
+        self.glow_items = np.zeros((rows, cols), dtype=np.int64)
+        self.led_items = np.zeros((rows, cols), dtype=np.int64)
+        self.materialized = np.zeros((rows, cols), dtype=bool)
+        self.state = np.full((rows, cols), LED_OFF, dtype=np.int64)
+
+        # ドラッグ中のピクセルのハイライト（1つだけ作って移動する）
+        self.highlight_item = self.canvas.create_oval(0, 0, 0, 0, fill="", outline="yellow",
+                                                      width=3, state="hidden")
+        self.highlight_cell = None
+        self.materialize_visible()
+        return True
+
+    def set_viewport(self, x0: float, y0: float, x1: float, y1: float):
+        """キャンバス座標の表示範囲を設定し、新しく見えたセルのアイテムを作成"""
+        self.viewport = (x0, y0, x1, y1)
+        if self.geometry is not None:
+            self.materialize_visible()
+
+    def materialize_visible(self):
+        """表示範囲内でまだ作成していないセルのアイテムを作成"""
+        row0, row1, col0, col1 = visible_cells(self.viewport, self.geometry[2], self.rows, self.cols)
+        missing_rows, missing_cols = np.nonzero(~self.materialized[row0:row1, col0:col1])
+        if missing_rows.size == 0:
+            return
+
+        led_size = max(4, int(self.build_spacing // 4))
+        glow_size = led_size + 4
+        for row, col in zip((missing_rows + row0).tolist(), (missing_cols + col0).tolist()):
+            # LED球体（消灯時は暗いグレー）
+            self.canvas.create_oval(*self.cell_bounds(row, col, led_size),
+                                    fill=OFF_FILL, outline=OFF_OUTLINE, width=1, tags=("pending",))
+            # グロー効果（外側の輪）と点灯LED。消灯中は非表示
+            self.glow_items[row, col] = self.canvas.create_oval(
+                *self.cell_bounds(row, col, glow_size), fill="", outline="", width=2, state="hidden",
+                tags=("pending",))
+            self.led_items[row, col] = self.canvas.create_oval(
+                *self.cell_bounds(row, col, led_size), fill="", outline="", width=2, state="hidden",
+                tags=("pending",))
+            self.materialized[row, col] = True
+
+        # 作成時の間隔で作ったアイテムを現在のズームに合わせる
+        if self.scale_factor != 1.0:
+            self.canvas.scale("pending", 0, 0, self.scale_factor, self.scale_factor)
+        self.canvas.dtag("pending", "pending")
+        if self.highlight_item is not None:
+            self.canvas.tag_raise(self.highlight_item)
+
+        # 新しいアイテムに現在の点灯状態を反映
+        rows = missing_rows + row0
+        cols = missing_cols + col0
+        lit = self.state[rows, cols] != LED_OFF
+        self._apply(rows[lit].tolist(), cols[lit].tolist(), self.state[rows[lit], cols[lit]].tolist())
+
+    def render(self, xs: np.ndarray, ys: np.ndarray, keys: np.ndarray,
+               highlight: Optional[Tuple[int, int]] = None):
+        """点灯LEDのグリッド座標と点灯状態キーを反映（変化したLEDだけ書き換え）
+
+        highlight は (x, y) のセル。
+        """
+        state = led_state(self.rows, self.cols, xs, ys, keys)
+        changed = (state != self.state)
+        self.updated_items = int(np.count_nonzero(changed))
+        # アイテムを作成していないセルは状態だけ保持
+        changed_rows, changed_cols = np.nonzero(changed & self.materialized)
+        self._apply(changed_rows.tolist(), changed_cols.tolist(), state[changed_rows, changed_cols].tolist())
+        self.state = state
+
+        self.set_highlight(highlight)
+
+    def update_cells(self, xs: Sequence[int], ys: Sequence[int], keys: Sequence[int]):
+        """指定セルだけ点灯状態を書き換える（ドラッグ編集などの部分更新用、LED_OFFで消灯）"""
+        cells = [(y, x, key) for x, y, key in zip(xs, ys, keys)
+                 if 0 <= x < self.cols and 0 <= y < self.rows and self.state[y, x] != key]
+        for row, col, key in cells:
+            self.state[row, col] = key
+        visible = [cell for cell in cells if self.materialized[cell[0], cell[1]]]
+        self._apply([c[0] for c in visible], [c[1] for c in visible], [c[2] for c in visible])
+        self.updated_items = len(cells)
+
+    def _apply(self, rows: List[int], cols: List[int], keys: List[int]):
+        """セルのアイテムを点灯状態キーに合わせて書き換え"""
+        for row, col, key in zip(rows, cols, keys):
+            glow = int(self.glow_items[row, col])
+            led = int(self.led_items[row, col])
+            if key == LED_OFF:
+                self.canvas.itemconfig(glow, state="hidden")
+                self.canvas.itemconfig(led, state="hidden")
+            else:
+                outline = hex_color(key)
+                self.canvas.itemconfig(glow, outline=outline, state="normal")
+                self.canvas.itemconfig(led, fill=hex_color(key >> 24), outline=outline, state="normal")
+
+    def set_highlight(self, cell: Optional[Tuple[int, int]]):
+        """ドラッグ中のハイライトを (x, y) のセルに移動（Noneで非表示）"""
+        if cell is not None and not (0 <= cell[0] < self.cols and 0 <= cell[1] < self.rows):
+            cell = None
+        if cell == self.highlight_cell or self.highlight_item is None:
+            return
+        if cell is None:
+            self.canvas.itemconfig(self.highlight_item, state="hidden")
+        else:
+            led_size = max(4, int(self.build_spacing // 4))
+            factor = self.scale_factor
+            bounds = [v * factor for v in self.cell_bounds(cell[1], cell[0], led_size + 8)]
+            self.canvas.coords(self.highlight_item, *bounds)
+            self.canvas.itemconfig(self.highlight_item, state="normal")
+        self.highlight_cell = cell
+
+    def invalidate(self):
+        """次回の ensure_grid でアイテムを作り直す"""
+        self.geometry = None
+
+
+class PixelHitIndex:
+    """グリッドセル → ピクセル番号 の空間インデックス
+
+    プレビューに表示中のピクセル座標を保持し、クリック位置のピクセルを O(1) で引く。
+    同じセルに複数ある場合は描画と同じく後のピクセルを返す。
+    """
+
+    def __init__(self, rows: int, cols: int, xs: np.ndarray, ys: np.ndarray, keys: np.ndarray):
+        self.xs = np.array(xs, dtype=np.int64)
+        self.ys = np.array(ys, dtype=np.int64)
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.grid = np.full((rows, cols), -1, dtype=np.int64)
+        inside = (self.xs >= 0) & (self.xs < cols) & (self.ys >= 0) & (self.ys < rows)
+        self.grid[self.ys[inside], self.xs[inside]] = np.flatnonzero(inside)
+
+    def _inside(self, x: int, y: int) -> bool:
+        return 0 <= y < self.grid.shape[0] and 0 <= x < self.grid.shape[1]
+
+    def pixel_at(self, x: int, y: int) -> int:
+        """セル (x, y) のピクセル番号（無ければ-1）"""
+        return int(self.grid[y, x]) if self._inside(x, y) else -1
+
+    def key_at(self, x: int, y: int) -> int:
+        """セル (x, y) の点灯状態キー"""
+        index = self.pixel_at(x, y)
+        return int(self.keys[index]) if index >= 0 else LED_OFF
+
+    def position(self, index: int) -> Tuple[int, int]:
+        return int(self.xs[index]), int(self.ys[index])
+
+    def move(self, index: int, x: int, y: int) -> List[Tuple[int, int, int]]:
+        """ピクセルを (x, y) に移動し、表示が変わるセルの (x, y, キー) を返す"""
+        old_x, old_y = self.position(index)
+        self.xs[index] = x
+        self.ys[index] = y
+
+        changed = []
+        if self._inside(old_x, old_y) and self.grid[old_y, old_x] == index:
+            # 元のセルに重なっていた他のピクセルがあればそれを表示
+            others = np.flatnonzero((self.xs == old_x) & (self.ys == old_y))
+            self.grid[old_y, old_x] = others[-1] if others.size else -1
+            changed.append((old_x, old_y, self.key_at(old_x, old_y)))
+        if self._inside(x, y):
+            self.grid[y, x] = index
+            changed.append((x, y, int(self.keys[index])))
+        return changed
@@ -0,0 +1,862 @@
+#!/usr/bin/env python3
+"""
+LEDエクスポート
+GUIの状態から作成した読み取り専用のスナップショットを受け取り、
+JSON・Custom Expression・アニメーションスクリプト・プレビュー画像を書き出す。
+ワーカースレッドから呼ばれるため、Tkの変数・ウィジェットには触れない。
+"""
+
+import base64
+import json
+import os
+import shutil
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from led_animation import ANIMATION_FPS, scroll_offsets
+from grid_calibration import GridTransform
+from led_frame import LEDFrame
+from led_raster import shared_raster_renderer
+
+# JSON・タイムド Custom Expression での1フレーム（テキスト）あたりの表示フレーム数
+FRAME_INTERVAL = 20
+
+# スクロール方向 → ファイル名・関数名に使う英語名
+SCROLL_FILE_NAMES = {
+    "右→左": "scroll_right_to_left",
+    "左→右": "scroll_left_to_right",
+    "上→下": "scroll_top_to_bottom",
+    "下→上": "scroll_bottom_to_top",
+}
+
+
+class ExportFrame(NamedTuple):
+    """エクスポートするフレーム（テキスト・色・読み取り専用のLEDフレーム）"""
+    text: str
+    color: Tuple[float, float, float]
+    frame: LEDFrame
+
+
+class ExportSnapshot(NamedTuple):
+    """エクスポート開始時点の設定とフレームのスナップショット
+
+    grid_rows / grid_cols は選択中のスクリーン設定、preview_rows / preview_cols は
+    カスタム設定（手動移動を含むピクセル位置の計算に使う）。
+    manual_positions は (ピクセル番号, x, y) のタプル。
+    compress_payload が True の場合、スクリプトのデータを zlib 圧縮 + base64 で埋め込む。
+    grid_transform は実際のドローン配置から推定した位置 → グリッドの変換（None は設定の間隔の規則配置）。
+    drone_cells は読み込んだドローン配置の drone_index 順の (セル番号, x, z)（グリッド外のセル番号は -1）。
+    """
+    frames: Tuple[ExportFrame, ...]
+    grid_rows: int
+    grid_cols: int
+    drone_spacing_m: float
+    preview_rows: int
+    preview_cols: int
+    x_offset_adjustment: int
+    y_offset_adjustment: int
+    manual_positions: Tuple[Tuple[int, int, int], ...]
+    animation_text: str
+    animation_direction: str
+    animation_frames: int
+    animation_source: Optional[LEDFrame]
+    compress_payload: bool = False
+    grid_transform: Optional[GridTransform] = None
+    drone_cells: Tuple[Tuple[int, float, float], ...] = ()
+
+
+def snapshot_frame(led_data) -> LEDFrame:
+    """led_data を読み取り専用の LEDFrame に変換（書き込み可能な配列はコピーする）"""
+    frame = LEDFrame.from_led_data(led_data)
+    if not frame.mask.flags.writeable:
+        return frame
+    return LEDFrame(frame.mask.copy(), frame.origin,
+                    frame.color_index.copy() if frame.color_index is not None else None,
+                    frame.palette.copy() if frame.palette is not None else None).freeze()
+
+
+def centered_offset(frame: LEDFrame, cols: int, x_adjustment: int, y_adjustment: int) -> Tuple[int, int]:
+    """水平方向のセンタリング + 位置調整（行数が足りない場合は下が切れるように上から配置）"""
+    return (cols - frame.width) // 2 + x_adjustment, 0 + y_adjustment
+
+
+def final_pixel_positions(frame: LEDFrame, cols: int, rows: int, x_adjustment: int, y_adjustment: int,
+                          manual_positions) -> List[Tuple[int, ...]]:
+    """手動移動を考慮した最終的なピクセル位置（色情報があれば (x, y, color_id)）
+
+    manual_positions は ピクセル番号 → (x, y) の辞書、または (ピクセル番号, x, y) の列。
+    """
+    if isinstance(manual_positions, dict):
+        manual_positions = [(i, x, y) for i, (x, y) in manual_positions.items()]
+
+    x_offset, y_offset = centered_offset(frame, cols, x_adjustment, y_adjustment)
+    positions = frame.pixels.astype(np.int64)
+    positions[:, 0] += x_offset
+    positions[:, 1] += y_offset
+
+    # 手動で移動した位置があればそれを使用
+    for i, led_x, led_y in manual_positions:
+        if i < len(positions):
+            positions[i] = (led_x, led_y)
+
+    # グリッド範囲内のピクセルのみ追加
+    inside = ((positions[:, 0] >= 0) & (positions[:, 0] < cols) &
+              (positions[:, 1] >= 0) & (positions[:, 1] < rows))
+    positions = positions[inside].tolist()
+
+    # カラー情報も含める
+    if frame.colors is not None:
+        colors = frame.colors[inside].tolist()
+        return [(x, y, color_id) for (x, y), color_id in zip(positions, colors)]
+    return [tuple(position) for position in positions]
+
+
+def write_text_atomic(path: str, content: str):
+    """一時ファイルに書いてから置き換える（キャンセル・エラー時に書きかけのファイルを残さない）"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".font2led_", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def pack_pixels(pixels: Sequence[Tuple[int, int]], cols: int, rows: int) -> bytes:
+    """点灯ピクセルを grid_z * cols + grid_x 番目のビット（行優先、上位ビットから）としてパック"""
+    bits = np.zeros(rows * cols, dtype=bool)
+    if len(pixels):
+        xy = np.asarray(pixels, dtype=np.int64).reshape(-1, 2)
+        inside = (xy[:, 0] >= 0) & (xy[:, 0] < cols) & (xy[:, 1] >= 0) & (xy[:, 1] < rows)
+        bits[xy[inside, 1] * cols + xy[inside, 0]] = True
+    return np.packbits(bits).tobytes()
+
+
+# 圧縮したデータを埋め込むスクリプトの先頭に付ける import
+PAYLOAD_IMPORTS = "import base64\nimport zlib\n\n"
+
+
+def payload_literal(data: bytes, compress: bool = False, line_width: int = 64, indent: str = "    ") -> str:
+    """スクリプトに埋め込むバイト列を、line_width 文字ごとに改行した文字列リテラルにする
+
+    compress=False は16進、True は zlib 圧縮して base64 にした文字列（payload_decoder で元に戻す）。
+    """
+    if compress:
+        text = base64.b64encode(zlib.compress(data, 9)).decode("ascii")
+    else:
+        text = data.hex()
+    lines = [text[i:i + line_width] for i in range(0, len(text), line_width)] or [""]
+    return "\n".join(f'{indent}"{line}"' for line in lines)
+
+
+def payload_format(compress: bool = False) -> str:
+    """スクリプトのコメントに書くデータ形式"""
+    return "zlib圧縮 + base64" if compress else "16進"
+
+
+def payload_decoder(name: str, compress: bool = False) -> str:
+    """payload_literal で埋め込んだ変数 name をバイト列に戻すスクリプト側の式"""
+    if compress:
+        return f"zlib.decompress(base64.b64decode({name}))"
+    return f"bytes.fromhex({name})"
+
+
+def pixel_mask_literal(pixels: Sequence[Tuple[int, int]], cols: int, rows: int, compress: bool = False,
+                       line_width: int = 64, indent: str = "    ") -> str:
+    """点灯ピクセルをビットパックした文字列リテラル（pack_pixels と同じビット順）"""
+    return payload_literal(pack_pixels(pixels, cols, rows), compress, line_width, indent)
+
+
+def export_grid_transform(snapshot: ExportSnapshot) -> GridTransform:
+    """スクリプトに埋め込む位置 → グリッドの変換（キャリブレーション結果がグリッドと合わなければ規則配置）"""
+    transform = snapshot.grid_transform
+    if transform is None or (transform.cols, transform.rows) != (snapshot.grid_cols, snapshot.grid_rows):
+        return GridTransform.regular(snapshot.grid_cols, snapshot.grid_rows, snapshot.drone_spacing_m)
+    return transform
+
+
+def grid_transform_literal(snapshot: ExportSnapshot) -> str:
+    """_drone_cell が使う変換の定数（原点と、位置の差 → 列・行の係数）と位置の許容誤差"""
+    transform = export_grid_transform(snapshot)
+    col_x, col_z, row_x, row_z = transform.inverse()
+    if transform == snapshot.grid_transform:
+        source = "ドローン配置から推定"
+    else:
+        source = f"ドローン配置設定の規則配置、間隔 {snapshot.drone_spacing_m}m"
+    return "\n".join((
+        f"# 位置 → グリッド座標の変換（{source}、読み込み時に一度だけ計算）",
+        "# 列 = (x - GRID_ORIGIN_X) * COL_FROM_X + (z - GRID_ORIGIN_Z) * COL_FROM_Z、行も同様（行0が上）",
+        f"GRID_ORIGIN_X = {transform.origin_x!r}",
+        f"GRID_ORIGIN_Z = {transform.origin_z!r}",
+        f"COL_FROM_X = {col_x!r}",
+        f"COL_FROM_Z = {col_z!r}",
+        f"ROW_FROM_X = {row_x!r}",
+        f"ROW_FROM_Z = {row_z!r}",
+        f"POSITION_TOLERANCE = {min(transform.spacing) * 0.25!r}  # グリッド間隔の1/4",
+    ))
+
+
+def drone_cells_literal(snapshot: ExportSnapshot, per_line: int = 4, indent: str = "    ") -> str:
+    """DRONE_CELLS の初期値にする drone_index 順の (セル番号, x, z) の表
+
+    読み込んだドローン配置から推定した変換をスクリプトに埋め込む場合だけ作成し、それ以外は空の表。
+    位置は POSITION_TOLERANCE との比較にだけ使うため小数4桁に丸める。
+    """
+    lines = ["# ドローン番号 → (セル番号, x, z)（読み込んだドローン配置から推定、グリッド外は -1）"]
+    if snapshot.drone_cells and export_grid_transform(snapshot) == snapshot.grid_transform:
+        entries = [f"({int(cell)}, {x:.4f}, {z:.4f})," for cell, x, z in snapshot.drone_cells]
+        lines.append("DRONE_CELL_TABLE = (")
+        lines.extend(indent + " ".join(entries[i:i + per_line]) for i in range(0, len(entries), per_line))
+        lines.append(")")
+    else:
+        lines.append("DRONE_CELL_TABLE = ()")
+    return "\n".join(lines)
+
+
+def int_table_literal(values: Sequence[int], per_line: int = 16, indent: str = "    ") -> str:
+    """整数列をタプルの要素（per_line 個ごとに改行）の文字列に変換"""
+    lines = [", ".join(str(int(v)) for v in values[i:i + per_line]) + ","
+             for i in range(0, len(values), per_line)]
+    return "\n".join(indent + line for line in lines)
+
+
+# === JSON ===
+
+def write_json(filename: str, snapshot: ExportSnapshot, job) -> str:
+    """JSONファイルとしてエクスポート"""
+    export_data = {
+        "metadata": {
+            "grid_width": snapshot.grid_cols,
+            "grid_height": snapshot.grid_rows,
+            "frame_count": len(snapshot.frames),
+            "font": "JF-Dot-k12x10",
+            "created": datetime.now().isoformat()
+        },
+        "frames": []
+    }
+    if snapshot.grid_transform is not None:
+        export_data["metadata"]["grid_transform"] = snapshot.grid_transform.to_dict()
+
+    total = len(snapshot.frames)
+    for i, frame in enumerate(snapshot.frames):
+        job.report(i, total, frame.text)
+        frame_data = {
+            "frame": i * FRAME_INTERVAL,  # 20フレーム間隔
+            "text": frame.text,
+            "pixels": []
+        }
+
+        led_data = frame.frame
+        color_map = led_data.get('color_map')
+
+        # 手動移動を考慮した最終位置を取得
+        final_pixels = final_pixel_positions(led_data, snapshot.preview_cols, snapshot.preview_rows,
+                                             snapshot.x_offset_adjustment, snapshot.y_offset_adjustment,
+                                             snapshot.manual_positions)
+
+        for pixel in final_pixels:
+            pixel_data = {
+                "x": int(pixel[0]),
+                "y": int(pixel[1]),
+                "r": frame.color[0],
+                "g": frame.color[1],
+                "b": frame.color[2]
+            }
+
+            # カラーマップがある場合は色を上書き
+            if color_map and len(pixel) > 2:
+                color_id = str(pixel[2])
+                if color_id in color_map:
+                    color_rgb = color_map[color_id]
+                    if isinstance(color_rgb, (list, tuple)) and len(color_rgb) >= 3:
+                        pixel_data["r"] = color_rgb[0]
+                        pixel_data["g"] = color_rgb[1]
+                        pixel_data["b"] = color_rgb[2]
+
+            frame_data["pixels"].append(pixel_data)
+
+        export_data["frames"].append(frame_data)
+
+    job.report(total, total, "保存中")
+    write_text_atomic(filename, json.dumps(export_data, ensure_ascii=False, indent=2))
+    return filename
+
+
+# === Custom Expression ===
+
+# Custom Expression テンプレート（正しいSkybrush関数形式）
+CUSTOM_EXPRESSION_TEMPLATE = '''# Skybrush Custom Expression Function
+# Generated by Font2LED Tool - {timestamp}
+# Text: {text_content}
+
+{payload_imports}# グリッドサイズ設定
+GRID_WIDTH = {grid_cols}
+GRID_HEIGHT = {grid_rows}
+
+{grid_transform}
+
+# ピクセルデータ（点灯マスク、{payload_format}）
+# grid_z * GRID_WIDTH + grid_x 番目のビットが点灯（行優先、上位ビットから）
+PIXEL_MASK_DATA = (
+{pixel_mask}
+)
+PIXELS = None  # 初回の呼び出し時に展開する1セル1バイトの参照テーブル
+
+def _load_tables():
+    """PIXEL_MASK_DATA を参照テーブルに展開して保持（変換が縮退している場合はすべて消灯）"""
+    global PIXELS
+    mask = {pixel_mask_decoder}
+    if (COL_FROM_X or COL_FROM_Z) and (ROW_FROM_X or ROW_FROM_Z):
+        PIXELS = bytes((mask[i >> 3] >> (7 - (i & 7))) & 1 for i in range(GRID_WIDTH * GRID_HEIGHT))
+    else:
+        PIXELS = bytes(GRID_WIDTH * GRID_HEIGHT)
+    return PIXELS
+
+# ドローン番号 → (セル番号 grid_z * GRID_WIDTH + grid_x, x, z)
+# フォーメーションは静的なため初回の呼び出し時に計算して保持し、
+# 位置が POSITION_TOLERANCE を超えてずれた場合だけ計算し直す（グリッド外はセル番号 -1）
+# DRONE_CELL_TABLE がある場合は読み込み時にその値で埋めておく
+{drone_cells}
+DRONE_CELLS = {{i: entry for i, entry in enumerate(DRONE_CELL_TABLE)}}
+
+def _drone_cell(drone_index, position):
+    """位置をグリッドのセル番号に変換して DRONE_CELLS に保持"""
+    dx = position[0] - GRID_ORIGIN_X
+    dz = position[2] - GRID_ORIGIN_Z
+    # グリッド列 (0-{grid_cols_minus_1})・行 (0-{grid_rows_minus_1}、上が0)
+    grid_x = int(round(dx * COL_FROM_X + dz * COL_FROM_Z))
+    grid_z = int(round(dx * ROW_FROM_X + dz * ROW_FROM_Z))
+    if 0 <= grid_x < GRID_WIDTH and 0 <= grid_z < GRID_HEIGHT:
+        cell = grid_z * GRID_WIDTH + grid_x
+    else:
+        cell = -1
+    cached = DRONE_CELLS[drone_index] = (cell, position[0], position[2])
+    return cached
+
+def {function_name}(frame, time_fraction, drone_index, formation_index, position, drone_count):
+    """
+    Skybrush Custom Expression関数
+    
+    Args:
+        frame: フレーム番号
+        time_fraction: 時間進行度（0.0-1.0）
+        drone_index: ドローンインデックス
+        formation_index: フォーメーションインデックス
+        position: ドローンの3D座標 (x, y, z)
+        drone_count: ドローン総数
+    
+    Returns:
+        float: Color Ramp用のインデックス値（0.0-1.0）
+    """
+    
+    # ドローンのグリッド位置（初回と位置がずれた場合だけ座標から計算）
+    cached = DRONE_CELLS.get(drone_index)
+    if (cached is None or abs(position[0] - cached[-2]) > POSITION_TOLERANCE
+            or abs(position[2] - cached[-1]) > POSITION_TOLERANCE):
+        cached = _drone_cell(drone_index, position)
+    
+    # 範囲チェックと参照テーブルの1回の参照
+    if cached[0] >= 0:
+        pixels = PIXELS if PIXELS is not None else _load_tables()
+        return float(pixels[cached[0]])  # 1.0: 文字部分（Color Rampで色に変換）
+    return 0.0  # 背景（黒）'''
+
+
+def custom_expression_function_name(snapshot: ExportSnapshot) -> str:
+    """テキストから安全な関数名を作成"""
+    text_content = " + ".join(frame.text for frame in snapshot.frames)
+    safe_text = text_content.replace(" ", "_").replace("+", "_").replace("　", "_")
+    safe_text = "".join(c for c in safe_text if c.isalnum() or c == "_")
+    return f"{safe_text}_display" if safe_text else "text_display"
+
+
+def write_custom_expression(filename: str, snapshot: ExportSnapshot, job) -> str:
+    """Skybrush Custom Expression用スクリプトをエクスポート"""
+    rows = snapshot.grid_rows
+    cols = snapshot.grid_cols
+
+    # ピクセルデータを収集（中央配置を適用）
+    pixels_data = set()
+    total = len(snapshot.frames)
+    for i, frame in enumerate(snapshot.frames):
+        job.report(i, total, frame.text)
+        x_offset, y_offset = centered_offset(frame.frame, cols, snapshot.x_offset_adjustment,
+                                             snapshot.y_offset_adjustment)
+        visible = frame.frame.offset(x_offset, y_offset).clip_to_grid(cols, rows)
+        pixels_data.update(map(tuple, visible.pixels.tolist()))
+
+    # 重複を除去してソート
+    unique_pixels = sorted(pixels_data)
+
+    compress = snapshot.compress_payload
+    script_content = CUSTOM_EXPRESSION_TEMPLATE.format(
+        timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        text_content=" + ".join(frame.text for frame in snapshot.frames),
+        function_name=custom_expression_function_name(snapshot),
+        payload_imports=PAYLOAD_IMPORTS if compress else "",
+        payload_format=payload_format(compress),
+        pixel_mask=pixel_mask_literal(unique_pixels, cols, rows, compress),
+        pixel_mask_decoder=payload_decoder("PIXEL_MASK_DATA", compress),
+        grid_cols=cols,
+        grid_rows=rows,
+        grid_cols_minus_1=cols - 1,
+        grid_rows_minus_1=rows - 1,
+        grid_transform=grid_transform_literal(snapshot),
+        drone_cells=drone_cells_literal(snapshot)
+    )
+
+    job.report(total, total, "保存中")
+    write_text_atomic(filename, script_content)
+    return filename
+
+
+# === タイムド Custom Expression ===
+
+TIMED_EXPRESSION_TEMPLATE = '''# Skybrush Custom Expression Function - タイムド版（複数フレーム）
+# Generated by Font2LED Tool - {timestamp}
+# Text: {text_content}
+#
+# 【重要】Blenderでの設定方法:
+# 1. Light Effectsパネルで新しいエフェクトを追加（Type: COLOR_RAMP, Output: FUNCTION）
+# 2. Frame範囲: 開始フレーム ～ 開始フレーム + {total_frames}
+# 3. 表示フレームは time_fraction から選択（TIME_SOURCE = "frame" でシーンのフレーム番号 - START_FRAME）
+
+{payload_imports}# グリッドサイズ設定
+GRID_WIDTH = {grid_cols}
+GRID_HEIGHT = {grid_rows}
+
+{grid_transform}
+
+# タイミング設定
+TOTAL_FRAMES = {total_frames}  # 総フレーム数
+TIME_SOURCE = "time_fraction"  # "time_fraction" または "frame"
+START_FRAME = 0  # TIME_SOURCE = "frame" の場合のエフェクト開始フレーム
+
+# フレームの点灯マスク（同じ内容のフレームは1つだけ保存）
+# 各ビットマップは BITMAP_BYTES バイトで、grid_z * GRID_WIDTH + grid_x 番目のビットが点灯
+BITMAP_COUNT = {bitmap_count}
+BITMAP_BYTES = {bitmap_bytes}
+# 形式: {payload_format}
+BITMAPS_DATA = (
+{bitmaps}
+)
+
+# 各フレーム（テキスト）の表示区間 [開始, 終了) とビットマップ番号
+FRAME_STARTS = (
+{frame_starts}
+)
+FRAME_ENDS = (
+{frame_ends}
+)
+FRAME_BITMAPS = (
+{frame_bitmaps}
+)
+
+# 1セル1バイトの参照テーブル（各ビットマップの初回の表示時に展開）。最後は表示区間外（消灯）
+BITMAPS = None
+FRAME_PIXELS = [None] * BITMAP_COUNT + [bytes(GRID_WIDTH * GRID_HEIGHT)]
+
+def _load_frame_pixels(bitmap):
+    """ビットマップを参照テーブルに展開して保持（変換が縮退している場合はすべて消灯）"""
+    global BITMAPS
+    if BITMAPS is None:
+        BITMAPS = {bitmaps_decoder}
+    base = bitmap * BITMAP_BYTES
+    if (COL_FROM_X or COL_FROM_Z) and (ROW_FROM_X or ROW_FROM_Z):
+        pixels = bytes((BITMAPS[base + (i >> 3)] >> (7 - (i & 7))) & 1 for i in range(GRID_WIDTH * GRID_HEIGHT))
+    else:
+        pixels = bytes(GRID_WIDTH * GRID_HEIGHT)
+    FRAME_PIXELS[bitmap] = pixels
+    return pixels
+
+# ドローン番号 → (セル番号 grid_z * GRID_WIDTH + grid_x, x, z)
+# フォーメーションは静的なため初回の呼び出し時に計算して保持し、
+# 位置が POSITION_TOLERANCE を超えてずれた場合だけ計算し直す（グリッド外はセル番号 -1）
+# DRONE_CELL_TABLE がある場合は読み込み時にその値で埋めておく
+{drone_cells}
+DRONE_CELLS = {{i: entry for i, entry in enumerate(DRONE_CELL_TABLE)}}
+
+def _drone_cell(drone_index, position):
+    """位置をグリッドのセル番号に変換して DRONE_CELLS に保持"""
+    dx = position[0] - GRID_ORIGIN_X
+    dz = position[2] - GRID_ORIGIN_Z
+    # グリッド列 (0-{grid_cols_minus_1})・行 (0-{grid_rows_minus_1}、上が0)
+    grid_x = int(round(dx * COL_FROM_X + dz * COL_FROM_Z))
+    grid_z = int(round(dx * ROW_FROM_X + dz * ROW_FROM_Z))
+    if 0 <= grid_x < GRID_WIDTH and 0 <= grid_z < GRID_HEIGHT:
+        cell = grid_z * GRID_WIDTH + grid_x
+    else:
+        cell = -1
+    cached = DRONE_CELLS[drone_index] = (cell, position[0], position[2])
+    return cached
+
+# 経過フレーム → 表示するビットマップ番号の索引（検索せずに1回の参照で選択）
+ACTIVE_BITMAP = [BITMAP_COUNT] * TOTAL_FRAMES
+for _start, _end, _bitmap in zip(FRAME_STARTS, FRAME_ENDS, FRAME_BITMAPS):
+    for _t in range(max(_start, 0), min(_end, TOTAL_FRAMES)):
+        ACTIVE_BITMAP[_t] = _bitmap
+
+def {function_name}(frame, time_fraction, drone_index, formation_index, position, drone_count):
+    """
+    Skybrush Custom Expression関数（タイムド版）
+    
+    Args:
+        frame: フレーム番号
+        time_fraction: 時間進行度（0.0-1.0）
+        drone_index: ドローンインデックス
+        formation_index: フォーメーションインデックス
+        position: ドローンの3D座標 (x, y, z)
+        drone_count: ドローン総数
+    
+    Returns:
+        float: Color Ramp用のインデックス値（0.0-1.0）
+    """
+    
+    # 経過フレームから表示中のビットマップを選択
+    if TIME_SOURCE == "frame":
+        elapsed = int(frame) - START_FRAME
+    else:
+        elapsed = int(time_fraction * TOTAL_FRAMES + 1e-9)
+    bitmap = ACTIVE_BITMAP[min(max(elapsed, 0), TOTAL_FRAMES - 1)]
+    pixels = FRAME_PIXELS[bitmap]
+    if pixels is None:
+        pixels = _load_frame_pixels(bitmap)
+    
+    # ドローンのグリッド位置（初回と位置がずれた場合だけ座標から計算）
+    cached = DRONE_CELLS.get(drone_index)
+    if (cached is None or abs(position[0] - cached[-2]) > POSITION_TOLERANCE
+            or abs(position[2] - cached[-1]) > POSITION_TOLERANCE):
+        cached = _drone_cell(drone_index, position)
+    
+    # 範囲チェックと参照テーブルの1回の参照
+    if cached[0] >= 0:
+        return float(pixels[cached[0]])  # 1.0: 文字部分（Color Rampで色に変換）
+    return 0.0  # 背景（黒）'''
+
+
+def write_timed_expression(filename: str, snapshot: ExportSnapshot, job) -> str:
+    """各フレームを表示区間付きのビットマップとして持つ Custom Expression をエクスポート
+
+    フレームは FRAME_INTERVAL フレームずつ順に表示し、同じ内容のビットマップは1つにまとめる。
+    """
+    rows = snapshot.grid_rows
+    cols = snapshot.grid_cols
+
+    bitmaps = {}  # ビットマップ → 番号（重複除去）
+    frame_bitmaps = []
+    total = len(snapshot.frames)
+    for i, frame in enumerate(snapshot.frames):
+        job.report(i, total, frame.text)
+        x_offset, y_offset = centered_offset(frame.frame, cols, snapshot.x_offset_adjustment,
+                                             snapshot.y_offset_adjustment)
+        visible = frame.frame.offset(x_offset, y_offset).clip_to_grid(cols, rows)
+        bitmap = pack_pixels(visible.pixels, cols, rows)
+        frame_bitmaps.append(bitmaps.setdefault(bitmap, len(bitmaps)))
+
+    starts = [i * FRAME_INTERVAL for i in range(total)]
+    ends = [start + FRAME_INTERVAL for start in starts]
+    compress = snapshot.compress_payload
+    script_content = TIMED_EXPRESSION_TEMPLATE.format(
+        timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        text_content=" + ".join(frame.text for frame in snapshot.frames),
+        function_name=custom_expression_function_name(snapshot),
+        payload_imports=PAYLOAD_IMPORTS if compress else "",
+        payload_format=payload_format(compress),
+        total_frames=max(total * FRAME_INTERVAL, 1),
+        bitmap_count=len(bitmaps),
+        bitmap_bytes=(rows * cols + 7) // 8,
+        bitmaps=payload_literal(b"".join(bitmaps), compress),
+        bitmaps_decoder=payload_decoder("BITMAPS_DATA", compress),
+        frame_starts=int_table_literal(starts),
+        frame_ends=int_table_literal(ends),
+        frame_bitmaps=int_table_literal(frame_bitmaps),
+        grid_cols=cols,
+        grid_rows=rows,
+        grid_cols_minus_1=cols - 1,
+        grid_rows_minus_1=rows - 1,
+        grid_transform=grid_transform_literal(snapshot),
+        drone_cells=drone_cells_literal(snapshot)
+    )
+
+    job.report(total, total, "保存中")
+    write_text_atomic(filename, script_content)
+    return filename
+
+
+# === アニメーション ===
+
+def animation_expression_script(snapshot: ExportSnapshot) -> str:
+    """アニメーション付きCustom Expressionのスクリプトを生成"""
+    source = snapshot.animation_source
+    text = snapshot.animation_text or "animation"
+    direction = snapshot.animation_direction
+    direction_name = SCROLL_FILE_NAMES.get(direction, "scroll")
+    config = {"cols": snapshot.grid_cols, "rows": snapshot.grid_rows}
+    transform = export_grid_transform(snapshot)
+    total_frames = snapshot.animation_frames
+    duration_seconds = total_frames / ANIMATION_FPS  # 24fps
+
+    # 元テキストの点灯マスクとフレームごとのオフセット表（プレビューと同じ scroll_offsets の式）
+    compress = snapshot.compress_payload
+    pixel_mask = pixel_mask_literal(source.pixels.tolist(), source.width, source.height, compress)
+    offsets = scroll_offsets(direction, np.arange(total_frames + 1) / float(total_frames),
+                             snapshot.grid_cols, snapshot.grid_rows, source.width, source.height)
+    if compress:
+        # フレーム間の差分（X全フレーム → Z全フレーム）を int32 リトルエンディアンで圧縮し、初回の呼び出し時に累積
+        deltas = np.diff(offsets, axis=0, prepend=0).T.astype("<i4")
+        offset_tables = f'''FRAME_OFFSETS_DATA = (
+{payload_literal(deltas.tobytes(), True)}
+)
+FRAME_OFFSET_X = None
+FRAME_OFFSET_Z = None'''
+        load_offsets = ''', FRAME_OFFSET_X, FRAME_OFFSET_Z
+    from itertools import accumulate
+    raw = zlib.decompress(base64.b64decode(FRAME_OFFSETS_DATA))
+    deltas = [int.from_bytes(raw[i:i + 4], "little", signed=True) for i in range(0, len(raw), 4)]
+    FRAME_OFFSET_X = tuple(accumulate(deltas[:ANIMATION_FRAMES + 1]))
+    FRAME_OFFSET_Z = tuple(accumulate(deltas[ANIMATION_FRAMES + 1:]))'''
+    else:
+        offset_tables = f'''FRAME_OFFSET_X = (
+{int_table_literal(offsets[:, 0].tolist())}
+)
+FRAME_OFFSET_Z = (
+{int_table_literal(offsets[:, 1].tolist())}
+)'''
+        load_offsets = ""
+    payload_imports = PAYLOAD_IMPORTS if compress else ""
+    function_name = f"animated_{text.replace(' ', '_')}_{direction_name}"
+
+    return f'''# Skybrush Custom Expression Function - アニメーション版
+# Generated by Font2LED Tool - Animation Export
+# Text: {snapshot.animation_text} ({direction}、{total_frames}フレーム = {duration_seconds:.1f}秒 @ 24fps)
+#
+# 【重要】Blenderでの設定方法:
+# 1. Light Effectsパネルで新しいエフェクトを追加
+# 2. Type: COLOR_RAMP, Output: FUNCTION (Script)
+# 3. Frame範囲を設定:
+#    - 開始フレーム: 任意（例: 1）
+#    - 終了フレーム: 開始フレーム + {total_frames}
+#    - 例: Frame 1-{total_frames + 1} で{total_frames}フレームのアニメーション
+# 4. このスクリプトをFunction欄に貼り付け
+
+{payload_imports}# グリッドサイズ設定
+GRID_WIDTH = {config["cols"]}
+GRID_HEIGHT = {config["rows"]}
+
+# アニメーション設定
+ANIMATION_FRAMES = {total_frames}  # 総フレーム数
+ANIMATION_DURATION = {duration_seconds:.1f}  # 秒数（{total_frames}フレーム ÷ 24fps）
+ANIMATION_DIRECTION = "{direction}"
+
+{grid_transform_literal(snapshot)}
+
+# ピクセルデータ（元テキストの点灯マスク、{payload_format(compress)}）- Font2LED Tool出力
+# pixel_z * TEXT_WIDTH + pixel_x 番目のビットが点灯（行優先、上位ビットから）
+TEXT_WIDTH = {source.width}
+TEXT_HEIGHT = {source.height}
+PIXEL_MASK_DATA = (
+{pixel_mask}
+)
+PIXELS = None  # 初回の呼び出し時に展開する1セル1バイトの参照テーブル
+
+# フレームごとのスクロールオフセット（フレーム 0-{total_frames}）: {direction}
+{offset_tables}
+
+def _load_tables():
+    """埋め込んだデータを参照テーブルに展開して保持（変換が縮退している場合はすべて消灯）"""
+    global PIXELS{load_offsets}
+    mask = {payload_decoder("PIXEL_MASK_DATA", compress)}
+    if (COL_FROM_X or COL_FROM_Z) and (ROW_FROM_X or ROW_FROM_Z):
+        PIXELS = bytes((mask[i >> 3] >> (7 - (i & 7))) & 1 for i in range(TEXT_WIDTH * TEXT_HEIGHT))
+    else:
+        PIXELS = bytes(TEXT_WIDTH * TEXT_HEIGHT)
+    return PIXELS
+
+# ドローン番号 → (グリッド列, グリッド行, x, z)
+# フォーメーションは静的なため初回の呼び出し時に計算して保持し、
+# 位置が POSITION_TOLERANCE を超えてずれた場合だけ計算し直す（グリッド外は列・行 -1）
+# DRONE_CELL_TABLE がある場合は読み込み時にその値で埋めておく
+{drone_cells_literal(snapshot)}
+DRONE_CELLS = {{
+    i: ((cell % GRID_WIDTH, cell // GRID_WIDTH) if cell >= 0 else (-1, -1)) + (x, z)
+    for i, (cell, x, z) in enumerate(DRONE_CELL_TABLE)
+}}
+
+def _drone_cell(drone_index, position):
+    """位置をグリッド座標に変換して DRONE_CELLS に保持"""
+    dx = position[0] - GRID_ORIGIN_X
+    dz = position[2] - GRID_ORIGIN_Z
+    # グリッド列 (0-{config["cols"]-1})・行 (0-{config["rows"]-1}、上が0)
+    grid_x = int(round(dx * COL_FROM_X + dz * COL_FROM_Z))
+    grid_z = int(round(dx * ROW_FROM_X + dz * ROW_FROM_Z))
+    if not (0 <= grid_x < GRID_WIDTH and 0 <= grid_z < GRID_HEIGHT):
+        grid_x = grid_z = -1
+    cached = DRONE_CELLS[drone_index] = (grid_x, grid_z, position[0], position[2])
+    return cached
+
+def {function_name}(frame, time_fraction, drone_index, formation_index, position, drone_count):
+    """
+    {direction}アニメーション - "{snapshot.animation_text}"
+    
+    Args:
+        frame: フレーム番号
+        time_fraction: 時間進行度（0.0-1.0）
+                      ※Skybrushが自動計算: (現在frame - 開始frame) / (終了frame - 開始frame)
+        drone_index: ドローンインデックス
+        formation_index: フォーメーションインデックス
+        position: ドローンの3D座標 (x, y, z)
+        drone_count: ドローン総数
+    
+    Returns:
+        float: Color Ramp用のインデックス値（0.0-1.0）
+    """
+    
+    # ドローンのグリッド位置（初回と位置がずれた場合だけ座標から計算）
+    cached = DRONE_CELLS.get(drone_index)
+    if (cached is None or abs(position[0] - cached[-2]) > POSITION_TOLERANCE
+            or abs(position[2] - cached[-1]) > POSITION_TOLERANCE):
+        cached = _drone_cell(drone_index, position)
+    grid_x, grid_z = cached[0], cached[1]
+    
+    # 範囲チェック
+    if grid_x < 0:
+        return 0.0  # 背景（黒）
+    
+    # 進行度に対応するフレームのオフセット分だけ戻した元テキスト上の座標を1回参照
+    pixels = PIXELS if PIXELS is not None else _load_tables()
+    index = min(max(int(time_fraction * ANIMATION_FRAMES + 0.5), 0), ANIMATION_FRAMES)
+    pixel_x = grid_x - FRAME_OFFSET_X[index]
+    pixel_z = grid_z - FRAME_OFFSET_Z[index]
+    if 0 <= pixel_x < TEXT_WIDTH and 0 <= pixel_z < TEXT_HEIGHT:
+        return float(pixels[pixel_z * TEXT_WIDTH + pixel_x])  # 1.0: 文字部分（Color Rampで色に変換）
+    return 0.0  # 背景（黒）
+
+
+def benchmark(calls=100000):
+    """{function_name} の1回の呼び出し時間（マイクロ秒）を計測して表示"""
+    import time
+    # 埋め込んだ変換のグリッドの各セルの位置（行優先）
+    positions = [
+        (GRID_ORIGIN_X + col * {transform.col_dx!r} + row * {transform.row_dx!r}, 0.0,
+         GRID_ORIGIN_Z + col * {transform.col_dz!r} + row * {transform.row_dz!r})
+        for row in range(GRID_HEIGHT) for col in range(GRID_WIDTH)
+    ]
+    start = time.perf_counter()
+    for i in range(calls):
+        {function_name}(0, (i % (ANIMATION_FRAMES + 1)) / ANIMATION_FRAMES, i % len(positions), 0,
+                        positions[i % len(positions)], len(positions))
+    microseconds = (time.perf_counter() - start) / calls * 1e6
+    print(f"{function_name}: {{microseconds:.3f}} µs/call ({{calls}} calls)")
+    return microseconds
+
+
+if __name__ == "__main__":
+    benchmark()
+'''
+
+
+def write_animation_expression(filename: str, snapshot: ExportSnapshot, job) -> str:
+    """アニメーション付きCustom Expressionをエクスポート"""
+    job.report(0, 1, "スクリプト生成中")
+    script_content = animation_expression_script(snapshot)
+    job.report(1, 1, "保存中")
+    write_text_atomic(filename, script_content)
+    return filename
+
+
+# === プレビュー画像 ===
+
+# これ未満のフレーム数はプロセスを起動せずに順番に保存
+PARALLEL_PREVIEW_MIN_FRAMES = 4
+
+
+def preview_image(frame: ExportFrame, rows: int, cols: int, x_adjustment: int = 0, y_adjustment: int = 0,
+                  scale: int = 20) -> Image.Image:
+    """1フレーム分のプレビュー画像（選択されたスクリーンサイズ準拠、下にテキスト情報）"""
+    img_width = cols * scale
+    img_height = rows * scale
+
+    # 消灯背景に点灯LEDのスプライトを貼り付ける（プレビューと同じラスター描画）
+    x_offset, y_offset = centered_offset(frame.frame, cols, x_adjustment, y_adjustment)
+    info_image = np.zeros((img_height + 30, img_width, 3), dtype=np.uint8)
+    info_image[:img_height] = shared_raster_renderer.render_frame(
+        frame.frame, rows, cols, scale, frame.color, x_offset, y_offset)
+
+    # テキスト情報
+    info_image = Image.fromarray(info_image)
+    info_draw = ImageDraw.Draw(info_image)
+    info_draw.text((10, img_height + 5), f"Text: {frame.text}", fill=(200, 200, 200))
+    return info_image
+
+
+def _save_preview_image(task) -> str:
+    """1フレームを描画して保存（プロセスプールのワーカーで実行）"""
+    frame, rows, cols, x_adjustment, y_adjustment, filename = task
+    preview_image(frame, rows, cols, x_adjustment, y_adjustment).save(filename)
+    return filename
+
+
+def write_preview_images(folder: str, snapshot: ExportSnapshot, job, max_workers: Optional[int] = None) -> int:
+    """各フレームのプレビュー画像を保存し、保存した枚数を返す
+
+    フレームはプロセスプールで並列に描画し、描画が終わったものから保存・進捗報告する。
+    max_workers が None の場合はCPU数（1の場合は順番に保存）。
+    画像は folder 内の一時フォルダに保存し、全フレームが揃ってから folder に移す
+    （キャンセル・失敗した場合は一時フォルダごと削除し、folder には何も残さない）。
+    """
+    names = [f"frame_{i+1:02d}_{frame.text}.png" for i, frame in enumerate(snapshot.frames)]
+    temp_folder = tempfile.mkdtemp(prefix=".font2led_", dir=folder)
+    try:
+        tasks = [(frame, snapshot.grid_rows, snapshot.grid_cols, snapshot.x_offset_adjustment,
+                  snapshot.y_offset_adjustment, os.path.join(temp_folder, name))
+                 for frame, name in zip(snapshot.frames, names)]
+        _save_preview_tasks(tasks, job, max_workers)
+        for name in names:
+            os.replace(os.path.join(temp_folder, name), os.path.join(folder, name))
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+    total = len(names)
+    job.report(total, total, "完了")
+    return total
+
+
+def _save_preview_tasks(tasks, job, max_workers: Optional[int]):
+    """プレビュー画像の保存タスクを実行（並列に保存できない場合・残りは順番に保存）"""
+    total = len(tasks)
+    saved = set()
+    if max_workers is None:
+        max_workers = min(os.cpu_count() or 1, total)
+
+    if total >= PARALLEL_PREVIEW_MIN_FRAMES and max_workers > 1:
+        try:
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+        except (OSError, NotImplementedError) as e:
+            print(f"並列保存を使用できません（順番に保存します）: {e}")
+            executor = None
+        if executor is not None:
+            try:
+                futures = {executor.submit(_save_preview_image, task): task[-1] for task in tasks}
+                for future in as_completed(futures):
+                    saved.add(future.result())
+                    job.report(len(saved), total, os.path.basename(futures[future]))
+            except BrokenProcessPool as e:
+                print(f"並列保存に失敗しました（残りを順番に保存します）: {e}")
+            finally:
+                # キャンセル・エラー時は未着手のフレームを破棄
+                executor.shutdown(wait=True, cancel_futures=True)
+
+    for task in tasks:
+        if task[-1] in saved:
+            continue
+        job.report(len(saved), total, task[0].text)
+        saved.add(_save_preview_image(task))
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+LEDフレーム
+点灯状態をbool行列、色をパレットインデックス行列で保持する省メモリなフレーム表現。
+ピクセル座標のタプルリストの代わりにプレビュー・エクスポート・インポートで共通に使う。
+
+従来の led_data 辞書 ("width", "height", "pixels", "matrix", "color_map") と同じキーで
+読み出せるため、辞書を受け取っていた既存コードにそのまま渡せる。
+"""
+
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class LEDFrame:
+    """配列ベースのLEDフレーム
+
+    mask        : (height, width) bool 行列。点灯ピクセルがTrue
+    origin      : mask左上のグリッド座標 (x, y)。offset() で移動したビューを作る
+    color_index : (height, width) uint8 行列。0はデフォルト色、1以上は palette[i - 1]
+    palette     : (K, 3) float32 のRGB(0.0-1.0)配列
+    """
+
+    __slots__ = ("mask", "origin", "color_index", "palette", "_pixels", "_colors")
+
+    # 辞書互換アクセスで読み出せるキー
+    LED_DATA_KEYS = ("width", "height", "pixels", "matrix", "color_map")
+
+    def __init__(self, mask: np.ndarray, origin: Tuple[int, int] = (0, 0),
+                 color_index: Optional[np.ndarray] = None, palette: Optional[np.ndarray] = None):
+        self.mask = mask if mask.dtype == np.bool_ else mask.astype(bool)
+        self.origin = (int(origin[0]), int(origin[1]))
+        self.color_index = color_index
+        self.palette = palette
+        self._pixels = None
+        self._colors = None
+
+    # === 生成・変換 ===
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray, color_index: Optional[np.ndarray] = None,
+                    palette: Optional[np.ndarray] = None) -> "LEDFrame":
+        """マトリックス（0/1）からフレームを作成"""
+        return cls(matrix > 0, (0, 0), color_index, palette)
+
+    @classmethod
+    def from_packed(cls, packed: np.ndarray, width: int) -> "LEDFrame":
+        """行ごとにビットパックされたマトリックスからフレームを作成"""
+        return cls(np.unpackbits(packed, axis=1, count=width).astype(bool))
+
+    @classmethod
+    def from_led_data(cls, led_data) -> "LEDFrame":
+        """led_data 辞書（テキストレイアウト結果・ピクセルマップインポート結果）から変換"""
+        if isinstance(led_data, cls):
+            return led_data
+
+        width = int(led_data["width"])
+        height = int(led_data["height"])
+        color_map = led_data.get("color_map") or led_data.get("colors") or {}
+        matrix = led_data.get("matrix")
+        if isinstance(matrix, np.ndarray) and not color_map and matrix.shape == (height, width):
+            return cls.from_matrix(matrix)
+
+        xs, ys, color_ids = _split_pixels(led_data.get("pixels", []))
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        xs, ys = xs[inside], ys[inside]
+
+        mask = np.zeros((height, width), dtype=bool)
+        mask[ys, xs] = True
+
+        if color_ids is None or not color_map:
+            return cls(mask)
+
+        # カラーマップをパレット配列に変換（RGBとして解釈できない色はデフォルト色扱い）
+        palette = []
+        key_to_index = {}
+        for key, rgb in color_map.items():
+            if isinstance(rgb, (list, tuple)) and len(rgb) >= 3:
+                key_to_index[str(key)] = len(palette) + 1
+                palette.append(rgb[:3])
+
+        color_ids = [color_ids[i] for i in np.flatnonzero(inside)]
+        color_index = np.zeros((height, width), dtype=np.uint8)
+        color_index[ys, xs] = [key_to_index.get(str(cid), 0) for cid in color_ids]
+        return cls(mask, (0, 0), color_index,
+                   np.asarray(palette, dtype=np.float32).reshape(-1, 3))
+
+    def to_led_data(self) -> Dict:
+        """従来の led_data 辞書形式に変換"""
+        return {key: self[key] for key in self.LED_DATA_KEYS}
+
+    def packbits(self) -> np.ndarray:
+        """行ごとにビットパックしたマトリックス (height, ceil(width / 8))"""
+        return np.packbits(self.mask, axis=1)
+
+    # === 寸法・座標 ===
+
+    @property
+    def width(self) -> int:
+        return self.mask.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.mask.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        """保持している配列の合計バイト数（キャッシュ含む）"""
+        total = self.mask.nbytes
+        for array in (self.color_index, self.palette, self._pixels, self._colors):
+            if array is not None:
+                total += array.nbytes
+        return total
+
+    @property
+    def pixels(self) -> np.ndarray:
+        """点灯ピクセルのグリッド座標 (N, 2) int16 [x, y]（行優先順、初回アクセス時に計算）"""
+        if self._pixels is None:
+            ys, xs = np.nonzero(self.mask)
+            pixels = np.empty((xs.size, 2), dtype=np.int16)
+            pixels[:, 0] = xs + self.origin[0]
+            pixels[:, 1] = ys + self.origin[1]
+            pixels.flags.writeable = self.mask.flags.writeable
+            self._pixels = pixels
+        return self._pixels
+
+    @property
+    def colors(self) -> Optional[np.ndarray]:
+        """点灯ピクセルごとのパレットインデックス (N,)（色情報が無ければNone）"""
+        if self.color_index is None:
+            return None
+        if self._colors is None:
+            self._colors = self.color_index[self.mask]
+            self._colors.flags.writeable = self.mask.flags.writeable
+        return self._colors
+
+    def pixel_rgb(self, default_color: Sequence[float]) -> np.ndarray:
+        """点灯ピクセルごとのRGB (N, 3) float32。パレット外はdefault_color"""
+        count = int(np.count_nonzero(self.mask))
+        rgb = np.empty((count, 3), dtype=np.float32)
+        rgb[:] = default_color[:3]
+        colors = self.colors
+        if colors is not None and self.palette is not None and len(self.palette):
+            has_color = colors > 0
+            rgb[has_color] = self.palette[colors[has_color] - 1]
+        return rgb
+
+    def freeze(self) -> "LEDFrame":
+        """配列を読み取り専用にする（キャッシュで共有するフレーム用）"""
+        for array in (self.mask, self.color_index, self.palette, self._pixels, self._colors):
+            if array is not None:
+                array.flags.writeable = False
+        return self
+
+    def release_cache(self):
+        """遅延計算した座標配列を破棄してメモリを解放"""
+        self._pixels = None
+        self._colors = None
+
+    # === ビュー ===
+
+    def offset(self, dx: int, dy: int) -> "LEDFrame":
+        """位置をずらしたビュー（配列はコピーしない）"""
+        return LEDFrame(self.mask, (self.origin[0] + dx, self.origin[1] + dy),
+                        self.color_index, self.palette)
+
+    def crop(self, x0: int, y0: int, x1: int, y1: int) -> "LEDFrame":
+        """グリッド座標の矩形 [x0, x1) × [y0, y1) で切り出したビュー（配列はコピーしない）"""
+        ox, oy = self.origin
+        left = min(max(x0 - ox, 0), self.width)
+        top = min(max(y0 - oy, 0), self.height)
+        right = max(min(x1 - ox, self.width), left)
+        bottom = max(min(y1 - oy, self.height), top)
+        color_index = self.color_index[top:bottom, left:right] if self.color_index is not None else None
+        return LEDFrame(self.mask[top:bottom, left:right], (ox + left, oy + top),
+                        color_index, self.palette)
+
+    def clip_to_grid(self, cols: int, rows: int) -> "LEDFrame":
+        """LEDスクリーン (cols × rows) の範囲に切り出したビュー"""
+        return self.crop(0, 0, cols, rows)
+
+    # === 辞書互換アクセス ===
+
+    def __getitem__(self, key: str):
+        if key == "width":
+            return self.width
+        if key == "height":
+            return self.height
+        if key == "pixels":
+            if self.color_index is None:
+                return self.pixels
+            # 色情報付きの場合は [x, y, color_id] 形式（color_map のキーに対応）
+            return np.column_stack((self.pixels, self.colors.astype(np.int16)))
+        if key == "matrix":
+            return self.mask.view(np.uint8)
+        if key == "color_map":
+            if self.palette is None:
+                return {}
+            return {str(i + 1): tuple(float(c) for c in rgb) for i, rgb in enumerate(self.palette)}
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.LED_DATA_KEYS and (key != "color_map" or self.palette is not None)
+
+    def __repr__(self) -> str:
+        return (f"LEDFrame({self.width}x{self.height}, origin={self.origin}, "
+                f"lit={int(np.count_nonzero(self.mask))})")
+
+
+def _split_pixels(pixels) -> Tuple[np.ndarray, np.ndarray, Optional[list]]:
+    """ピクセル列 (タプル / 辞書 / 配列) を x, y 配列と色ID列に分解"""
+    if isinstance(pixels, np.ndarray):
+        pixels = pixels.reshape(len(pixels), -1) if len(pixels) else np.zeros((0, 2), dtype=np.int64)
+        color_ids = pixels[:, 2].tolist() if pixels.shape[1] > 2 else None
+        return pixels[:, 0].astype(np.int64), pixels[:, 1].astype(np.int64), color_ids
+
+    if not pixels:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), None
+
+    if isinstance(pixels[0], dict):
+        xs = np.fromiter((p["x"] for p in pixels), dtype=np.int64, count=len(pixels))
+        ys = np.fromiter((p["y"] for p in pixels), dtype=np.int64, count=len(pixels))
+        return xs, ys, [p.get("color_id", 1) for p in pixels]
+
+    xs = np.fromiter((p[0] for p in pixels), dtype=np.int64, count=len(pixels))
+    ys = np.fromiter((p[1] for p in pixels), dtype=np.int64, count=len(pixels))
+    if any(len(p) > 2 for p in pixels):
+        return xs, ys, [p[2] if len(p) > 2 else None for p in pixels]
+    return xs, ys, None
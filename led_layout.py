@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+LEDレイアウトエンジン
+文字グリフを横に並べてLEDマトリックスを作成する（Font2LED / GUI 共通）
+"""
+
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from led_frame import LEDFrame
+
+# スペースなど点灯列の無い文字の固定幅
+DEFAULT_SPACE_WIDTH = 4
+
+
+def empty_pixels() -> np.ndarray:
+    """点灯ピクセルなしの (0, 2) 座標配列"""
+    return np.zeros((0, 2), dtype=np.int16)
+
+
+def matrix_to_pixels(matrix: np.ndarray) -> np.ndarray:
+    """マトリックスの点灯ピクセルを (N, 2) の int16 座標配列 [x, y] に変換（行優先順）"""
+    ys, xs = np.nonzero(matrix)
+    pixels = np.empty((xs.size, 2), dtype=np.int16)
+    pixels[:, 0] = xs
+    pixels[:, 1] = ys
+    return pixels
+
+
+def _compose(text: str,
+             get_glyph: Callable[[str], Tuple[np.ndarray, int]],
+             height: int,
+             spacing: int,
+             space_width: int) -> Tuple[np.ndarray, np.ndarray]:
+    """テキストのマトリックスと各文字の送り幅 (len(text),) を作成"""
+    if not text:
+        return np.zeros((height, 0), dtype=np.uint8), np.zeros(0, dtype=np.int64)
+
+    # 同じ文字のグリフは一度だけ取得
+    unique_chars = list(dict.fromkeys(text))
+    char_index = {char: i for i, char in enumerate(unique_chars)}
+    glyphs = [get_glyph(char) for char in unique_chars]
+    bitmaps = np.stack([bitmap for bitmap, _ in glyphs])  # (U, H, W)
+    glyph_widths = np.array([width for _, width in glyphs], dtype=np.int64)
+
+    indices = np.fromiter((char_index[char] for char in text), dtype=np.intp, count=len(text))
+    widths = glyph_widths[indices]
+    advances = np.where(widths > 0, widths, space_width)
+
+    # 各文字の開始x座標を累積和で計算
+    starts = np.zeros(len(text), dtype=np.int64)
+    np.cumsum(advances[:-1] + spacing, out=starts[1:])
+    total_width = int(advances.sum() + spacing * (len(text) - 1))
+
+    matrix = np.zeros((height, total_width), dtype=np.uint8)
+
+    # 点灯列を持つ文字の各列を一括でコピー
+    glyph_height = min(bitmaps.shape[1], height)
+    char_i, src_x = np.nonzero(np.arange(bitmaps.shape[2])[None, :] < widths[:, None])
+    if char_i.size:
+        dst_x = starts[char_i] + src_x
+        matrix[:glyph_height, dst_x] = bitmaps[indices[char_i], :glyph_height, src_x].T
+
+    return matrix, advances
+
+
+def layout_text(text: str,
+                get_glyph: Callable[[str], Tuple[np.ndarray, int]],
+                height: int,
+                spacing: int = 1,
+                space_width: int = DEFAULT_SPACE_WIDTH) -> Dict:
+    """
+    テキストをLEDマトリックスデータに変換
+
+    Args:
+        text: 表示テキスト
+        get_glyph: 文字から (height, width) のビットマップと空白列を除いた文字幅を返す関数
+        height: マトリックスの高さ
+        spacing: 文字間隔
+        space_width: 点灯列の無い文字（スペース等）の幅
+
+    Returns:
+        {
+            "width": 実際の幅,
+            "height": height,
+            "pixels": (N, 2) int16配列 [x, y] # 点灯するピクセルの座標
+            "matrix": numpy array
+        }
+    """
+    matrix, _ = _compose(text, get_glyph, height, spacing, space_width)
+    return {
+        "width": matrix.shape[1],
+        "height": height,
+        "pixels": matrix_to_pixels(matrix),
+        "matrix": matrix
+    }
+
+
+class IncrementalLayout:
+    """入力中のテキスト向けの差分レイアウト
+
+    前回のテキストとの共通接頭辞までのマトリックス列をそのまま再利用し、
+    変更された文字以降だけをレイアウトし直す。
+    フォント・サイズ・文字間隔などの条件 (context) が変わった場合は全体をレイアウトし直す。
+    """
+
+    def __init__(self, get_glyph: Callable[[str], Tuple[np.ndarray, int]], height: int,
+                 spacing: int = 1, space_width: int = DEFAULT_SPACE_WIDTH):
+        self.get_glyph = get_glyph
+        self.height = height
+        self.spacing = spacing
+        self.space_width = space_width
+        self.context: Optional[Hashable] = None
+        self.text = ""
+        self.matrix = np.zeros((height, 0), dtype=np.uint8)
+        self.advances = np.zeros(0, dtype=np.int64)
+        self.reused_chars = 0  # 直前の update で再利用した文字数
+
+    def reset(self, context: Optional[Hashable] = None):
+        """保持しているレイアウトを破棄"""
+        self.context = context
+        self.text = ""
+        self.matrix = np.zeros((self.height, 0), dtype=np.uint8)
+        self.advances = np.zeros(0, dtype=np.int64)
+        self.reused_chars = 0
+
+    def update(self, text: str, context: Optional[Hashable] = None) -> LEDFrame:
+        """テキストを差分レイアウトしてフレームを返す"""
+        if context != self.context:
+            self.reset(context)
+
+        # 前回のテキストとの共通接頭辞の長さ
+        limit = min(len(text), len(self.text))
+        prefix = 0
+        while prefix < limit and text[prefix] == self.text[prefix]:
+            prefix += 1
+
+        # 接頭辞部分の列（最後の文字の後ろの文字間隔を含む）を再利用
+        prefix_columns = int(self.advances[:prefix].sum()) + self.spacing * prefix
+        suffix_matrix, suffix_advances = _compose(text[prefix:], self.get_glyph, self.height,
+                                                  self.spacing, self.space_width)
+        if suffix_advances.size:
+            width = prefix_columns + suffix_matrix.shape[1]
+        else:
+            # 末尾の削除のみ：最後の文字間隔を落とす
+            width = max(prefix_columns - self.spacing, 0)
+        matrix = np.zeros((self.height, width), dtype=np.uint8)
+        reused = min(prefix_columns, width, self.matrix.shape[1])
+        matrix[:, :reused] = self.matrix[:, :reused]
+        matrix[:, prefix_columns:] = suffix_matrix
+
+        self.text = text
+        self.matrix = matrix
+        self.advances = np.concatenate((self.advances[:prefix], suffix_advances))
+        self.reused_chars = prefix
+        return LEDFrame.from_matrix(matrix)
+
+
+class LayoutCache:
+    """レイアウト結果のLRUキャッシュ
+
+    キーは (テキスト, フォント識別子, フェイス番号, ピクセルサイズ, 正規化高さ, 正規化幅, 文字間隔, スペース幅)。
+    同じ歌詞行や名前を何度レイアウトしても計算は一度だけで、読み取り専用の LEDFrame を共有する。
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, LEDFrame]" = OrderedDict()
+
+    @staticmethod
+    def make_key(text: str, font_id: Hashable, face_index: int, pixel_size: Tuple[int, int],
+                 height: int, width: int, spacing: int = 1,
+                 space_width: int = DEFAULT_SPACE_WIDTH) -> Tuple:
+        """キャッシュキーを作成"""
+        return (text, font_id, face_index, tuple(pixel_size), height, width, spacing, space_width)
+
+    def get(self, key: Hashable) -> Optional[LEDFrame]:
+        """キャッシュからフレームを取得（無ければNone）"""
+        frame = self._entries.get(key)
+        if frame is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return frame
+
+    def put(self, key: Hashable, frame: LEDFrame) -> LEDFrame:
+        """フレームを読み取り専用にして格納し、上限を超えた分を古い順に破棄"""
+        frame.freeze()
+        self._entries[key] = frame
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return frame
+
+    def get_or_layout(self, key: Hashable, layout: Callable[[], Dict]) -> LEDFrame:
+        """キャッシュに無ければ layout() を実行して格納"""
+        frame = self.get(key)
+        if frame is None:
+            frame = self.put(key, LEDFrame.from_led_data(layout()))
+        return frame
+
+    def invalidate(self, font_id: Optional[Hashable] = None):
+        """指定フォントのレイアウトを破棄（Noneの場合はすべて破棄）"""
+        if font_id is None:
+            self._entries.clear()
+            return
+        for key in [key for key in self._entries if key[1] == font_id]:
+            del self._entries[key]
+
+    def stats(self) -> Dict:
+        """ヒット数・ミス数・件数を返す"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Font2LED / GUI で共有するデフォルトのレイアウトキャッシュ
+shared_layout_cache = LayoutCache()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+LEDラスター描画
+LEDスクリーン全体をNumPyのRGBバッファに描画する。
+色・セルサイズごとに事前描画したLEDスプライトを貼り付けるだけなので、
+数千台規模のスクリーンでもキャンバスアイテムを使わずにプレビュー・PNG出力できる。
+
+GUIのラスタープレビュー・画像プレビュー保存・Font2LED.preview_text で共通に使うため、
+どの出力も同じ見た目になる。
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from led_canvas import LED_OFF, OFF_FILL, OFF_OUTLINE, color_keys, hex_color, led_state, visible_cells
+from led_frame import LEDFrame
+
+# グリッド線の色（show_grid=True の場合）
+GRID_COLOR = (40, 40, 40)
+# ドラッグ中のピクセルのハイライト色
+HIGHLIGHT_COLOR = "yellow"
+
+
+def led_size_for(cell: int) -> int:
+    """セルサイズに対するLED球体の直径（キャンバス描画と同じ）"""
+    return max(4, int(cell // 4))
+
+
+class LEDRasterRenderer:
+    """スプライトを貼り付けてLEDスクリーンをRGB配列に描画するレンダラー
+
+    スプライトは (点灯状態キー, セルサイズ, ハイライト, グリッド線) ごとにLRUでキャッシュする。
+    全LED消灯の背景画像も (行数, 列数, セルサイズ, グリッド線) ごとにキャッシュし、
+    点灯LEDだけを貼り付けて描画する。
+    GUIのプレビューとエクスポートのワーカースレッドから同時に使うため、キャッシュの操作はロックで保護する
+    （スプライト・背景の描画自体はロックの外で行う）。
+    """
+
+    def __init__(self, max_sprites: int = 4096, max_backgrounds: int = 8):
+        self.max_sprites = max_sprites
+        self.max_backgrounds = max_backgrounds
+        self._sprites: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._backgrounds: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sprite(self, key: int, cell: int, highlight: bool = False, show_grid: bool = False) -> np.ndarray:
+        """1セル分のスプライト (cell, cell, 3) uint8 を返す"""
+        sprite_key = (int(key), cell, highlight, show_grid)
+        with self._lock:
+            sprite = self._sprites.get(sprite_key)
+            if sprite is not None:
+                self._sprites.move_to_end(sprite_key)
+                return sprite
+
+        image = Image.new("RGB", (cell, cell), "black")
+        draw = ImageDraw.Draw(image)
+        center = cell // 2
+        led_size = led_size_for(cell)
+
+        def bounds(size: int):
+            return [center - size // 2, center - size // 2, center + size // 2, center + size // 2]
+
+        if key == LED_OFF:
+            # LED球体（消灯時は暗いグレー）
+            draw.ellipse(bounds(led_size), fill=OFF_FILL, outline=OFF_OUTLINE, width=1)
+        else:
+            outline = hex_color(key)
+            # グロー効果（外側の輪）と点灯LED（エミッション効果の明るい色）
+            draw.ellipse(bounds(led_size + 4), outline=outline, width=2)
+            draw.ellipse(bounds(led_size), fill=hex_color(key >> 24), outline=outline, width=2)
+        if highlight:
+            draw.ellipse(bounds(led_size + 8), outline=HIGHLIGHT_COLOR, width=3)
+
+        sprite = np.asarray(image, dtype=np.uint8).copy()
+        if show_grid:
+            sprite[0, :] = GRID_COLOR
+            sprite[:, 0] = GRID_COLOR
+        sprite.flags.writeable = False
+
+        with self._lock:
+            self._sprites[sprite_key] = sprite
+            while len(self._sprites) > self.max_sprites:
+                self._sprites.popitem(last=False)
+        return sprite
+
+    def render_state(self, state: np.ndarray, cell: int,
+                     highlight: Optional[Tuple[int, int]] = None,
+                     show_grid: bool = False) -> np.ndarray:
+        """(rows, cols) の点灯状態行列を (rows * cell, cols * cell, 3) のRGB配列に描画
+
+        highlight は (x, y) のセル。
+        """
+        rows, cols = state.shape
+        if rows == 0 or cols == 0 or cell <= 0:
+            return np.zeros((rows * max(cell, 0), cols * max(cell, 0), 3), dtype=np.uint8)
+
+        # 出現する点灯状態ごとにスプライトを用意し、一括で貼り付ける
+        keys, inverse = np.unique(state, return_inverse=True)
+        tiles = np.stack([self.sprite(key, cell, False, show_grid) for key in keys.tolist()])
+        image = tiles[inverse.reshape(rows, cols)]  # (rows, cols, cell, cell, 3)
+        image = image.transpose(0, 2, 1, 3, 4).reshape(rows * cell, cols * cell, 3)
+
+        if highlight is not None and 0 <= highlight[0] < cols and 0 <= highlight[1] < rows:
+            x, y = highlight
+            image[y * cell:(y + 1) * cell, x * cell:(x + 1) * cell] = \
+                self.sprite(state[y, x], cell, True, show_grid)
+        return image
+
+    def background(self, rows: int, cols: int, cell: int, show_grid: bool = False) -> np.ndarray:
+        """全LED消灯のスクリーン画像 (rows * cell, cols * cell, 3)（読み取り専用）"""
+        background_key = (rows, cols, cell, show_grid)
+        with self._lock:
+            image = self._backgrounds.get(background_key)
+            if image is not None:
+                self._backgrounds.move_to_end(background_key)
+                return image
+
+        image = self.render_state(np.full((rows, cols), LED_OFF, dtype=np.int64), cell, None, show_grid)
+        image.flags.writeable = False
+        with self._lock:
+            self._backgrounds[background_key] = image
+            while len(self._backgrounds) > self.max_backgrounds:
+                self._backgrounds.popitem(last=False)
+        return image
+
+    def render(self, rows: int, cols: int, xs: np.ndarray, ys: np.ndarray, keys: np.ndarray,
+               cell: int, highlight: Optional[Tuple[int, int]] = None,
+               show_grid: bool = False) -> np.ndarray:
+        """点灯LEDのグリッド座標と点灯状態キーからRGB配列を描画
+
+        消灯背景のコピーに点灯LEDのスプライトだけを貼り付ける。
+        """
+        if rows == 0 or cols == 0 or cell <= 0:
+            return np.zeros((rows * max(cell, 0), cols * max(cell, 0), 3), dtype=np.uint8)
+        state = led_state(rows, cols, xs, ys, keys)
+        image = self.background(rows, cols, cell, show_grid).copy()
+
+        lit_rows, lit_cols = np.nonzero(state != LED_OFF)
+        if lit_rows.size:
+            lit_keys, inverse = np.unique(state[lit_rows, lit_cols], return_inverse=True)
+            tiles = np.stack([self.sprite(key, cell, False, show_grid) for key in lit_keys.tolist()])
+            cells = image.reshape(rows, cell, cols, cell, 3)  # セル単位のビュー
+            cells[lit_rows, :, lit_cols] = tiles[inverse]
+
+        if highlight is not None and 0 <= highlight[0] < cols and 0 <= highlight[1] < rows:
+            x, y = highlight
+            image[y * cell:(y + 1) * cell, x * cell:(x + 1) * cell] = \
+                self.sprite(state[y, x], cell, True, show_grid)
+        return image
+
+    def render_frame(self, frame: LEDFrame, rows: int, cols: int, cell: int,
+                     default_color: Sequence[float], x_offset: int = 0, y_offset: int = 0,
+                     show_grid: bool = False) -> np.ndarray:
+        """LEDフレームを (x_offset, y_offset) にずらしてスクリーンに描画
+
+        default_color は RGB(0.0-1.0)。カラーマップに無い色に使う。
+        """
+        visible = frame.offset(x_offset, y_offset).clip_to_grid(cols, rows)
+        pixels = visible.pixels
+        keys = color_keys(visible.pixel_rgb(default_color))
+        return self.render(rows, cols, pixels[:, 0], pixels[:, 1], keys, cell, None, show_grid)
+
+    def clear(self):
+        """スプライト・背景のキャッシュを空にする"""
+        with self._lock:
+            self._sprites.clear()
+            self._backgrounds.clear()
+
+
+class LEDRasterView:
+    """ラスター描画したLEDスクリーンを1つの PhotoImage としてキャンバスに表示するビュー
+
+    LEDCanvasView と同じインターフェースで、GUIのプレビューバックエンドを切り替えられる。
+    画像は表示範囲 (viewport) に入るセルだけを描画し、ズーム・スクロール時はその範囲を貼り直す。
+    """
+
+    def __init__(self, canvas, renderer: Optional[LEDRasterRenderer] = None):
+        self.canvas = canvas
+        self.renderer = renderer if renderer is not None else shared_raster_renderer
+        self.geometry: Optional[Tuple[int, int, int]] = None
+        self.state = np.zeros((0, 0), dtype=np.int64)
+        self.highlight_cell: Optional[Tuple[int, int]] = None
+        self.image_item = None
+        self.photo = None
+        self.viewport: Optional[Tuple[float, float, float, float]] = None
+        self.window: Optional[Tuple[int, int, int, int]] = None  # 描画中のセル範囲 (row0, row1, col0, col1)
+        self.updated_items = 0  # 直前の render で変化したLED数
+
+    @property
+    def rows(self) -> int:
+        return self.state.shape[0]
+
+    @property
+    def cols(self) -> int:
+        return self.state.shape[1]
+
+    def ensure_grid(self, rows: int, cols: int, spacing: int,
+                    viewport: Optional[Tuple[float, float, float, float]] = None) -> bool:
+        """ジオメトリが変わった場合だけ画像アイテムを作り直す（作り直した場合True）
+
+        行数・列数が同じでセル間隔だけ変わった場合（ズーム）はキャッシュ済みスプライトで貼り直す。
+        viewport は変更後のセル間隔でのキャンバス座標の表示範囲。
+        """
+        if viewport is not None:
+            self.viewport = viewport
+        if self.geometry == (rows, cols, spacing):
+            return False
+        if self.geometry is not None and self.geometry[:2] == (rows, cols):
+            self.geometry = (rows, cols, spacing)
+            self._refresh()
+            return False
+
+        self.canvas.delete("all")
+        self.geometry = (rows, cols, spacing)
+        self.state = np.full((rows, cols), LED_OFF, dtype=np.int64)
+        self.highlight_cell = None
+        self.photo = None
+        self.window = None
+        self.image_item = self.canvas.create_image(0, 0, anchor="nw")
+        return True
+
+    def set_viewport(self, x0: float, y0: float, x1: float, y1: float):
+        """キャンバス座標の表示範囲を設定し、描画範囲が変わった場合だけ貼り直す"""
+        self.viewport = (x0, y0, x1, y1)
+        if self.geometry is not None and self._window() != self.window:
+            self._refresh()
+
+    def _window(self) -> Tuple[int, int, int, int]:
+        return visible_cells(self.viewport, self.geometry[2], self.rows, self.cols)
+
+    def render(self, xs: np.ndarray, ys: np.ndarray, keys: np.ndarray,
+               highlight: Optional[Tuple[int, int]] = None):
+        """点灯状態を反映（変化が無ければ画像を更新しない）"""
+        state = led_state(self.rows, self.cols, xs, ys, keys)
+        if highlight is not None and not (0 <= highlight[0] < self.cols and 0 <= highlight[1] < self.rows):
+            highlight = None
+        self.updated_items = int(np.count_nonzero(state != self.state))
+        if self.updated_items == 0 and highlight == self.highlight_cell and self.photo is not None:
+            return
+        self.state = state
+        self.highlight_cell = highlight
+        self._refresh()
+
+    def update_cells(self, xs: Sequence[int], ys: Sequence[int], keys: Sequence[int]):
+        """指定セルだけ点灯状態を書き換える（LED_OFFで消灯）"""
+        changed = 0
+        for x, y, key in zip(xs, ys, keys):
+            if 0 <= x < self.cols and 0 <= y < self.rows and self.state[y, x] != key:
+                self.state[y, x] = key
+                changed += 1
+        self.updated_items = changed
+        if changed:
+            self._refresh()
+
+    def set_highlight(self, cell: Optional[Tuple[int, int]]):
+        """ドラッグ中のハイライトを (x, y) のセルに移動（Noneで非表示）"""
+        if cell is not None and not (0 <= cell[0] < self.cols and 0 <= cell[1] < self.rows):
+            cell = None
+        if cell != self.highlight_cell:
+            self.highlight_cell = cell
+            self._refresh()
+
+    def _refresh(self):
+        """現在の状態を描画して PhotoImage に反映"""
+        from PIL import ImageTk
+
+        cell = self.geometry[2]
+        row0, row1, col0, col1 = self._window()
+        if row1 <= row0 or col1 <= col0 or cell <= 0:
+            return
+        highlight = self.highlight_cell
+        if highlight is not None:
+            highlight = (highlight[0] - col0, highlight[1] - row0)
+        image = Image.fromarray(self.renderer.render_state(self.state[row0:row1, col0:col1], cell, highlight))
+        if self.photo is not None and (self.photo.width(), self.photo.height()) == image.size:
+            self.photo.paste(image)
+        else:
+            self.photo = ImageTk.PhotoImage(image)
+            self.canvas.itemconfig(self.image_item, image=self.photo)
+        # 描画範囲の左上に画像を配置
+        self.canvas.coords(self.image_item, col0 * cell, row0 * cell)
+        self.window = (row0, row1, col0, col1)
+
+    def invalidate(self):
+        """次回の ensure_grid で画像アイテムを作り直す"""
+        self.geometry = None
+
+
+# GUI / Font2LED で共有するデフォルトのレンダラー
+shared_raster_renderer = LEDRasterRenderer()
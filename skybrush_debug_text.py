@@ -3,21 +3,33 @@ Skybrush LED Effects - Debug Text Display
 デバッグ機能付きテキスト表示スクリプト
 """
 
-import json
-import os
+from skybrush_runtime import DroneCellCache, get_show, scene_drone_positions
+
+# Font2LEDで生成したJSONファイルのパス
+# None: 環境変数 FONT2LED_JSON、または skybrush_runtime.py と同じフォルダの led_animation.json
+JSON_PATH = None
 
 # デバッグ用カウンター
 debug_counter = 0
 
-def load_data():
-    """JSONデータを読み込む"""
-    json_path = r"H:\Yuki Tsuruoka Dropbox\鶴岡悠生\Claude\0722-windous\Font2LED_Tool\led_animation.json"
-    try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading JSON: {e}")
-        return {"frames": []}
+# 座標範囲（実測値）
+X_MIN = -47.1  # 左端（列65）
+X_MAX = 47.1   # 右端（列1）
+Z_MIN = 45.7   # 上端（行10）
+Z_MAX = 58.9   # 下端（行1）
+
+def position_to_grid(position):
+    """LEDエンプティの座標 → グリッド位置 (0-64, 0-9)"""
+    x = position[0]  # X座標
+    z = position[2]  # Z座標（position[2]がZ！）
+    # X座標は左から右（180度回転を修正）
+    grid_x = 64 - int(round((X_MAX - x) / ((X_MAX - X_MIN) / 64)))
+    # Z座標は上下反転
+    grid_z = 9 - int(round((z - Z_MIN) / ((Z_MAX - Z_MIN) / 9)))
+    return grid_x, grid_z
+
+# ドローン番号 → セル番号（フォーメーションは静的なため、位置がずれない限り一度だけ計算）
+drone_cells = DroneCellCache(65, 10, position_to_grid, tolerance=(X_MAX - X_MIN) / 64 / 4)
 
 def main(frame, time_fraction, drone_index, formation_index, position, drone_count):
     """
@@ -38,36 +50,25 @@ def main(frame, time_fraction, drone_index, formation_index, position, drone_cou
     # デバッグ用：エラー時の色
     error_color = (0.0, 0.0, 0.2, 1.0)  # 薄い青
     
-    # データを読み込み
-    data = load_data()
-    frames = data.get("frames", [])
+    # データを取得（ファイルが更新された場合だけ読み込み直す）
+    show = get_show(JSON_PATH, frame)
     
-    if not frames:
+    if show is None or not show.frame_count:
         return error_color
     
     # テキストフレームを選択
-    text_index = min(int(time_fraction * len(frames)), len(frames) - 1)
-    current_frame = frames[text_index]
+    text_index = show.frame_index(time_fraction)
     
-    # LEDエンプティの座標から列と行を計算
-    x = position[0]  # X座標
-    z = position[2]  # Z座標（position[2]がZ！）
-    
-    # 座標範囲（実測値）
-    x_min = -47.1  # 左端（列65）
-    x_max = 47.1   # 右端（列1）
-    z_min = 45.7   # 上端（行10）
-    z_max = 58.9   # 下端（行1）
-    
-    # グリッド位置を計算（0-64, 0-9）
-    # X座標は左から右（180度回転を修正）
-    grid_x = 64 - int(round((x_max - x) / ((x_max - x_min) / 64)))
-    # Z座標は上下反転
-    grid_z = 9 - int(round((z - z_min) / ((z_max - z_min) / 9)))
+    # LEDエンプティの座標から計算したセル番号（初回と位置がずれた場合だけ計算）
+    # シーンの配置が取得できれば、初回に全ドローン分をまとめてキャリブレーション
+    if not drone_cells.calibrated:
+        drone_cells.calibrate(scene_drone_positions())
+    cell = drone_cells.cell(drone_index, position)
     
     # デバッグ出力
     if debug_counter == 3:
-        print(f"Grid mapping: pos({x:.1f}, {z:.1f}) -> grid({grid_x}, {grid_z})")
+        grid_x, grid_z = drone_cells.position_to_grid(position)
+        print(f"Grid mapping: pos({position[0]:.1f}, {position[2]:.1f}) -> grid({grid_x}, {grid_z})")
         debug_counter += 1
         debug_counter += 1
     
@@ -82,29 +83,15 @@ def main(frame, time_fraction, drone_index, formation_index, position, drone_cou
     #     return (1.0, 1.0, 0.0, 1.0)  # 黄色
     
     # 範囲外チェック
-    if grid_x < 0 or grid_x >= 65 or grid_z < 0 or grid_z >= 10:
+    if cell < 0:
         return (0.5, 0.0, 0.0, 1.0)  # 暗い赤でエラー表示
     
     # Font2LEDデータのマッピング
     # 65x10グリッドなのでスケーリング不要
+    # Font2LEDのY座標（上が0）をグリッドZ座標（上が0）に直接対応
     
-    # ピクセルチェック
-    for pixel in current_frame.get("pixels", []):
-        pixel_x = pixel["x"]  # 0-64
-        pixel_y = pixel["y"]  # 0-9
-        
-        # Font2LEDのY座標（上が0）をグリッドZ座標（上が0）に直接対応
-        if grid_x == pixel_x and grid_z == pixel_y:
-            # マッチしたピクセルの色を返す
-            return (
-                pixel.get("r", 1.0),
-                pixel.get("g", 1.0),
-                pixel.get("b", 1.0),
-                1.0
-            )
-    
-    # デフォルトは消灯（黒）
-    return (0.0, 0.0, 0.0, 1.0)
+    # 色配列を1回参照（該当ピクセルがなければ消灯（黒））
+    return show.cell_color(text_index, cell, (0.0, 0.0, 0.0, 1.0))
 
 # テスト関数
 def test():
@@ -8,43 +8,40 @@ Font2LEDで生成したテキストアニメーションをSkybrush LED Effects
 3. 開始フレーム: 500、継続時間: 100フレームで設定
 """
 
-import json
-import os
-import math
+from skybrush_runtime import DroneCellCache, get_show, scene_drone_positions
 
 # Font2LEDで生成したJSONファイルのパス
-JSON_PATH = r"H:\Yuki Tsuruoka Dropbox\鶴岡悠生\Claude\0722-windous\Font2LED_Tool\led_animation.json"
+# None: 環境変数 FONT2LED_JSON、または skybrush_runtime.py と同じフォルダの led_animation.json
+JSON_PATH = None
 
-# グローバル変数でデータをキャッシュ
-_cached_data = None
+# 65x10から50x13へのスケーリング
+GRID_COLS = 50
+GRID_ROWS = 13
+X_SCALE = GRID_COLS / 65.0
+Z_SCALE = GRID_ROWS / 10.0
 
-def load_font2led_data():
-    """JSONデータを読み込んでキャッシュ"""
-    global _cached_data
-    if _cached_data is None:
-        try:
-            with open(JSON_PATH, 'r', encoding='utf-8') as f:
-                _cached_data = json.load(f)
-        except Exception as e:
-            print(f"Error loading JSON: {e}")
-            _cached_data = {"frames": []}
-    return _cached_data
+def map_pixel(x, y):
+    """元の座標（65x10グリッド、上が0）→ 50x13グリッドの (列, 行)（下が0）"""
+    orig_z = 9 - y  # Y座標反転
+    return int(round(x * X_SCALE)), int(round(orig_z * Z_SCALE))
 
-def get_text_frame(time_fraction):
-    """時間比率から適切なテキストフレームを取得"""
-    data = load_font2led_data()
-    frames = data.get("frames", [])
-    
-    if not frames:
+def position_to_grid(position):
+    """ドローンの位置 → 50x13グリッドの (列, 行)（10x65グリッドを想定、実際は50x13にマッピング）"""
+    # 位置の正規化（-73.5 ~ 73.5 → 0 ~ 49）
+    grid_x = int((position[0] + 73.5) / 3.0)
+    # 位置の正規化（11.16 ~ 47.16 → 0 ~ 12）
+    grid_z = int((position[2] - 11.16) / 3.0)
+    return grid_x, grid_z
+
+# ドローン番号 → セル番号（フォーメーションは静的なため、位置がずれない限り一度だけ計算）
+drone_cells = DroneCellCache(GRID_COLS, GRID_ROWS, position_to_grid, tolerance=0.75)
+
+def load_font2led_data(frame=None):
+    """50x13グリッドに移したFont2LEDデータ（ファイルが更新された場合だけ読み込み直す）"""
+    show = get_show(JSON_PATH, frame)
+    if show is None:
         return None
-    
-    # 時間比率に基づいてフレームを選択
-    # 5つのテキストを100フレームに均等配分（各20フレーム）
-    frame_index = int(time_fraction * len(frames))
-    if frame_index >= len(frames):
-        frame_index = len(frames) - 1
-    
-    return frames[frame_index]
+    return show.remapped(GRID_COLS, GRID_ROWS, map_pixel)
 
 def font2led_effect(frame, time_fraction, drone_index, formation_index, position, drone_count):
     """
@@ -66,45 +63,21 @@ def font2led_effect(frame, time_fraction, drone_index, formation_index, position
     default_color = (0.0, 0.0, 0.0, 1.0)
     
     # テキストフレームを取得
-    text_frame = get_text_frame(time_fraction)
-    if not text_frame:
+    # 時間比率に基づいてフレームを選択（5つのテキストを100フレームに均等配分（各20フレーム））
+    show = load_font2led_data(frame)
+    if show is None or not show.frame_count:
         return default_color
+    text_index = show.frame_index(time_fraction)
     
-    # ドローンの位置をグリッド座標に変換
-    # 10x65グリッドを想定（実際は50x13にマッピング）
-    # 位置の正規化（-73.5 ~ 73.5 → 0 ~ 49）
-    grid_x = int((position[0] + 73.5) / 3.0)
-    # 位置の正規化（11.16 ~ 47.16 → 0 ~ 12）
-    grid_z = int((position[2] - 11.16) / 3.0)
-    
-    # 65x10から50x13へのスケーリング
-    x_scale = 50 / 65.0
-    z_scale = 13 / 10.0
-    
-    # このドローンが点灯すべきかチェック
-    pixels = text_frame.get("pixels", [])
-    
-    for pixel in pixels:
-        # 元の座標（65x10グリッド）
-        orig_x = pixel["x"]
-        orig_z = 9 - pixel["y"]  # Y座標反転
-        
-        # スケーリングして50x13グリッドに変換
-        mapped_x = int(round(orig_x * x_scale))
-        mapped_z = int(round(orig_z * z_scale))
-        
-        # 位置が一致するか確認（許容誤差±1）
-        if abs(grid_x - mapped_x) <= 0 and abs(grid_z - mapped_z) <= 0:
-            # このピクセルの色を返す
-            return (
-                pixel["r"],
-                pixel["g"],
-                pixel["b"],
-                1.0  # アルファは常に1.0
-            )
+    # ドローンの位置をグリッドのセル番号に変換（初回と位置がずれた場合だけ計算）
+    # シーンの配置が取得できれば、初回に全ドローン分をまとめてキャリブレーション（行は下から数える）
+    if not drone_cells.calibrated:
+        drone_cells.calibrate(scene_drone_positions(), rows_from_bottom=True)
+    cell = drone_cells.cell(drone_index, position)
     
+    # このドローンが点灯すべきかチェック（50x13グリッドに移した色配列を1回参照）
     # 該当するピクセルがない場合は黒
-    return default_color
+    return show.cell_color(text_index, cell, default_color)
 
 # Skybrush用のメイン関数
 def main(frame, time_fraction, drone_index, formation_index, position, drone_count):
@@ -118,7 +91,7 @@ if __name__ == "__main__":
     
     # データ読み込みテスト
     data = load_font2led_data()
-    print(f"Loaded {len(data.get('frames', []))} frames")
+    print(f"Loaded {data.frame_count if data is not None else 0} frames")
     
     # 色計算テスト
     test_positions = [
@@ -2,10 +2,19 @@
 Font2LED - 小津ちゃん LED表示スクリプト（完全版）
 Skybrush LED Effects用（520-550フレーム）
 JSONデータをBlenderテキストエディタに貼り付けて使用
+
+grid_calibration.py を読み込める場合は、初回の呼び出し時にシーンの Drones コレクションの配置から
+全ドローンのセル番号をまとめて求める（読み込めない・配置が65×10のグリッドと合わない場合は座標範囲による変換）。
 """
 
 import json
 
+try:
+    import bpy
+    from grid_calibration import calibrate_grid
+except ImportError:
+    bpy = calibrate_grid = None
+
 # 実際のJSONデータから抽出したピクセル情報を埋め込み
 OZUCHAN_PIXELS = [
     {"x": 7, "y": 1}, {"x": 14, "y": 1}, {"x": 15, "y": 1}, {"x": 22, "y": 1}, {"x": 23, "y": 1}, {"x": 32, "y": 1}, {"x": 57, "y": 1},
@@ -19,19 +28,47 @@ OZUCHAN_PIXELS = [
     {"x": 9, "y": 9}, {"x": 10, "y": 9}, {"x": 57, "y": 9}
 ]
 
-def main(frame, time_fraction, drone_index, formation_index, position, drone_count):
-    """
-    Skybrush LED Effects メイン関数
-    10×65 LEDスクリーン用（標準サイズ）
-    """
-    
-    # デフォルト色（消灯）
-    default_color = (0.0, 0.0, 0.0, 1.0)
-    
-    # ドローンの位置を取得
+# 点灯ピクセルのセル番号 (y * 65 + x) の集合（読み込み時に一度だけ作成）
+OZUCHAN_CELLS = frozenset(pixel["y"] * 65 + pixel["x"] for pixel in OZUCHAN_PIXELS)
+
+# ドローン番号 → (セル番号, x, z)。フォーメーションは静的なため初回の呼び出し時に計算して保持し、
+# 位置が POSITION_TOLERANCE を超えてずれた場合だけ計算し直す（グリッド外はセル番号 -1）
+DRONE_CELLS = {}
+POSITION_TOLERANCE = 0.75  # 3.0間隔の1/4
+
+# シーンの配置から推定した位置 → グリッドの変換（None は座標範囲による変換）
+GRID_TRANSFORM = None
+CALIBRATED = False
+
+def calibrate_drone_cells(collection_name="Drones"):
+    """シーンのドローン配置から全ドローンのセル番号を DRONE_CELLS にまとめて求める（1回だけ試す）"""
+    global GRID_TRANSFORM, CALIBRATED
+    CALIBRATED = True
+    if calibrate_grid is None or bpy.data.collections.get(collection_name) is None:
+        return
+    positions = [tuple(obj.matrix_world.translation) for obj in bpy.data.collections[collection_name].objects]
+    if not positions:
+        return
+    calibration = calibrate_grid(positions, 65, 10)
+    # 対応付いたドローンが少なければ配置が65×10のグリッドでないとみなす
+    if (calibration.cells >= 0).sum() < min(len(positions), 650) * 0.9:
+        print("Grid calibration skipped")
+        return
+    GRID_TRANSFORM = calibration.transform
+    for index, (cell, position) in enumerate(zip(calibration.cells.tolist(), positions)):
+        DRONE_CELLS[index] = (cell, position[0], position[2])
+
+def drone_cell(drone_index, position):
+    """ドローンの位置をグリッドのセル番号に変換して DRONE_CELLS に保持"""
     x = position[0]
     z = position[2]
     
+    if GRID_TRANSFORM is not None:
+        col, row = GRID_TRANSFORM.grid_position(position)
+        cell = row * 65 + col if 0 <= col < 65 and 0 <= row < 10 else -1
+        DRONE_CELLS[drone_index] = (cell, x, z)
+        return cell
+    
     # LEDスクリーンの座標範囲（10×65の場合）
     # X: -97.5 ~ 97.5 (65列 × 3.0間隔)
     # Z: 0 ~ 27 (10行 × 3.0間隔)
@@ -41,13 +78,32 @@ def main(frame, time_fraction, drone_index, formation_index, position, drone_cou
     row = 9 - int(z / 3.0)  # 0-9（上下反転）
     
     # 範囲チェック
-    if not (0 <= col < 65 and 0 <= row < 10):
-        return default_color
-    
-    # 「小津ちゃん」のピクセルをチェック
-    for pixel in OZUCHAN_PIXELS:
-        if pixel["x"] == col and pixel["y"] == row:
-            # 赤色で表示
-            return (1.0, 0.0, 0.0, 1.0)
+    cell = row * 65 + col if 0 <= col < 65 and 0 <= row < 10 else -1
+    DRONE_CELLS[drone_index] = (cell, x, z)
+    return cell
+
+def main(frame, time_fraction, drone_index, formation_index, position, drone_count):
+    """
+    Skybrush LED Effects メイン関数
+    10×65 LEDスクリーン用（標準サイズ）
+    """
+    
+    # デフォルト色（消灯）
+    default_color = (0.0, 0.0, 0.0, 1.0)
+    
+    # ドローンのセル番号（初回と位置がずれた場合だけ座標から計算）
+    if not CALIBRATED:
+        calibrate_drone_cells()
+    cached = DRONE_CELLS.get(drone_index)
+    if (cached is None or abs(position[0] - cached[1]) > POSITION_TOLERANCE
+            or abs(position[2] - cached[2]) > POSITION_TOLERANCE):
+        cell = drone_cell(drone_index, position)
+    else:
+        cell = cached[0]
+    
+    # 「小津ちゃん」のピクセルをチェック（範囲外のセル番号 -1 は集合に含まれない）
+    if cell in OZUCHAN_CELLS:
+        # 赤色で表示
+        return (1.0, 0.0, 0.0, 1.0)
     
     return default_color
\ No newline at end of file
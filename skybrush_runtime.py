@@ -0,0 +1,265 @@
+"""
+Skybrush LED Effects - Font2LED ランタイム
+Skybrushスクリプトから import して使う共通モジュール。
+
+Font2LEDのJSONエクスポートを一度だけ読み込み、フレームごとに (rows, cols) の
+密な色配列に変換して保持する。ファイルの更新時刻が変わった場合だけ読み込み直す。
+各ドローンの色は配列を1回参照するだけで求まる（ピクセル一覧の走査なし）。
+ドローンの位置 → セル番号の変換は DroneCellCache でドローンごとに一度だけ行う。
+grid_calibration.py を読み込める場合は、シーンのドローン配置から全ドローンのセル番号をまとめて推定する
+（省略可。読み込めない場合は各スクリプトの座標による変換を使う）。
+
+JSONのパス（優先順）:
+1. get_show(path) に渡したパス
+2. 環境変数 FONT2LED_JSON
+3. このモジュールと同じフォルダの led_animation.json
+"""
+
+import json
+import os
+
+import numpy as np
+
+try:
+    from grid_calibration import calibrate_grid, describe
+except ImportError:
+    calibrate_grid = describe = None
+
+# パスを指定しない場合に読み込むJSON
+JSON_PATH_ENV = "FONT2LED_JSON"
+DEFAULT_JSON_NAME = "led_animation.json"
+# キャリブレーションで対応付いたドローンがこの割合未満なら配置が想定と違うとみなす
+CALIBRATION_MIN_MAPPED = 0.9
+
+
+def resolve_json_path(path=None):
+    """読み込むJSONのパス（引数 → 環境変数 → モジュールと同じフォルダ）"""
+    if path:
+        return path
+    env_path = os.environ.get(JSON_PATH_ENV)
+    if env_path:
+        return env_path
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), DEFAULT_JSON_NAME)
+
+
+class Font2LEDShow:
+    """読み込んだJSONエクスポート
+
+    colors : (frames, rows, cols, 4) float32。消灯セルは黒 (0, 0, 0, 1)
+    lit    : (frames, rows, cols) bool。点灯セル
+    pixels : フレームごとの (x, y, (r, g, b, 1.0)) のリスト（JSONの順）
+    y は行番号（上が0）。グリッド外のピクセルは colors / lit には入らない。
+    """
+
+    def __init__(self, path, mtime_ns, rows, cols, texts, pixels):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.rows = rows
+        self.cols = cols
+        self.texts = texts
+        self.pixels = pixels
+        self.colors, self.lit = self._dense(rows, cols, pixels)
+        # 1回の参照で色を返すための平坦化したテーブル（消灯セルは None）
+        self._cells = [self._flatten(self.colors[i], self.lit[i]) for i in range(len(pixels))]
+        self._remapped = {}
+
+    @staticmethod
+    def _dense(rows, cols, pixels):
+        colors = np.zeros((len(pixels), rows, cols, 4), dtype=np.float32)
+        colors[..., 3] = 1.0
+        lit = np.zeros((len(pixels), rows, cols), dtype=bool)
+        for index, frame_pixels in enumerate(pixels):
+            if not frame_pixels:
+                continue
+            xs = np.array([x for x, _, _ in frame_pixels], dtype=np.int64)
+            ys = np.array([y for _, y, _ in frame_pixels], dtype=np.int64)
+            rgba = np.array([color for _, _, color in frame_pixels], dtype=np.float32)
+            inside = (xs >= 0) & (xs < cols) & (ys >= 0) & (ys < rows)
+            # 同じセルに複数のピクセルがある場合は先頭を優先（逆順に書き込む）
+            xs, ys, rgba = xs[inside][::-1], ys[inside][::-1], rgba[inside][::-1]
+            colors[index, ys, xs] = rgba
+            lit[index, ys, xs] = True
+        return colors, lit
+
+    @staticmethod
+    def _flatten(colors, lit):
+        return [tuple(color) if on else None
+                for color, on in zip(colors.reshape(-1, 4).tolist(), lit.ravel().tolist())]
+
+    @property
+    def frame_count(self):
+        return len(self.pixels)
+
+    def frame_index(self, time_fraction):
+        """進行度 (0.0-1.0) に対応するフレーム番号（フレームを均等に割り当て）"""
+        return min(max(int(time_fraction * self.frame_count), 0), self.frame_count - 1)
+
+    def color_at(self, index, col, row, default=None):
+        """フレーム index のセル (col, row) の色 (r, g, b, a)。消灯・範囲外は default"""
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            color = self._cells[index][row * self.cols + col]
+            if color is not None:
+                return color
+        return default
+
+    def cell_color(self, index, cell, default=None):
+        """フレーム index のセル番号 cell (row * cols + col) の色。消灯・グリッド外 (-1) は default"""
+        if cell >= 0:
+            color = self._cells[index][cell]
+            if color is not None:
+                return color
+        return default
+
+    def remapped(self, cols, rows, map_pixel):
+        """各ピクセルを map_pixel(x, y) -> (col, row) で別のグリッドに移した表示（結果はキャッシュ）
+
+        同じセルに複数のピクセルが移る場合はJSONで先のピクセルを優先する。
+        """
+        key = (cols, rows, map_pixel)
+        show = self._remapped.get(key)
+        if show is None:
+            pixels = [[map_pixel(x, y) + (color,) for x, y, color in frame_pixels]
+                      for frame_pixels in self.pixels]
+            show = Font2LEDShow(self.path, self.mtime_ns, rows, cols, self.texts, pixels)
+            self._remapped[key] = show
+        return show
+
+
+def load_show(path, mtime_ns=None):
+    """JSONエクスポートを読み込んで Font2LEDShow を作成"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return show_from_data(data, path, mtime_ns)
+
+
+def show_from_data(data, path=None, mtime_ns=None):
+    """JSONエクスポートの内容（dict）から Font2LEDShow を作成（スクリプトに埋め込んだデータ用）"""
+    metadata = data.get("metadata", {})
+    frames = data.get("frames", [])
+    pixels = [
+        [(int(p["x"]), int(p["y"]), (float(p.get("r", 1.0)), float(p.get("g", 1.0)),
+                                     float(p.get("b", 1.0)), 1.0))
+         for p in frame.get("pixels", [])]
+        for frame in frames
+    ]
+    cols = int(metadata.get("grid_width") or max([x + 1 for f in pixels for x, _, _ in f] or [0]))
+    rows = int(metadata.get("grid_height") or max([y + 1 for f in pixels for _, y, _ in f] or [0]))
+    texts = [frame.get("text", "") for frame in frames]
+    return Font2LEDShow(path, mtime_ns, rows, cols, texts, pixels)
+
+
+class ShowCache:
+    """JSONエクスポートのキャッシュ（ファイルの更新時刻が変わった場合だけ読み込み直す）
+
+    更新時刻の確認はシーンのフレーム番号が変わったときだけ行うため、
+    同じフレームの全ドローン分の呼び出しではファイルにアクセスしない。
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.show = None
+        self.checked_frame = None
+        self.error = None
+
+    def get(self, frame=None):
+        """読み込み済みの Font2LEDShow（読み込めない場合はNone）"""
+        if frame is not None and frame == self.checked_frame:
+            return self.show
+        self.checked_frame = frame
+
+        path = resolve_json_path(self.path)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            if self.show is None or self.show.path != path or self.show.mtime_ns != mtime_ns:
+                self.show = load_show(path, mtime_ns)
+            self.error = None
+        except Exception as e:
+            # 同じエラーは1回だけ表示
+            if str(e) != self.error:
+                print(f"Error loading JSON: {e}")
+            self.error = str(e)
+            self.show = None
+        return self.show
+
+
+class DroneCellCache:
+    """ドローン番号 → グリッドのセル番号 (row * cols + col) のキャッシュ
+
+    フォーメーションは静的なため、position_to_grid(position) -> (col, row) による変換は
+    ドローンごとの初回と、位置が tolerance を超えてずれた場合だけ行う。
+    calibrate() で実際の配置から推定した変換に置き換え、全ドローン分をまとめて求めることもできる。
+    グリッド外のドローンのセル番号は -1。
+    """
+
+    def __init__(self, cols, rows, position_to_grid, tolerance):
+        self.cols = cols
+        self.rows = rows
+        self.position_to_grid = position_to_grid
+        self.tolerance = tolerance
+        self.cells = {}  # drone_index → (セル番号, x, z)
+        self.calibrated = False
+
+    def cell(self, drone_index, position):
+        """ドローンのセル番号（変換済みで位置がずれていなければ辞書を1回参照するだけ）"""
+        cached = self.cells.get(drone_index)
+        if (cached is None or abs(position[0] - cached[1]) > self.tolerance
+                or abs(position[2] - cached[2]) > self.tolerance):
+            col, row = self.position_to_grid(position)
+            cell = row * self.cols + col if 0 <= col < self.cols and 0 <= row < self.rows else -1
+            cached = self.cells[drone_index] = (cell, position[0], position[2])
+        return cached[0]
+
+    def calibrate(self, positions, rows_from_bottom=False):
+        """ドローンの位置の一覧 (drone_index 順) からグリッドの変換を推定し、全ドローンのセル番号を求める
+
+        rows_from_bottom=True の場合は行を下から数える。
+        対応付いたドローンが少ない（配置が cols × rows のグリッドでない）場合は position_to_grid をそのまま使い、
+        grid_calibration.py を読み込めない場合も何もせず None を返す。1回だけ試す（calibrated を True にする）。
+        """
+        self.calibrated = True
+        if calibrate_grid is None or not len(positions):
+            return None
+        calibration = calibrate_grid(positions, self.cols, self.rows)
+        mapped = int((calibration.cells >= 0).sum())
+        if mapped < min(len(positions), self.cols * self.rows) * CALIBRATION_MIN_MAPPED:
+            print(f"Grid calibration skipped ({describe(calibration)})")
+            return None
+
+        transform = calibration.transform.rows_from_bottom() if rows_from_bottom else calibration.transform
+        self.position_to_grid = transform.grid_position
+        cells = calibration.cells
+        if rows_from_bottom:
+            rows = cells // self.cols
+            cells = np.where(cells >= 0, (self.rows - 1 - rows) * self.cols + cells % self.cols, -1)
+        self.cells = {index: (cell, position[0], position[2])
+                      for index, (cell, position) in enumerate(zip(cells.tolist(), positions))}
+        print(f"Grid calibration: {describe(calibration)}")
+        return calibration
+
+    def clear(self):
+        """変換結果をすべて破棄"""
+        self.cells.clear()
+
+
+def scene_drone_positions(collection_name="Drones"):
+    """Blenderのシーンのドローンの位置 (x, y, z) の一覧（drone_index 順）。取得できない場合は空"""
+    try:
+        import bpy
+    except ImportError:
+        return []
+    collection = bpy.data.collections.get(collection_name)
+    if collection is None:
+        return []
+    return [tuple(obj.matrix_world.translation) for obj in collection.objects]
+
+
+# パスごとの共有キャッシュ
+_caches = {}
+
+
+def get_show(path=None, frame=None):
+    """path のJSONエクスポート（モジュール内で共有するキャッシュから取得）"""
+    cache = _caches.get(path)
+    if cache is None:
+        cache = _caches[path] = ShowCache(path)
+    return cache.get(frame)
@@ -3,33 +3,61 @@ Skybrush LED Effects - Simple Text Display
 シンプルなテキスト表示スクリプト（Font2LEDデータ使用）
 """
 
-import json
-import os
+from skybrush_runtime import DroneCellCache, get_show, scene_drone_positions, show_from_data
 
 # JSONデータを直接埋め込む（外部ファイル依存を避ける）
 # Font2LEDで生成したデータをここにペースト
 TEXT_DATA = None
 
-def load_embedded_data():
-    """埋め込みデータまたは外部JSONを読み込む"""
-    global TEXT_DATA
+# 外部JSONファイルのパス
+# None: 環境変数 FONT2LED_JSON、または skybrush_runtime.py と同じフォルダの led_animation.json
+JSON_PATH = None
+
+# 65x10 → 50x13 のマッピング
+# Font2LEDは65x10でデータを生成しているので変換が必要
+GRID_COLS = 50
+GRID_ROWS = 13
+SCALE_X = GRID_COLS / 65.0  # 0.769
+SCALE_Z = GRID_ROWS / 10.0  # 1.3
+
+# 埋め込みデータから作成した表示（初回のみ作成）
+_embedded_show = None
+
+def map_pixel(x, y):
+    """元の座標（65x10グリッド、上が0）→ 50x13グリッドの (列, 行)（下が0）"""
+    # Y座標を反転してZ座標に（Font2LEDは上が0、Blenderは下が0）
+    orig_z = 9 - y
+    return int(round(x * SCALE_X)), int(round(orig_z * SCALE_Z))
+
+def position_to_grid(position):
+    """ドローンの位置 → グリッドインデックス（0-49, 0-12）
+
+    実際のグリッド座標（50x13）
+    X範囲: -73.5 ~ 73.5 (3.0間隔)
+    Z範囲: 11.164 ~ 47.164 (3.0間隔)
+    """
+    grid_x = int(round((position[0] + 73.5) / 3.0))
+    grid_z = int(round((position[2] - 11.164) / 3.0))
+    return grid_x, grid_z
+
+# ドローン番号 → セル番号（フォーメーションは静的なため、位置がずれない限り一度だけ計算）
+drone_cells = DroneCellCache(GRID_COLS, GRID_ROWS, position_to_grid, tolerance=0.75)
+
+def load_embedded_data(frame=None):
+    """埋め込みデータまたは外部JSONを50x13グリッドに移した表示"""
+    global _embedded_show
     
-    if TEXT_DATA is None:
-        # 外部JSONファイルから読み込み
-        json_path = r"H:\Yuki Tsuruoka Dropbox\鶴岡悠生\Claude\0722-windous\Font2LED_Tool\led_animation.json"
-        try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                TEXT_DATA = json.load(f)
-        except:
-            # フォールバック：基本的なテストパターン
-            TEXT_DATA = {
-                "frames": [{
-                    "text": "TEST",
-                    "pixels": []
-                }]
-            }
+    if TEXT_DATA is not None:
+        if _embedded_show is None:
+            _embedded_show = show_from_data(TEXT_DATA)
+        show = _embedded_show
+    else:
+        # 外部JSONファイルから読み込み（ファイルが更新された場合だけ読み込み直す）
+        show = get_show(JSON_PATH, frame)
     
-    return TEXT_DATA
+    if show is None:
+        return None
+    return show.remapped(GRID_COLS, GRID_ROWS, map_pixel)
 
 def main(frame, time_fraction, drone_index, formation_index, position, drone_count):
     """
@@ -40,58 +68,20 @@ def main(frame, time_fraction, drone_index, formation_index, position, drone_cou
     """
     
     # データを読み込み
-    data = load_embedded_data()
-    frames = data.get("frames", [])
+    show = load_embedded_data(frame)
     
-    if not frames:
+    if show is None or not show.frame_count:
         return (0.0, 0.0, 0.0, 1.0)
     
     # どのテキストを表示するか決定
     # time_fraction: 0.0-1.0を5分割
-    text_index = min(int(time_fraction * len(frames)), len(frames) - 1)
-    current_frame = frames[text_index]
-    
-    # 実際のグリッド座標（50x13）
-    # X範囲: -73.5 ~ 73.5 (3.0間隔)
-    # Z範囲: 11.164 ~ 47.164 (3.0間隔)
-    x = position[0]
-    z = position[2]
-    
-    # グリッドインデックスに変換（0-49, 0-12）
-    grid_x = int(round((x + 73.5) / 3.0))
-    grid_z = int(round((z - 11.164) / 3.0))
-    
-    # 範囲チェック
-    if grid_x < 0 or grid_x >= 50 or grid_z < 0 or grid_z >= 13:
-        return (0.0, 0.0, 0.0, 1.0)
-    
-    # 65x10 → 50x13 のマッピング
-    # Font2LEDは65x10でデータを生成しているので変換が必要
-    scale_x = 50.0 / 65.0  # 0.769
-    scale_z = 13.0 / 10.0  # 1.3
+    text_index = show.frame_index(time_fraction)
     
-    # ピクセルデータをチェック
-    for pixel in current_frame.get("pixels", []):
-        # 元の座標（65x10グリッド）
-        orig_x = pixel["x"]
-        orig_y = pixel["y"]
-        
-        # Y座標を反転してZ座標に（Font2LEDは上が0、Blenderは下が0）
-        orig_z = 9 - orig_y
-        
-        # 50x13グリッドにスケーリング
-        target_x = int(round(orig_x * scale_x))
-        target_z = int(round(orig_z * scale_z))
-        
-        # 一致チェック
-        if grid_x == target_x and grid_z == target_z:
-            # この位置のドローンを点灯
-            return (
-                pixel.get("r", 1.0),
-                pixel.get("g", 1.0),
-                pixel.get("b", 1.0),
-                1.0
-            )
+    # グリッドのセル番号に変換（初回と位置がずれた場合だけ計算、範囲外は -1）
+    # シーンの配置が取得できれば、初回に全ドローン分をまとめてキャリブレーション（行は下から数える）
+    if not drone_cells.calibrated:
+        drone_cells.calibrate(scene_drone_positions(), rows_from_bottom=True)
+    cell = drone_cells.cell(drone_index, position)
     
-    # 該当なしは消灯
-    return (0.0, 0.0, 0.0, 1.0)
\ No newline at end of file
+    # 50x13グリッドに移した色配列を1回参照（範囲外・該当なしは消灯）
+    return show.cell_color(text_index, cell, (0.0, 0.0, 0.0, 1.0))
\ No newline at end of file